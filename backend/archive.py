@@ -0,0 +1,65 @@
+import logging
+import zlib
+
+import bson
+from pymongo.errors import BulkWriteError
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_STATUSES = ['delivered', 'cancelled']
+# kept uncompressed so lookups, keyset paging and rollups can use them
+ARCHIVE_KEYS = ('order_number', 'user_id', 'delivery_partner_id', 'status', 'total', 'created_at')
+
+
+def pack(o: dict, archived_at: str) -> dict:
+    a = {k: o.get(k) for k in ARCHIVE_KEYS}
+    a.update({'_id': o['_id'], 'month': (o.get('created_at') or '')[:7], 'archived_at': archived_at,
+              'data': bson.Binary(zlib.compress(bson.encode(o), 6))})
+    return a
+
+
+def unpack(a: dict) -> dict:
+    o = bson.decode(zlib.decompress(a['data']))
+    o['archived'] = True
+    return o
+
+
+def duplicate_id(err: dict) -> bool:
+    if err.get('code') != 11000:
+        return False
+    if 'keyPattern' in err:
+        return list(err['keyPattern']) == ['_id']
+    # older servers only name the index in the message; some name nothing
+    msg = err.get('errmsg', '')
+    return ' index: _id_ ' in msg or ' index: ' not in msg
+
+
+async def archive_orders(orders, archive, cutoff: str, now: str, batch: int = 500) -> int:
+    # Moves final-status orders created before `cutoff` into the archive.
+    # Copies first, then deletes only orders that are confirmed archived and
+    # whose status is still final; anything that changed in between is
+    # dropped from the archive again. A duplicate _id means an earlier run
+    # already copied the order. Safe to re-run after a crash and to run on
+    # several workers at once.
+    q = {'status': {'$in': ARCHIVE_STATUSES}, 'created_at': {'$lt': cutoff}}
+    moved = 0
+    while True:
+        docs = await orders.find(q).sort('created_at', 1).limit(batch).to_list(batch)
+        if not docs:
+            return moved
+        ids = [o['_id'] for o in docs]
+        failed = []
+        try:
+            await archive.insert_many([pack(o, now) for o in docs], ordered=False)
+        except BulkWriteError as e:
+            failed = [err for err in e.details.get('writeErrors', []) if not duplicate_id(err)]
+        copied = [a['_id'] async for a in archive.find({'_id': {'$in': ids}}, {'_id': 1})]
+        r = await orders.delete_many({'_id': {'$in': copied}, 'status': {'$in': ARCHIVE_STATUSES}})
+        if r.deleted_count < len(copied):
+            kept = [o['_id'] async for o in orders.find({'_id': {'$in': copied}}, {'_id': 1})]
+            await archive.delete_many({'_id': {'$in': kept}})
+        moved += r.deleted_count
+        if failed:
+            raise BulkWriteError({'writeErrors': failed, 'nInserted': len(copied)})
+        if len(docs) < batch:
+            return moved
@@ -0,0 +1,70 @@
+"""Concurrent cart adds must not lose increments.
+
+Clears the cart, fires N parallel /cart/add calls (split across a few lines,
+as if from several tabs) against a running API, then checks the final
+quantities add up.
+
+    python bench/cart_race.py --base-url http://localhost:8001 --requests 200
+
+This is a manual check against a live API and Mongo. tests/test_cart.py is
+the automated one, and also covers the upsert collision that add_cart
+retries as an $inc, which this script only reaches for a user that has never
+had a cart.
+"""
+import argparse
+import asyncio
+import sys
+import time
+
+import httpx
+
+
+async def main(args):
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=30,
+                                 limits=httpx.Limits(max_connections=args.concurrency)) as http:
+        r = await http.post('/api/auth/login', json={'email': args.email, 'password': args.password})
+        r.raise_for_status()
+        headers = {'Authorization': f"Bearer {r.json()['token']}"}
+        await http.delete('/api/cart/clear', headers=headers)
+
+        lines = [(f'race-{i}', 'g250') for i in range(args.lines)]
+        expected = {line: 0 for line in lines}
+        sem = asyncio.Semaphore(args.concurrency)
+
+        async def add(n):
+            pid, weight = lines[n % len(lines)]
+            async with sem:
+                r = await http.post('/api/cart/add', headers=headers,
+                                    json={'product_id': pid, 'weight': weight, 'quantity': 1})
+                r.raise_for_status()
+
+        for n in range(args.requests):
+            expected[lines[n % len(lines)]] += 1
+        started = time.perf_counter()
+        await asyncio.gather(*(add(n) for n in range(args.requests)))
+        elapsed = time.perf_counter() - started
+
+        cart = (await http.get('/api/cart', headers=headers)).json()
+        await http.delete('/api/cart/clear', headers=headers)
+
+    got = {(i['product_id'], i['weight']): i['quantity'] for i in cart.get('items', [])}
+    lost = {k: v - got.get(k, 0) for k, v in expected.items() if got.get(k, 0) != v}
+    dupes = len(cart.get('items', [])) - len(got)
+    print(f"{args.requests} adds in {elapsed:.2f}s ({args.requests / elapsed:.0f}/s), "
+          f"{len(got)} lines, duplicate lines: {dupes}")
+    if lost or dupes:
+        print(f"FAIL: lost increments {lost}")
+        return 1
+    print("OK: no lost increments")
+    return 0
+
+
+if __name__ == '__main__':
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--base-url', default='http://localhost:8001')
+    ap.add_argument('--email', default='admin@rasraj.com')
+    ap.add_argument('--password', default='admin123')
+    ap.add_argument('--requests', type=int, default=200)
+    ap.add_argument('--lines', type=int, default=3)
+    ap.add_argument('--concurrency', type=int, default=50)
+    sys.exit(asyncio.run(main(ap.parse_args())))
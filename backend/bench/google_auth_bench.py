@@ -0,0 +1,93 @@
+"""Google sign-in: per-request HTTP client vs. the shared pooled client.
+
+Starts a fake OAuth session-data server in-process, then times session lookups
+made with a fresh httpx.AsyncClient per call (the old google_auth) against
+lookups through one keep-alive client (the new one). With --api it also drives
+POST /api/auth/google on a running API started with
+GOOGLE_SESSION_URL=http://127.0.0.1:<port>/auth/v1/env/oauth/session-data.
+
+    python bench/google_auth_bench.py --calls 500 --latency-ms 20
+"""
+import argparse
+import asyncio
+import time
+
+import httpx
+import uvicorn
+from fastapi import FastAPI, Header
+
+PATH = '/auth/v1/env/oauth/session-data'
+
+
+def fake_oauth(latency_ms: float) -> FastAPI:
+    app = FastAPI()
+
+    @app.get(PATH)
+    async def session_data(x_session_id: str = Header(...)):
+        await asyncio.sleep(latency_ms / 1000)
+        n = x_session_id.rsplit('-', 1)[-1]
+        return {'id': f'g{n}', 'email': f'bench{n}@example.com', 'name': f'Bench {n}', 'picture': None}
+
+    return app
+
+
+def report(label, samples, elapsed):
+    s = sorted(samples)
+    print(f"{label:<22} {len(s) / elapsed:8.1f}/s  p50 {s[len(s) // 2] * 1e3:7.2f} ms  "
+          f"p99 {s[int(len(s) * .99)] * 1e3:7.2f} ms")
+
+
+async def run(calls, concurrency, fn):
+    sem = asyncio.Semaphore(concurrency)
+    samples = []
+
+    async def one(i):
+        async with sem:
+            t = time.perf_counter()
+            await fn(i)
+            samples.append(time.perf_counter() - t)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(calls)))
+    return samples, time.perf_counter() - started
+
+
+async def main(args):
+    server = uvicorn.Server(uvicorn.Config(fake_oauth(args.latency_ms), port=args.port, log_level='warning'))
+    task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.05)
+    url = f'http://127.0.0.1:{args.port}{PATH}'
+
+    async def fresh(i):
+        async with httpx.AsyncClient() as http:
+            (await http.get(url, headers={'X-Session-ID': f'sess-{i}'})).raise_for_status()
+
+    shared_client = httpx.AsyncClient(limits=httpx.Limits(max_connections=50, max_keepalive_connections=20))
+
+    async def shared(i):
+        (await shared_client.get(url, headers={'X-Session-ID': f'sess-{i}'})).raise_for_status()
+
+    report('fresh client per call', *await run(args.calls, args.concurrency, fresh))
+    report('shared pooled client', *await run(args.calls, args.concurrency, shared))
+    await shared_client.aclose()
+
+    if args.api:
+        async with httpx.AsyncClient(base_url=args.api, timeout=30) as api:
+            async def sign_in(i):
+                # every session is submitted twice, as a double-tap would
+                (await api.post('/api/auth/google', json={'session_id': f'sess-{i // 2}'})).raise_for_status()
+            report('POST /api/auth/google', *await run(args.calls, args.concurrency, sign_in))
+
+    server.should_exit = True
+    await task
+
+
+if __name__ == '__main__':
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--calls', type=int, default=300)
+    ap.add_argument('--concurrency', type=int, default=20)
+    ap.add_argument('--latency-ms', type=float, default=20)
+    ap.add_argument('--port', type=int, default=9200)
+    ap.add_argument('--api', help='base URL of a running API to drive /api/auth/google')
+    asyncio.run(main(ap.parse_args()))
@@ -0,0 +1,363 @@
+"""Async load test for the API with per-route latency and baseline checks.
+
+Virtual users pick a role from the traffic mix and loop through its flow
+until the run ends:
+
+    customer   browse, search, product pages, cart churn, checkout, order history
+    admin      dashboard, order list, status updates
+    delivery   assigned orders, status updates
+
+The app runs in-process on an in-memory Mongo (mongomock-motor), or is
+reached over HTTP with --base, in which case --mongo-url/--db point at the
+database to seed. Either way the data comes from `do_seed`, scaled up.
+Routes whose updates mongomock cannot run are left out of in-memory runs,
+and in-process runs don't archive orders while they run.
+
+    python bench/loadtest.py --seed --products 2000 --orders 200000 --users 50 --duration 60
+    python bench/loadtest.py --save baseline.json
+    python bench/loadtest.py --baseline baseline.json --tolerance 0.25   # exit 1 on regression
+
+bench/baseline.json is an in-memory run of the small default mode:
+
+    python bench/loadtest.py --products 200 --orders 2000 --customers 20 --users 10 --duration 10
+
+In-process runs share one event loop between client and server, so compare
+them with each other, not with numbers measured over the network.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import httpx
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+MIX = {'customer': 0.85, 'admin': 0.05, 'delivery': 0.10}
+PASSWORD = 'loadtest123'
+QUERIES = ['kaju', 'laddu', 'barfi', 'गुलाब', 'samosa', 'peda', 'halwa', 'gift box', 'rasmalai', 'namkeen']
+STATUS_FLOW = ['accepted', 'preparing', 'packed', 'out_for_delivery', 'delivered']
+
+
+# ── SEEDING ──────────────────────────────────────────────────────────────────
+
+async def seed(server, n_products: int, n_orders: int, n_customers: int, rng):
+    db = server.db
+    await server.do_seed()
+    base = await db.products.find({}, {'_id': 0}).to_list(None)
+    extra = []
+    for i in range(max(0, n_products - len(base))):
+        p = dict(rng.choice(base))
+        p['name'] = f"{p['name']} {i}"
+        p['prices'] = {k: round(v * rng.uniform(.8, 1.3)) for k, v in p['prices'].items()}
+        p['featured'] = rng.random() < .02
+        extra.append(p)
+    for i in range(0, len(extra), 5000):
+        await db.products.insert_many(extra[i:i + 5000])
+
+    pw = server.hasher.hash_sync(PASSWORD)
+    now = datetime.now(timezone.utc)
+    await db.users.delete_many({'email': {'$regex': r'^lt\d+@'}})
+    await db.users.insert_many([{'name': f'Load {i}', 'email': f'lt{i}@example.com', 'phone': '', 'password_hash': pw,
+                                 'role': 'customer', 'addresses': [], 'created_at': now.isoformat()}
+                                for i in range(n_customers)])
+    customers = await db.users.find({'role': 'customer', 'email': {'$regex': r'^lt\d+@'}}).to_list(None)
+    partner = await db.users.find_one({'role': 'delivery_partner'})
+    products = await db.products.find({}, {'name': 1, 'prices': 1, 'images': 1}).to_list(None)
+
+    statuses = ['placed'] * 2 + STATUS_FLOW + ['delivered'] * 6 + ['cancelled']
+    batch = []
+    for i in range(n_orders):
+        u = rng.choice(customers)
+        items = []
+        for p in rng.sample(products, rng.randint(1, 4)):
+            w = rng.choice(['g250', 'g500', 'g1000'])
+            items.append({'product_id': str(p['_id']), 'product_name': p['name'], 'weight': w,
+                          'quantity': rng.randint(1, 3), 'price': p['prices'][w], 'image': (p.get('images') or [None])[0]})
+        subtotal = sum(i['price'] * i['quantity'] for i in items)
+        created = (now - timedelta(minutes=rng.randint(0, 180 * 24 * 60))).isoformat()
+        status = rng.choice(statuses)
+        batch.append({
+            'order_number': f'LT{i:08d}', 'user_id': str(u['_id']), 'user_name': u['name'], 'user_email': u['email'],
+            'user_phone': '', 'items': items, 'address': {'line1': 'x', 'city': 'Agra', 'pincode': '282001', 'phone': '1'},
+            'delivery_type': 'delivery', 'payment_method': 'cod', 'coupon_code': None, 'subtotal': subtotal,
+            'delivery_charge': 0, 'discount': 0, 'total': subtotal, 'status': status,
+            'status_history': [{'status': status, 'timestamp': created}], 'notes': None,
+            'delivery_partner_id': str(partner['_id']) if status in STATUS_FLOW[2:] else None,
+            'razorpay_payment_id': None, 'razorpay_order_id': None, 'created_at': created,
+        })
+        if len(batch) == 5000:
+            await db.orders.insert_many(batch)
+            batch = []
+    if batch:
+        await db.orders.insert_many(batch)
+    await db.daily_sales.delete_many({})
+    try:
+        await server.rebuild_daily_sales()
+    except NotImplementedError:
+        # mongomock lacks $substrBytes/$merge; same rollup, computed here
+        days = defaultdict(lambda: {'orders': 0, 'cancelled': 0, 'revenue': 0})
+        async for o in db.orders.find({}, {'created_at': 1, 'status': 1, 'total': 1}):
+            d = days[o['created_at'][:10]]
+            d['orders'] += 1
+            d['cancelled'] += o['status'] == 'cancelled'
+            d['revenue'] += 0 if o['status'] == 'cancelled' else o['total']
+        await db.daily_sales.insert_many([{'_id': k, **v} for k, v in days.items()])
+    server.catalog.invalidate()
+    await server.refresh_search(force=True)
+
+
+# ── TRAFFIC ──────────────────────────────────────────────────────────────────
+
+class Recorder:
+    def __init__(self):
+        self.samples = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    async def call(self, http, route: str, method: str, url: str, ok=(200,), **kw):
+        t = time.perf_counter()
+        try:
+            r = await http.request(method, url, **kw)
+        except httpx.HTTPError:
+            self.errors[route] += 1
+            return None
+        self.samples[route].append(time.perf_counter() - t)
+        if r.status_code not in ok:
+            self.errors[route] += 1
+            return None
+        return r
+
+
+async def customer(http, rec, auth, ctx, rng):
+    await rec.call(http, 'GET /categories', 'GET', '/categories')
+    await rec.call(http, 'GET /products/featured', 'GET', '/products/featured')
+    r = await rec.call(http, 'GET /products?category', 'GET', '/products',
+                       params={'category': rng.choice(ctx['categories']), 'limit': 50})
+    listing = r.json() if r else []
+    if rng.random() < .4:
+        r = await rec.call(http, 'GET /products?search', 'GET', '/products', params={'search': rng.choice(QUERIES)})
+        listing = (r.json() if r else []) or listing
+    if not listing:
+        return
+    cart = []
+    for p in rng.sample(listing, min(len(listing), rng.randint(1, 4))):
+        await rec.call(http, 'GET /products/{pid}', 'GET', f"/products/{p['id']}")
+        await rec.call(http, 'GET /products/{pid}/recommendations', 'GET', f"/products/{p['id']}/recommendations")
+        w = rng.choice(['g250', 'g500', 'g1000'])
+        await rec.call(http, 'POST /cart/add', 'POST', '/cart/add', headers=auth,
+                       json={'product_id': p['id'], 'weight': w, 'quantity': rng.randint(1, 2)})
+        cart.append((p, w))
+    if rng.random() < .3 and 'PUT /cart/update' not in ctx['skip']:
+        p, w = rng.choice(cart)
+        await rec.call(http, 'PUT /cart/update', 'PUT', '/cart/update', headers=auth,
+                       json={'product_id': p['id'], 'weight': w, 'quantity': rng.randint(0, 3)})
+    await rec.call(http, 'GET /cart', 'GET', '/cart', headers=auth)
+    if rng.random() < .35:
+        items = [{'product_id': p['id'], 'product_name': p['name'], 'weight': w, 'quantity': 1,
+                  'price': p['prices'][w]} for p, w in cart]
+        body = {'items': items, 'address': {'line1': 'x', 'city': 'Agra', 'pincode': '282001', 'phone': '1'}}
+        if rng.random() < .2:
+            body['coupon_code'] = 'RASRAJ10'
+        await rec.call(http, 'POST /orders', 'POST', '/orders', headers=auth, json=body, ok=(200, 400))
+        await rec.call(http, 'GET /orders', 'GET', '/orders', headers=auth)
+    else:
+        await rec.call(http, 'DELETE /cart/clear', 'DELETE', '/cart/clear', headers=auth)
+
+
+async def admin(http, rec, auth, ctx, rng):
+    await rec.call(http, 'GET /admin/dashboard', 'GET', '/admin/dashboard', headers=auth)
+    r = await rec.call(http, 'GET /orders (admin)', 'GET', '/orders', headers=auth, params={'limit': 50})
+    open_orders = [o for o in (r.json() if r else []) if o['status'] == 'placed']
+    for o in open_orders[:3]:
+        await rec.call(http, 'PUT /orders/{oid}/status', 'PUT', f"/orders/{o['id']}/status", headers=auth,
+                       json={'status': 'accepted', 'delivery_partner_id': ctx['partner_id']})
+
+
+async def delivery(http, rec, auth, ctx, rng):
+    r = await rec.call(http, 'GET /delivery/orders', 'GET', '/delivery/orders', headers=auth)
+    for o in (r.json() if r else [])[:3]:
+        if o['status'] in STATUS_FLOW[:-1]:
+            nxt = STATUS_FLOW[STATUS_FLOW.index(o['status']) + 1]
+            await rec.call(http, 'PUT /orders/{oid}/status', 'PUT', f"/orders/{o['id']}/status", headers=auth,
+                           json={'status': nxt})
+
+
+FLOWS = {'customer': customer, 'admin': admin, 'delivery': delivery}
+
+
+async def unsupported_routes(db) -> set:
+    # mongomock lacks some update operators; probe them instead of failing mid-run
+    skip = set()
+    probe = db['loadtest_probe']
+    await probe.insert_one({'_id': 1, 'items': [{'k': 1, 'quantity': 1}]})
+    try:
+        await probe.update_one({'_id': 1}, {'$set': {'items.$[it].quantity': 2}}, array_filters=[{'it.k': 1}])
+    except Exception:
+        skip.add('PUT /cart/update')   # arrayFilters
+    finally:
+        await probe.drop()
+    return skip
+
+
+async def login(http, email, password):
+    r = await http.post('/auth/login', json={'email': email, 'password': password})
+    r.raise_for_status()
+    body = r.json()
+    return {'Authorization': f"Bearer {body['token']}"}, body
+
+
+async def run(http, args, rng, skip=frozenset()):
+    cats = (await http.get('/categories')).json()
+    admin_auth, _ = await login(http, 'admin@rasraj.com', 'admin123')
+    partner_auth, partner = await login(http, 'delivery@rasraj.com', 'delivery123')
+    ctx = {'categories': [c['slug'] for c in cats], 'partner_id': partner['id'], 'skip': skip}
+    roles = rng.choices(list(MIX), weights=list(MIX.values()), k=args.users)
+    auths = []
+    for i, role in enumerate(roles):
+        if role == 'customer':
+            auths.append((await login(http, f'lt{i % args.customers}@example.com', PASSWORD))[0])
+        else:
+            auths.append(admin_auth if role == 'admin' else partner_auth)
+
+    rec = Recorder()
+    deadline = time.monotonic() + args.duration
+
+    async def vu(role, auth, seed):
+        r = random.Random(seed)
+        while time.monotonic() < deadline:
+            await FLOWS[role](http, rec, auth, ctx, r)
+            # in-memory calls may never suspend; let the other users run
+            await asyncio.sleep(0)
+
+    start = time.monotonic()
+    await asyncio.gather(*(vu(role, auth, i) for i, (role, auth) in enumerate(zip(roles, auths))))
+    return rec, time.monotonic() - start
+
+
+# ── REPORT ───────────────────────────────────────────────────────────────────
+
+def pct(samples, q):
+    return samples[min(len(samples) - 1, int(len(samples) * q))] * 1e3
+
+
+def summarize(rec: Recorder, elapsed: float) -> dict:
+    out = {}
+    for route in sorted(set(rec.samples) | set(rec.errors)):
+        s = sorted(rec.samples[route])
+        out[route] = {'count': len(s), 'rps': round(len(s) / elapsed, 2), 'errors': rec.errors[route],
+                      'p50': round(pct(s, .5), 2) if s else None, 'p95': round(pct(s, .95), 2) if s else None,
+                      'p99': round(pct(s, .99), 2) if s else None}
+    total = sum(r['count'] for r in out.values())
+    out['TOTAL'] = {'count': total, 'rps': round(total / elapsed, 2), 'errors': sum(rec.errors.values())}
+    return out
+
+
+def print_report(report: dict):
+    print(f"{'route':<40} {'count':>7} {'rps':>8} {'err':>5} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for route, r in report.items():
+        print(f"{route:<40} {r['count']:>7} {r['rps']:>8} {r['errors']:>5} {r.get('p50') or '':>8} "
+              f"{r.get('p95') or '':>8} {r.get('p99') or '':>8}")
+
+
+def regressions(report: dict, baseline: dict, tolerance: float) -> list:
+    out = []
+    for route, b in baseline.items():
+        r = report.get(route)
+        if not r:
+            continue
+        if b.get('p95') and r.get('p95') and r['p95'] > b['p95'] * (1 + tolerance):
+            out.append(f"{route}: p95 {r['p95']} ms vs baseline {b['p95']} ms")
+        if route == 'TOTAL' and r['rps'] < b['rps'] * (1 - tolerance):
+            out.append(f"throughput {r['rps']} rps vs baseline {b['rps']} rps")
+        b_err = b['errors'] / max(b['count'], 1)
+        if r['errors'] / max(r['count'], 1) > b_err + 0.01:
+            out.append(f"{route}: error rate {r['errors']}/{r['count']}")
+    return out
+
+
+# ── MAIN ─────────────────────────────────────────────────────────────────────
+
+async def main(args):
+    rng = random.Random(args.seed_value)
+    if args.mongo_url:
+        os.environ['MONGO_URL'], os.environ['DB_NAME'] = args.mongo_url, args.db
+    else:
+        os.environ.setdefault('MONGO_URL', 'mongodb://localhost:27017')
+        os.environ.setdefault('DB_NAME', args.db)
+    os.environ.setdefault('BCRYPT_ROUNDS', '4')
+    os.environ.setdefault('RECS_REFRESH_INTERVAL', '0')
+    if not args.base:
+        # the archiver would move seeded orders out from under the run
+        os.environ.setdefault('ARCHIVE_AFTER_DAYS', '0')
+    import server
+
+    skip = set()
+    if not args.base and not args.mongo_url:
+        try:
+            from mongomock_motor import AsyncMongoMockClient
+        except ImportError:
+            sys.exit("in-memory runs need mongomock-motor; pass --mongo-url or --base instead")
+        server.client = AsyncMongoMockClient()
+        server.db = server.client[args.db]
+        args.seed = True
+        skip = await unsupported_routes(server.db)
+        for route in sorted(skip):
+            print(f"skipping {route}: not supported by mongomock")
+    else:
+        server.connect()
+
+    if args.seed:
+        t = time.perf_counter()
+        await seed(server, args.products, args.orders, args.customers, rng)
+        print(f"seeded {args.products} products / {args.orders} orders in {time.perf_counter() - t:.1f}s")
+
+    limits = httpx.Limits(max_connections=args.users * 2)
+    if args.base:
+        http = httpx.AsyncClient(base_url=args.base, timeout=30, limits=limits)
+    else:
+        await server.startup()
+        # app exceptions come back as 500s and count as route errors
+        transport = httpx.ASGITransport(app=server.app, raise_app_exceptions=False)
+        http = httpx.AsyncClient(transport=transport, base_url='http://app/api', timeout=30)
+    try:
+        rec, elapsed = await run(http, args, rng, skip)
+    finally:
+        await http.aclose()
+        if not args.base:
+            await server.shutdown()
+
+    report = summarize(rec, elapsed)
+    print_report(report)
+    if args.save:
+        Path(args.save).write_text(json.dumps(report, indent=2))
+    if args.baseline:
+        bad = regressions(report, json.loads(Path(args.baseline).read_text()), args.tolerance)
+        for line in bad:
+            print(f"REGRESSION {line}")
+        return 1 if bad else 0
+    return 0
+
+
+if __name__ == '__main__':
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--base', help='API base URL of a running server, e.g. http://localhost:8001/api')
+    ap.add_argument('--mongo-url', help='database to seed; in-memory when omitted')
+    ap.add_argument('--db', default='rasraj_loadtest')
+    ap.add_argument('--seed', action='store_true', help='reseed the database before the run')
+    ap.add_argument('--products', type=int, default=2000)
+    ap.add_argument('--orders', type=int, default=20000)
+    ap.add_argument('--customers', type=int, default=200)
+    ap.add_argument('--users', type=int, default=20, help='concurrent virtual users')
+    ap.add_argument('--duration', type=float, default=30)
+    ap.add_argument('--save', help='write the report as a baseline JSON file')
+    ap.add_argument('--baseline', help='compare against a saved baseline and exit 1 on regression')
+    ap.add_argument('--tolerance', type=float, default=0.2)
+    ap.add_argument('--seed-value', type=int, default=1)
+    sys.exit(asyncio.run(main(ap.parse_args())))
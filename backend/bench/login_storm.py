@@ -0,0 +1,73 @@
+"""Login storm vs. unrelated-endpoint latency.
+
+Fires concurrent logins at a running API while probing a cheap endpoint and
+reports probe latency percentiles. With hashing on the event loop the probe
+p99 tracks bcrypt cost; with the hasher pool it should stay near baseline.
+
+    python bench/login_storm.py --base-url http://localhost:8001 --logins 200
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+
+
+def pct(samples, p):
+    s = sorted(samples)
+    return s[min(len(s) - 1, int(len(s) * p))] * 1000 if s else 0.0
+
+
+async def probe(http, url, stop, out):
+    while not stop.is_set():
+        t = time.perf_counter()
+        await http.get(url)
+        out.append(time.perf_counter() - t)
+        await asyncio.sleep(0.01)
+
+
+async def main(args):
+    limits = httpx.Limits(max_connections=args.concurrency + 4)
+    async with httpx.AsyncClient(base_url=args.base_url, limits=limits, timeout=60) as http:
+        baseline, storm = [], []
+        stop = asyncio.Event()
+        task = asyncio.create_task(probe(http, args.probe, stop, baseline))
+        await asyncio.sleep(args.warmup)
+        stop.set()
+        await task
+
+        sem = asyncio.Semaphore(args.concurrency)
+        login_times = []
+
+        async def one():
+            async with sem:
+                t = time.perf_counter()
+                r = await http.post('/api/auth/login', json={'email': args.email, 'password': args.password})
+                r.raise_for_status()
+                login_times.append(time.perf_counter() - t)
+
+        stop = asyncio.Event()
+        task = asyncio.create_task(probe(http, args.probe, stop, storm))
+        started = time.perf_counter()
+        await asyncio.gather(*(one() for _ in range(args.logins)))
+        elapsed = time.perf_counter() - started
+        stop.set()
+        await task
+
+    print(f"logins: {args.logins} in {elapsed:.2f}s ({args.logins / elapsed:.1f}/s), "
+          f"median {statistics.median(login_times) * 1000:.1f} ms")
+    for label, s in (('baseline', baseline), ('during storm', storm)):
+        print(f"{args.probe} {label}: n={len(s)} p50={pct(s, .5):.1f} ms p99={pct(s, .99):.1f} ms")
+
+
+if __name__ == '__main__':
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--base-url', default='http://localhost:8001')
+    ap.add_argument('--email', default='admin@rasraj.com')
+    ap.add_argument('--password', default='admin123')
+    ap.add_argument('--logins', type=int, default=100)
+    ap.add_argument('--concurrency', type=int, default=20)
+    ap.add_argument('--probe', default='/api/payment/key')
+    ap.add_argument('--warmup', type=float, default=2.0)
+    asyncio.run(main(ap.parse_args()))
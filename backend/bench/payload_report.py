@@ -0,0 +1,57 @@
+"""Response size and serialization cost for the list endpoints.
+
+Fetches each list endpoint from a running server with the default projection
+and with `fields=*`, with and without Accept-Encoding, and reports bytes on
+the wire. Then times FastAPI's default jsonable_encoder + json.dumps path
+against the orjson path on the same payloads.
+
+    python bench/payload_report.py --base http://localhost:8001/api
+"""
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+import httpx
+from fastapi.encoders import jsonable_encoder
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from caching import dumps, pick_encoding  # noqa: E402
+
+ENDPOINTS = [('/products', False), ('/products/featured', False), ('/orders', True), ('/delivery/orders', True)]
+
+
+def timed(fn, payload, rounds):
+    t = time.perf_counter()
+    for _ in range(rounds):
+        fn(payload)
+    return (time.perf_counter() - t) / rounds * 1e3
+
+
+def main(args):
+    http = httpx.Client(base_url=args.base, timeout=30)
+    token = http.post('/auth/login', json={'email': args.email, 'password': args.password}).json()['token']
+    auth = {'Authorization': f'Bearer {token}'}
+    enc = pick_encoding('br, gzip')
+    print(f"{'endpoint':<20} {'fields':<8} {'identity':>10} {enc:>10}  {'encoder+json':>12} {'orjson':>8}")
+    for path, needs_auth in ENDPOINTS:
+        for fields in (None, '*'):
+            params = {'fields': fields} if fields else {}
+            headers = auth if needs_auth else {}
+            plain = http.get(path, params=params, headers={**headers, 'Accept-Encoding': 'identity'})
+            packed = http.get(path, params=params, headers={**headers, 'Accept-Encoding': enc})
+            data = plain.json()
+            slow = timed(lambda d: json.dumps(jsonable_encoder(d)).encode(), data, args.rounds)
+            fast = timed(dumps, data, args.rounds)
+            print(f"{path:<20} {fields or 'default':<8} {len(plain.content):>10} {packed.num_bytes_downloaded:>10}"
+                  f"  {slow:>9.3f} ms {fast:>5.3f} ms")
+
+
+if __name__ == '__main__':
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--base', default='http://localhost:8001/api')
+    ap.add_argument('--email', default='admin@rasraj.com')
+    ap.add_argument('--password', default='admin123')
+    ap.add_argument('--rounds', type=int, default=200)
+    main(ap.parse_args())
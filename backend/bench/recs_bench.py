@@ -0,0 +1,88 @@
+"""Offline quality and latency of the co-purchase recommendations.
+
+Generates a synthetic catalog and order history in which products are bought
+in hidden bundles, trains on the first 80% of orders and evaluates on the
+rest. For every held-out basket with two or more items, each item is used as
+the query and we check whether one of the other items appears in its top-k.
+The category-only fallback is reported as the baseline.
+
+    python bench/recs_bench.py --products 300 --orders 20000
+"""
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from recommendations import CoPurchaseMatrix, build_table, category_fallback  # noqa: E402
+
+CATS = ['milk-sweets', 'dry-fruit-sweets', 'namkeen', 'gift-boxes', 'cakes', 'seasonal', 'snacks']
+
+
+def synth(n_products, n_orders, rng):
+    products = {str(i): {'category_slug': rng.choice(CATS), 'in_stock': True, 'featured': rng.random() < .1,
+                         'name': f'p{i}'} for i in range(n_products)}
+    ids = list(products)
+    bundles = [rng.sample(ids, rng.randint(2, 4)) for _ in range(n_products // 3)]
+    baskets = []
+    for _ in range(n_orders):
+        b = set(rng.choice(bundles)) if rng.random() < .7 else set()
+        b.update(rng.sample(ids, rng.randint(1, 2)))
+        baskets.append(b)
+    return products, baskets
+
+
+def hit_rate(recommend, baskets, k):
+    hits = total = 0
+    for b in baskets:
+        if len(b) < 2:
+            continue
+        for pid in b:
+            total += 1
+            hits += bool(set(recommend(pid)[:k]) & (b - {pid}))
+    return hits / max(total, 1)
+
+
+def main(args):
+    rng = random.Random(11)
+    products, baskets = synth(args.products, args.orders, rng)
+    split = int(len(baskets) * .8)
+    train, test = baskets[:split], baskets[split:]
+
+    m = CoPurchaseMatrix()
+    t = time.perf_counter()
+    m.ingest(train[:-args.increment])
+    full = time.perf_counter() - t
+    t = time.perf_counter()
+    m.ingest(train[-args.increment:])
+    inc = time.perf_counter() - t
+    t = time.perf_counter()
+    table = build_table(m, products, n=8)
+    build = time.perf_counter() - t
+
+    samples = []
+    pids = list(products)
+    for _ in range(args.lookups):
+        pid = rng.choice(pids)
+        t = time.perf_counter()
+        table.get(pid)
+        samples.append(time.perf_counter() - t)
+    samples.sort()
+
+    print(f"{args.products} products, {len(train)} training orders, {len(test)} held out")
+    print(f"ingest {full * 1e3:.1f} ms, incremental {args.increment} orders {inc * 1e3:.1f} ms, "
+          f"table build {build * 1e3:.1f} ms, lookup p99 {samples[int(len(samples) * .99)] * 1e6:.2f} us")
+    for k in (4, 8):
+        co = hit_rate(lambda pid: table.get(pid, []), test, k)
+        base = hit_rate(lambda pid: category_fallback(pid, products, k), test, k)
+        print(f"hit@{k}: co-purchase {co:.3f}   category baseline {base:.3f}")
+
+
+if __name__ == '__main__':
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--products', type=int, default=300)
+    ap.add_argument('--orders', type=int, default=20000)
+    ap.add_argument('--increment', type=int, default=500)
+    ap.add_argument('--lookups', type=int, default=10000)
+    main(ap.parse_args())
@@ -0,0 +1,56 @@
+"""Search index latency vs. catalog size.
+
+Builds the in-memory index over synthetic catalogs of growing size and times
+representative English, Hindi and transliterated queries.
+
+    python bench/search_bench.py --sizes 100 1000 10000 50000
+"""
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from search import SearchIndex  # noqa: E402
+
+WORDS = [('Kaju', 'काजू'), ('Katli', 'कतली'), ('Gulab', 'गुलाब'), ('Jamun', 'जामुन'),
+         ('Besan', 'बेसन'), ('Laddu', 'लड्डू'), ('Barfi', 'बर्फी'), ('Kesar', 'केसर'),
+         ('Peda', 'पेड़ा'), ('Halwa', 'हलवा'), ('Gujiya', 'गुझिया'), ('Rasmalai', 'रसमलाई'),
+         ('Mathri', 'मठरी'), ('Namkeen', 'नमकीन'), ('Pista', 'पिस्ता'), ('Badam', 'बादाम')]
+CATS = ['milk-sweets', 'dry-fruit-sweets', 'namkeen', 'gift-boxes', 'cakes', 'seasonal', 'snacks']
+QUERIES = ['kaju', 'काजू कतली', 'kaaju', 'lad', 'besan laddu', 'pedaa', 'rasmalai kesar']
+
+
+def catalog(n, rng):
+    for i in range(n):
+        picks = rng.sample(WORDS, 3)
+        yield {'id': str(i), 'name': ' '.join(w for w, _ in picks) + f' {i}',
+               'name_hi': ' '.join(h for _, h in picks),
+               'description': ' '.join(w for w, _ in rng.sample(WORDS, 6)),
+               'category_slug': rng.choice(CATS), 'featured': rng.random() < 0.1}
+
+
+def main(args):
+    rng = random.Random(7)
+    for n in args.sizes:
+        idx = SearchIndex()
+        t = time.perf_counter()
+        idx.rebuild(catalog(n, rng))
+        build = time.perf_counter() - t
+        samples = []
+        for _ in range(args.rounds):
+            for q in QUERIES:
+                t = time.perf_counter()
+                idx.search(q, limit=50)
+                samples.append(time.perf_counter() - t)
+        samples.sort()
+        p50, p99 = samples[len(samples) // 2], samples[int(len(samples) * .99)]
+        print(f"{n:>7} products  build {build * 1000:8.1f} ms  query p50 {p50 * 1e3:6.2f} ms  p99 {p99 * 1e3:6.2f} ms")
+
+
+if __name__ == '__main__':
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--sizes', type=int, nargs='+', default=[100, 1000, 10000])
+    ap.add_argument('--rounds', type=int, default=50)
+    main(ap.parse_args())
@@ -0,0 +1,107 @@
+import codecs
+import csv
+import json
+
+PRICE_KEYS = ('g250', 'g500', 'g1000')
+STOCK_KEYS = {f'stock_{w}': w for w in PRICE_KEYS}
+BOOL_KEYS = ('in_stock', 'featured')
+TRUE, FALSE = {'1', 'true', 'yes', 'y'}, {'0', 'false', 'no', 'n'}
+
+
+class RowError(Exception):
+    pass
+
+
+async def text_lines(chunks):
+    # Decodes a byte stream and yields complete lines without their newline.
+    decoder = codecs.getincrementaldecoder('utf-8-sig')()
+    pending = ''
+    async for chunk in chunks:
+        pending += decoder.decode(chunk)
+        *lines, pending = pending.split('\n')
+        for line in lines:
+            yield line.rstrip('\r')
+    pending += decoder.decode(b'', final=True)
+    if pending.strip():
+        yield pending.rstrip('\r')
+
+
+async def records(chunks, fmt: str):
+    # Yields (row number, dict | RowError) from a streamed CSV or NDJSON body.
+    # CSV records may span lines inside quoted fields; quote parity tells
+    # when a record is complete.
+    header, buf, start, n = None, [], 0, 0
+    async for line in text_lines(chunks):
+        n += 1
+        if fmt == 'ndjson':
+            if not line.strip():
+                continue
+            try:
+                obj = json.loads(line)
+                yield n, obj if isinstance(obj, dict) else RowError("Expected a JSON object")
+            except ValueError as e:
+                yield n, RowError(f"Invalid JSON: {e}")
+            continue
+        if not buf:
+            start = n
+        buf.append(line)
+        if sum(part.count('"') for part in buf) % 2:
+            continue
+        row = next(csv.reader(['\n'.join(buf)]), [])
+        buf = []
+        if header is None:
+            header = [h.strip() for h in row]
+            continue
+        if not any(cell.strip() for cell in row):
+            continue
+        if len(row) > len(header):
+            yield start, RowError(f"Expected {len(header)} columns, got {len(row)}")
+            continue
+        yield start, {k: v for k, v in zip(header, row) if v.strip() != ''}
+    if buf:
+        yield start, RowError("Unterminated quoted field")
+
+
+def nested(d: dict, key: str) -> dict:
+    v = d.pop(key, None)
+    if v is None or v == '':
+        return {}
+    if not isinstance(v, dict):
+        raise RowError(f"{key} must be an object")
+    return dict(v)
+
+
+def normalize(raw: dict) -> dict:
+    # Flat CSV-style fields (g250, stock_g250, images as a|b, "true") into ProductReq shape.
+    d = dict(raw)
+    prices = nested(d, 'prices')
+    for k in PRICE_KEYS:
+        if k in d:
+            prices[k] = d.pop(k)
+    for k, v in prices.items():
+        try:
+            prices[k] = float(v)
+        except (TypeError, ValueError):
+            raise RowError(f"Invalid price for {k}: {v!r}")
+    if prices:
+        d['prices'] = prices
+    stock = nested(d, 'stock')
+    for k, w in STOCK_KEYS.items():
+        if k in d:
+            stock[w] = d.pop(k)
+    for k, v in stock.items():
+        try:
+            stock[k] = int(v) if v not in (None, '') else None
+        except (TypeError, ValueError):
+            raise RowError(f"Invalid stock for {k}: {v!r}")
+    if stock:
+        d['stock'] = stock
+    for k in BOOL_KEYS:
+        v = d.get(k)
+        if isinstance(v, str):
+            if v.strip().lower() not in TRUE | FALSE:
+                raise RowError(f"Invalid boolean for {k}: {v!r}")
+            d[k] = v.strip().lower() in TRUE
+    if isinstance(d.get('images'), str):
+        d['images'] = [u.strip() for u in d['images'].split('|') if u.strip()]
+    return d
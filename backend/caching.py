@@ -0,0 +1,156 @@
+import asyncio
+import gzip
+import hashlib
+import json
+import time
+from collections import OrderedDict
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESS_MIN_SIZE = 1024
+
+
+def dumps(data) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(data, default=str)
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':'), default=str).encode()
+
+
+def pick_encoding(accept_encoding: str):
+    accept = accept_encoding or ''
+    if brotli is not None and 'br' in accept:
+        return 'br'
+    if 'gzip' in accept:
+        return 'gzip'
+    return None
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == 'br':
+        return brotli.compress(body, quality=5)
+    return gzip.compress(body, compresslevel=6)
+
+
+class CacheEntry:
+    __slots__ = ('data', 'body', 'etag', 'version', 'expires', '_encoded')
+
+    def __init__(self, data, version: int, ttl: float):
+        self.data = data
+        self.body = dumps(data) if data is not None else None
+        # content-only, so every worker and restart agrees on the validator
+        digest = hashlib.blake2b(self.body or b'null', digest_size=16).hexdigest()
+        self.etag = f'W/"{digest}"'
+        self.version = version
+        self.expires = time.monotonic() + ttl
+        self._encoded = {}
+
+    def encoded(self, encoding: str) -> bytes:
+        # compressed once per entry, not once per response
+        if encoding not in self._encoded:
+            self._encoded[encoding] = compress(self.body, encoding)
+        return self._encoded[encoding]
+
+
+class CatalogCache:
+    # Read-through cache for catalog reads. Every admin write bumps `version`,
+    # which evicts all entries and makes any in-flight load discard its result.
+    # The TTL bounds staleness for writes made through other workers.
+
+    def __init__(self, ttl: float = 60, max_entries: int = 512):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.version = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        self._inflight: dict = {}
+
+    def invalidate(self):
+        self.version += 1
+        self._entries.clear()
+        self._inflight.clear()
+
+    async def get(self, key: str, loader) -> CacheEntry:
+        e = self._entries.get(key)
+        if e and e.version == self.version and e.expires > time.monotonic():
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return e
+        self.misses += 1
+        fut = self._inflight.get(key)
+        if fut is None:
+            fut = asyncio.ensure_future(self._load(key, loader, self.version))
+            self._inflight[key] = fut
+        return await asyncio.shield(fut)
+
+    async def _load(self, key, loader, version) -> CacheEntry:
+        try:
+            e = CacheEntry(await loader(), version, self.ttl)
+        finally:
+            if self._inflight.get(key) is asyncio.current_task():
+                del self._inflight[key]
+        if version == self.version:
+            self._entries[key] = e
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return e
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {'version': self.version, 'entries': len(self._entries), 'hits': self.hits,
+                'misses': self.misses, 'hit_rate': round(self.hits / total, 4) if total else 0.0}
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    tags = [t.strip() for t in if_none_match.split(',')]
+    return '*' in tags or etag in tags or etag.removeprefix('W/') in tags
+
+
+class TTLCache:
+    # Bounded LRU with per-entry expiry, for small hot lookups such as principals.
+
+    def __init__(self, maxsize: int = 10000, ttl: float = 30):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data: OrderedDict = OrderedDict()
+
+    def get(self, key):
+        item = self._data.get(key)
+        if item is None or item[1] <= time.monotonic():
+            if item is not None:
+                del self._data[key]
+            self.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.hits += 1
+        return item[0]
+
+    def set(self, key, value):
+        self._data[key] = (value, time.monotonic() + self.ttl)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key):
+        self._data.pop(key, None)
+
+    def clear(self):
+        self._data.clear()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {'entries': len(self._data), 'hits': self.hits, 'misses': self.misses,
+                'hit_rate': round(self.hits / total, 4) if total else 0.0}
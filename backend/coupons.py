@@ -0,0 +1,139 @@
+import asyncio
+import logging
+import time
+from datetime import datetime, timezone
+
+from pymongo.errors import DuplicateKeyError
+
+
+logger = logging.getLogger(__name__)
+
+COUPON_TYPES = ('percent', 'flat')
+
+
+class CouponError(Exception):
+    pass
+
+
+DEFAULT_COUPONS = [
+    {'code': 'RASRAJ10', 'type': 'percent', 'value': 10, 'min_subtotal': 200, 'description': '10% off your order'},
+    {'code': 'FIRST50', 'type': 'flat', 'value': 50, 'min_subtotal': 100, 'per_user_limit': 1,
+     'description': '₹50 flat off'},
+    {'code': 'WELCOME20', 'type': 'percent', 'value': 20, 'min_subtotal': 500,
+     'description': '20% off on orders above ₹500'},
+]
+
+
+def parse_time(v):
+    if not v:
+        return None
+    if isinstance(v, datetime):
+        t = v
+    else:
+        t = datetime.fromisoformat(str(v).replace('Z', '+00:00'))
+    return t if t.tzinfo else t.replace(tzinfo=timezone.utc)
+
+
+class Coupon:
+    __slots__ = ('code', 'type', 'value', 'min_subtotal', 'max_discount', 'starts_at', 'ends_at',
+                 'categories', 'usage_limit', 'per_user_limit', 'description')
+
+    def __init__(self, d: dict):
+        self.code = d['code'].upper()
+        self.type = d.get('type', 'percent')
+        self.value = float(d.get('value', 0))
+        self.min_subtotal = float(d.get('min_subtotal') or 0)
+        self.max_discount = float(d['max_discount']) if d.get('max_discount') else None
+        self.starts_at = parse_time(d.get('starts_at'))
+        self.ends_at = parse_time(d.get('ends_at'))
+        self.categories = frozenset(d['categories']) if d.get('categories') else None
+        self.usage_limit = d.get('usage_limit') or None
+        self.per_user_limit = d.get('per_user_limit') or None
+        self.description = d.get('description', '')
+        if self.type not in COUPON_TYPES:
+            raise CouponError(f"Unknown coupon type: {self.type}")
+        if self.value < 0 or (self.type == 'percent' and self.value > 100):
+            raise CouponError(f"Invalid coupon value: {self.value:g}")
+        if self.starts_at and self.ends_at and self.ends_at <= self.starts_at:
+            raise CouponError("Coupon ends before it starts")
+
+    def discount(self, items: list, now: datetime = None) -> float:
+        # items: [(category_slug, line_total)]
+        now = now or datetime.now(timezone.utc)
+        if self.starts_at and now < self.starts_at:
+            raise CouponError("Coupon is not active yet")
+        if self.ends_at and now >= self.ends_at:
+            raise CouponError("Coupon has expired")
+        subtotal = sum(amount for _, amount in items)
+        if subtotal < self.min_subtotal:
+            raise CouponError(f"Minimum order ₹{self.min_subtotal:g} required")
+        eligible = subtotal if self.categories is None else \
+            sum(amount for cat, amount in items if cat in self.categories)
+        if eligible <= 0:
+            raise CouponError("Coupon does not apply to the items in your cart")
+        d = eligible * self.value / 100 if self.type == 'percent' else self.value
+        if self.max_discount is not None:
+            d = min(d, self.max_discount)
+        return round(min(d, eligible), 2)
+
+
+class CouponBook:
+    # Active coupons compiled into memory. Admin writes on this worker call
+    # invalidate(); the TTL picks up writes made through other workers.
+
+    def __init__(self, ttl: float = 60):
+        self.ttl = ttl
+        self.rules = {}
+        self.loaded_at = 0.0
+        self._lock = asyncio.Lock()
+
+    def invalidate(self):
+        self.loaded_at = 0.0
+
+    async def refresh(self, coll, force: bool = False):
+        if not force and time.monotonic() - self.loaded_at < self.ttl:
+            return
+        async with self._lock:
+            if not force and time.monotonic() - self.loaded_at < self.ttl:
+                return
+            rules = {}
+            async for d in coll.find({'active': {'$ne': False}}):
+                # one bad document must not take every other coupon down with it
+                try:
+                    rules[d['code'].upper()] = Coupon(d)
+                except (CouponError, KeyError, ValueError, TypeError, AttributeError) as e:
+                    logger.error("Skipping coupon %s: %r", d.get('code') or d.get('_id'), e)
+            self.rules = rules
+            self.loaded_at = time.monotonic()
+
+    def get(self, code: str) -> Coupon:
+        c = self.rules.get((code or '').strip().upper())
+        if not c:
+            raise CouponError("Invalid coupon code")
+        return c
+
+
+async def redeem(coupons, redemptions, c: Coupon, user_id: str):
+    # Takes one use from the global and per-user counters, or raises. The
+    # global counter lives on the coupon doc; per-user counters are upserted
+    # with a `$lt` guard, so an exhausted limit surfaces as a duplicate key.
+    if c.usage_limit:
+        r = await coupons.update_one({'code': c.code, 'used': {'$not': {'$gte': c.usage_limit}}},
+                                     {'$inc': {'used': 1}})
+        if not r.modified_count:
+            raise CouponError("Coupon usage limit reached")
+    else:
+        await coupons.update_one({'code': c.code}, {'$inc': {'used': 1}})
+    if c.per_user_limit:
+        try:
+            await redemptions.update_one({'_id': f'{c.code}:{user_id}', 'used': {'$lt': c.per_user_limit}},
+                                         {'$inc': {'used': 1}}, upsert=True)
+        except DuplicateKeyError:
+            await coupons.update_one({'code': c.code}, {'$inc': {'used': -1}})
+            raise CouponError("You have already used this coupon")
+
+
+async def release(coupons, redemptions, code: str, user_id: str, n: int = 1):
+    # Returns n uses (or takes them back with a negative n), e.g. on cancellation.
+    await coupons.update_one({'code': code}, {'$inc': {'used': -n}})
+    await redemptions.update_one({'_id': f'{code}:{user_id}'}, {'$inc': {'used': -n}})
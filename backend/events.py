@@ -0,0 +1,75 @@
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class Subscriber:
+    def __init__(self, match, maxsize: int):
+        self.match = match
+        self.queue = asyncio.Queue(maxsize)
+        self.dropped = 0
+
+
+class OrderEvents:
+    # In-process fan-out of order events to SSE subscribers. Each subscriber
+    # has its own bounded queue; when a slow client fills it, its backlog is
+    # dropped and replaced by a single `resync` event telling it to refetch,
+    # so publishing never waits on any one connection.
+
+    def __init__(self, maxsize: int = 100):
+        self.maxsize = maxsize
+        self.subscribers = set()
+
+    def subscribe(self, match) -> Subscriber:
+        s = Subscriber(match, self.maxsize)
+        self.subscribers.add(s)
+        return s
+
+    def unsubscribe(self, s: Subscriber):
+        self.subscribers.discard(s)
+
+    def publish(self, event: dict):
+        for s in list(self.subscribers):
+            try:
+                if not s.match(event):
+                    continue
+            except Exception:
+                continue
+            if s.queue.full():
+                while not s.queue.empty():
+                    s.queue.get_nowait()
+                    s.dropped += 1
+                s.queue.put_nowait({'type': 'resync'})
+            else:
+                s.queue.put_nowait(event)
+
+    def stats(self) -> dict:
+        return {'subscribers': len(self.subscribers),
+                'dropped': sum(s.dropped for s in self.subscribers)}
+
+
+async def watch_orders(orders, bus: OrderEvents, convert):
+    # Change-stream source for multi-worker deployments: every worker tails
+    # the orders collection and publishes to its own subscribers. Needs a
+    # replica set.
+    pipeline = [{'$match': {'operationType': {'$in': ['insert', 'update', 'replace']}}}]
+    resume = None
+    while True:
+        try:
+            async with orders.watch(pipeline, full_document='updateLookup', resume_after=resume) as stream:
+                async for change in stream:
+                    resume = change['_id']
+                    o = change.get('fullDocument')
+                    if not o:
+                        continue
+                    if change['operationType'] == 'update' and \
+                            'status' not in change.get('updateDescription', {}).get('updatedFields', {}):
+                        continue
+                    kind = 'order.created' if change['operationType'] == 'insert' else 'order.status'
+                    bus.publish({'type': kind, 'order': convert(o)})
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning("Order change stream interrupted: %r", e)
+            await asyncio.sleep(1)
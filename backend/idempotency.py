@@ -0,0 +1,116 @@
+import asyncio
+import hashlib
+import time
+from datetime import datetime, timedelta, timezone
+
+from pymongo.errors import DuplicateKeyError
+
+from caching import TTLCache, dumps
+
+MAX_KEY_LENGTH = 255
+
+
+class IdempotencyError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+def fingerprint(payload) -> str:
+    return hashlib.blake2b(dumps(payload), digest_size=16).hexdigest()
+
+
+class IdempotencyStore:
+    # Remembers the first successful response for each (scope, user, key).
+    # Duplicates in this process wait on the in-flight call; duplicates on
+    # other workers find the pending record and poll it. Failed calls are
+    # forgotten so the client can retry them. A pending record older than
+    # `lease` belongs to a worker that died and may be taken over.
+    # Records expire through a TTL index on expires_at.
+
+    def __init__(self, coll, ttl: float = 86400, lease: float = 30, cache_size: int = 10000, poll: float = 0.1):
+        self.coll = coll
+        self.ttl = ttl
+        self.lease = lease
+        self.poll = poll
+        self.cache = TTLCache(maxsize=cache_size, ttl=min(ttl, 600))
+        self._inflight = {}
+        self.replayed = 0
+
+    async def run(self, scope: str, user_id: str, key: str, payload, fn):
+        # -> (response, replayed)
+        if not key or len(key) > MAX_KEY_LENGTH:
+            raise IdempotencyError(400, f"Idempotency-Key must be 1-{MAX_KEY_LENGTH} characters")
+        rid = f'{scope}:{user_id}:{key}'
+        fp = fingerprint(payload)
+        hit = self.cache.get(rid) or self._inflight.get(rid)
+        if hit:
+            if hit[0] != fp:
+                raise IdempotencyError(422, "Idempotency-Key was already used with a different request")
+            response = hit[1] if not isinstance(hit[1], asyncio.Future) else await asyncio.shield(hit[1])
+            self.replayed += 1
+            return response, True
+        fut = asyncio.get_running_loop().create_future()
+        fut.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self._inflight[rid] = (fp, fut)
+        try:
+            response, replayed = await self._claim(rid, fp, fn)
+            fut.set_result(response)
+        except BaseException as e:
+            fut.set_exception(e)
+            raise
+        finally:
+            del self._inflight[rid]
+        self.cache.set(rid, (fp, response))
+        self.replayed += replayed
+        return response, replayed
+
+    async def _insert(self, rid: str, fp: str):
+        now = datetime.now(timezone.utc)
+        await self.coll.insert_one({'_id': rid, 'fingerprint': fp, 'state': 'pending',
+                                    'locked_until': now + timedelta(seconds=self.lease),
+                                    'expires_at': now + timedelta(seconds=self.ttl)})
+
+    async def _claim(self, rid: str, fp: str, fn):
+        try:
+            await self._insert(rid, fp)
+        except DuplicateKeyError:
+            existing = await self._wait(rid, fp)
+            if existing is not None:
+                return existing, True
+        try:
+            response = await fn()
+        except BaseException:
+            await self.coll.delete_one({'_id': rid, 'state': 'pending'})
+            raise
+        await self.coll.update_one({'_id': rid}, {'$set': {'state': 'done', 'response': response},
+                                                  '$unset': {'locked_until': ''}})
+        return response, False
+
+    async def _wait(self, rid: str, fp: str):
+        # -> the stored response, or None once this worker owns the record
+        deadline = time.monotonic() + self.lease
+        while True:
+            rec = await self.coll.find_one({'_id': rid})
+            if rec is None:
+                try:
+                    await self._insert(rid, fp)
+                    return None
+                except DuplicateKeyError:
+                    continue
+            if rec['fingerprint'] != fp:
+                raise IdempotencyError(422, "Idempotency-Key was already used with a different request")
+            if rec['state'] == 'done':
+                return rec['response']
+            now = datetime.now(timezone.utc)
+            taken = await self.coll.update_one(
+                {'_id': rid, 'state': 'pending', 'locked_until': {'$lt': now}},
+                {'$set': {'locked_until': now + timedelta(seconds=self.lease)}})
+            if taken.modified_count:
+                return None
+            if time.monotonic() > deadline:
+                raise IdempotencyError(409, "A request with this Idempotency-Key is still in progress")
+            await asyncio.sleep(self.poll)
+
+    def stats(self) -> dict:
+        return {'inflight': len(self._inflight), 'replayed': self.replayed, 'cache': self.cache.stats()}
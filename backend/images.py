@@ -0,0 +1,107 @@
+import asyncio
+import hashlib
+import io
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+# width caps per variant; images are never upscaled
+VARIANTS = {'thumb': 160, 'card': 480, 'full': 1200}
+FORMATS = {'webp': ('WEBP', 'image/webp'), 'jpg': ('JPEG', 'image/jpeg')}
+ORIGINAL_FORMATS = {'JPEG': 'jpg', 'PNG': 'png', 'WEBP': 'webp', 'GIF': 'gif'}
+MAX_PIXELS = 40_000_000
+NAME_RE = re.compile(r'^([0-9a-f]{32})(?:-(thumb|card|full))?$')
+
+
+class ImageError(Exception):
+    pass
+
+
+def render_variants(data: bytes, root: str, digest: str) -> dict:
+    # Runs in a worker process. Writes every variant in both formats and
+    # returns the original's size.
+    Image.MAX_IMAGE_PIXELS = MAX_PIXELS
+    img = ImageOps.exif_transpose(Image.open(io.BytesIO(data)))
+    size = img.size
+    has_alpha = img.mode in ('RGBA', 'LA') or (img.mode == 'P' and 'transparency' in img.info)
+    img = img.convert('RGBA' if has_alpha else 'RGB')
+    for name, width in VARIANTS.items():
+        v = img.copy()
+        if v.width > width:
+            v.thumbnail((width, width * 10), Image.LANCZOS)
+        v.save(Path(root) / f'{digest}-{name}.webp', 'WEBP', quality=80, method=4)
+        flat = v
+        if has_alpha:
+            flat = Image.new('RGB', v.size, (255, 255, 255))
+            flat.paste(v, mask=v.getchannel('A'))
+        flat.save(Path(root) / f'{digest}-{name}.jpg', 'JPEG', quality=82, optimize=True, progressive=True)
+    return {'width': size[0], 'height': size[1]}
+
+
+class ImageStore:
+    # Content-addressed: a file's name is the hash of the uploaded bytes, so
+    # every URL is immutable and re-uploads are free.
+
+    def __init__(self, root: str, base_url: str = '/api/media', workers: int = None):
+        self.root = Path(root)
+        self.base_url = base_url.rstrip('/')
+        self.workers = workers or min(2, os.cpu_count() or 1)
+        self._pool = None
+
+    @property
+    def pool(self):
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        return self._pool
+
+    async def save(self, data: bytes) -> dict:
+        try:
+            Image.MAX_IMAGE_PIXELS = MAX_PIXELS
+            with Image.open(io.BytesIO(data)) as probe:
+                fmt = probe.format
+                probe.verify()
+        except (UnidentifiedImageError, OSError, Image.DecompressionBombError):
+            raise ImageError("Unsupported or corrupt image")
+        if fmt not in ORIGINAL_FORMATS:
+            raise ImageError(f"Unsupported image format: {fmt}")
+        digest = hashlib.blake2b(data, digest_size=16).hexdigest()
+        self.root.mkdir(parents=True, exist_ok=True)
+        original = self.root / f'{digest}.{ORIGINAL_FORMATS[fmt]}'
+        if not original.exists():
+            meta = await asyncio.get_running_loop().run_in_executor(
+                self.pool, render_variants, data, str(self.root), digest)
+            tmp = original.with_suffix('.tmp')
+            tmp.write_bytes(data)
+            tmp.replace(original)
+        else:
+            with Image.open(original) as im:
+                meta = {'width': im.width, 'height': im.height}
+        url = f'{self.base_url}/{digest}'
+        return {'id': digest, 'url': url, **meta,
+                'variants': {name: f'{url}-{name}' for name in VARIANTS}}
+
+    def resolve(self, name: str, accept: str = ''):
+        # -> (path, media type) of the variant to serve; webp when accepted
+        m = NAME_RE.match(name)
+        if not m:
+            return None
+        digest, variant = m.group(1), m.group(2) or 'full'
+        ext = 'webp' if 'image/webp' in (accept or '') else 'jpg'
+        path = self.root / f'{digest}-{variant}.{ext}'
+        return (path, FORMATS[ext][1]) if path.exists() else None
+
+    def variant_url(self, url: str, variant: str) -> str:
+        # Store URLs get the requested size; external URLs pass through.
+        if not isinstance(url, str) or not url.startswith(self.base_url + '/'):
+            return url
+        name = url[len(self.base_url) + 1:]
+        m = NAME_RE.match(name)
+        return f'{self.base_url}/{m.group(1)}-{variant}' if m else url
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False)
+            self._pool = None
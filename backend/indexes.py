@@ -0,0 +1,169 @@
+"""Index registry and query-shape report.
+
+    python indexes.py apply     # create any missing indexes
+    python indexes.py explain   # explain every route's query, exit 1 on COLLSCAN
+"""
+import logging
+import os
+import sys
+from pathlib import Path
+
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import OperationFailure
+
+logger = logging.getLogger(__name__)
+
+INDEXES = {
+    'users': [
+        IndexModel([('email', ASCENDING)], unique=True, name='email_unique'),
+        IndexModel([('role', ASCENDING), ('created_at', DESCENDING), ('_id', DESCENDING)], name='role_recent'),
+        IndexModel([('created_at', DESCENDING), ('_id', DESCENDING)], name='recent'),
+    ],
+    'carts': [
+        IndexModel([('user_id', ASCENDING)], unique=True, name='user_id_unique'),
+    ],
+    'orders': [
+        IndexModel([('user_id', ASCENDING), ('created_at', DESCENDING), ('_id', DESCENDING)], name='user_recent'),
+        IndexModel([('status', ASCENDING), ('created_at', DESCENDING), ('_id', DESCENDING)], name='status_recent'),
+        IndexModel([('delivery_partner_id', ASCENDING), ('created_at', DESCENDING), ('_id', DESCENDING)],
+                   name='partner_recent'),
+        IndexModel([('created_at', DESCENDING), ('_id', DESCENDING)], name='recent'),
+        IndexModel([('order_number', ASCENDING)], unique=True, name='order_number_unique'),
+    ],
+    'orders_archive': [
+        # not unique: archived legacy orders can share an RR<timestamp> number
+        IndexModel([('order_number', ASCENDING)], name='order_number'),
+        IndexModel([('user_id', ASCENDING), ('created_at', DESCENDING), ('_id', DESCENDING)], name='user_recent'),
+        IndexModel([('delivery_partner_id', ASCENDING), ('created_at', DESCENDING), ('_id', DESCENDING)],
+                   name='partner_recent'),
+        IndexModel([('created_at', DESCENDING), ('_id', DESCENDING)], name='recent'),
+        IndexModel([('month', ASCENDING)], name='month'),
+    ],
+    'products': [
+        IndexModel([('category_slug', ASCENDING)], name='category'),
+        IndexModel([('featured', ASCENDING), ('in_stock', ASCENDING)], name='featured_in_stock'),
+        IndexModel([('in_stock', ASCENDING)], name='in_stock'),
+        IndexModel([('stock', ASCENDING)], sparse=True, name='stock_tracked'),
+    ],
+    'categories': [
+        IndexModel([('order', ASCENDING)], name='order'),
+    ],
+    'idempotency_keys': [
+        IndexModel([('expires_at', ASCENDING)], expireAfterSeconds=0, name='expires_ttl'),
+    ],
+    'coupons': [
+        IndexModel([('code', ASCENDING)], unique=True, name='code_unique'),
+    ],
+}
+
+# indexes replaced by the ones above; dropped where they still exist
+OBSOLETE_INDEXES = {
+    'orders_archive': ['order_number_unique'],
+}
+
+PAGE_SORT = [('created_at', DESCENDING), ('_id', DESCENDING)]
+
+# (route, collection, filter, sort) for every query a handler issues on a hot path.
+QUERY_SHAPES = [
+    ('POST /auth/login', 'users', {'email': 'x@example.com'}, None),
+    ('POST /auth/register', 'users', {'email': 'x@example.com'}, None),
+    ('GET /admin/users', 'users', {}, PAGE_SORT),
+    ('GET /admin/delivery-partners', 'users', {'role': 'delivery_partner'}, PAGE_SORT),
+    ('GET /categories', 'categories', {}, [('order', ASCENDING)]),
+    ('GET /products', 'products', {'category_slug': 'milk-sweets'}, None),
+    ('GET /products/featured', 'products', {'featured': True, 'in_stock': True}, None),
+    ('GET /products/{pid}/recommendations', 'products', {'category_slug': 'milk-sweets'}, None),
+    ('POST /orders coupon', 'coupons', {'code': 'RASRAJ10'}, None),
+    ('stock levels refresh', 'products', {'stock': {'$exists': True}}, None),
+    ('GET /cart', 'carts', {'user_id': '0' * 24}, None),
+    ('GET /orders (admin)', 'orders', {}, PAGE_SORT),
+    ('GET /orders', 'orders', {'user_id': '0' * 24}, PAGE_SORT),
+    ('GET /delivery/orders (partner)', 'orders', {'delivery_partner_id': '0' * 24}, PAGE_SORT),
+    ('GET /delivery/orders (admin)', 'orders',
+     {'status': {'$in': ['accepted', 'preparing', 'packed', 'out_for_delivery']}}, PAGE_SORT),
+    ('GET /admin/dashboard recent', 'orders', {'status': {'$ne': 'cancelled'}}, PAGE_SORT),
+    ('GET /admin/dashboard low stock', 'products', {'in_stock': False}, None),
+    ('GET /orders archive', 'orders_archive', {'user_id': '0' * 24}, PAGE_SORT),
+    ('GET /orders/{oid} by number', 'orders_archive', {'order_number': 'RR100001'}, None),
+    ('archive sweep', 'orders', {'status': {'$in': ['delivered', 'cancelled']}, 'created_at': {'$lt': '2024-01-01'}},
+     [('created_at', ASCENDING)]),
+    ('recommendations mine', 'orders', {'status': {'$ne': 'cancelled'}, 'created_at': {'$gte': '2024-01-01'}},
+     [('created_at', ASCENDING)]),
+]
+
+
+async def ensure_indexes(db) -> list:
+    # create_indexes is a no-op for indexes that already exist with the same
+    # spec. One index per call, so a failing build (e.g. duplicates under a
+    # unique index) doesn't stop the others. -> [(collection, name)] that failed
+    for coll, names in OBSOLETE_INDEXES.items():
+        existing = await db[coll].index_information()
+        for name in set(names) & set(existing):
+            await db[coll].drop_index(name)
+    failed = []
+    for coll, models in INDEXES.items():
+        for m in models:
+            try:
+                await db[coll].create_indexes([m])
+            except OperationFailure as e:
+                logger.error("Index %s on %s failed: %s", m.document['name'], coll, e)
+                failed.append((coll, m.document['name']))
+    return failed
+
+
+def plan_stages(plan) -> list:
+    stages = [plan.get('stage')]
+    for key in ('inputStage', 'queryPlan'):
+        if key in plan:
+            stages += plan_stages(plan[key])
+    for child in plan.get('inputStages', []):
+        stages += plan_stages(child)
+    return stages
+
+
+def explain(db) -> int:
+    scans = 0
+    for route, coll, q, sort in QUERY_SHAPES:
+        cur = db[coll].find(q)
+        if sort:
+            cur = cur.sort(sort)
+        info = cur.explain()
+        stages = plan_stages(info['queryPlanner']['winningPlan'])
+        stats = info.get('executionStats', {})
+        flag = 'COLLSCAN' in stages
+        scans += flag
+        print(f"{'!!' if flag else 'ok'}  {route:<40} {coll:<11} {' > '.join(filter(None, stages)):<40} "
+              f"examined={stats.get('totalDocsExamined', '?')}")
+    return scans
+
+
+def main(cmd):
+    from dotenv import load_dotenv
+    from pymongo import MongoClient
+    load_dotenv(Path(__file__).parent / '.env')
+    db = MongoClient(os.environ['MONGO_URL'])[os.environ['DB_NAME']]
+    if cmd == 'apply':
+        for coll, names in OBSOLETE_INDEXES.items():
+            for name in set(names) & set(db[coll].index_information()):
+                print(coll, 'drop', name)
+                db[coll].drop_index(name)
+        failed = 0
+        for coll, models in INDEXES.items():
+            for m in models:
+                try:
+                    print(coll, db[coll].create_indexes([m]))
+                except OperationFailure as e:
+                    print(coll, m.document['name'], 'FAILED', e)
+                    failed += 1
+        return 1 if failed else 0
+    if cmd == 'explain':
+        scans = explain(db)
+        print(f"{scans} collection scan(s)")
+        return 1 if scans else 0
+    print(__doc__)
+    return 2
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(main(sys.argv[1] if len(sys.argv) > 1 else ''))
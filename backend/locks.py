@@ -0,0 +1,77 @@
+import asyncio
+import logging
+import os
+import socket
+import uuid
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone
+
+from pymongo.errors import DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+
+class LockTimeout(Exception):
+    pass
+
+
+class MongoLock:
+    # A lease held in one document per lock name. The holder renews it while
+    # it works, so a worker that dies mid-task only blocks the others until
+    # the lease runs out.
+
+    def __init__(self, coll, name: str, lease: float = 60, poll: float = 0.5):
+        self.coll = coll
+        self.name = name
+        self.lease = lease
+        self.poll = poll
+        self.owner = f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+
+    async def acquire(self) -> bool:
+        now = datetime.now(timezone.utc)
+        try:
+            # a held lock doesn't match the filter, so the upsert collides on _id
+            await self.coll.update_one(
+                {'_id': self.name, '$or': [{'expires_at': {'$lt': now}}, {'owner': self.owner}]},
+                {'$set': {'owner': self.owner, 'acquired_at': now, 'expires_at': now + timedelta(seconds=self.lease)}},
+                upsert=True)
+            return True
+        except DuplicateKeyError:
+            return False
+
+    async def release(self):
+        await self.coll.delete_one({'_id': self.name, 'owner': self.owner})
+
+    async def _renew(self):
+        while True:
+            await asyncio.sleep(self.lease / 3)
+            now = datetime.now(timezone.utc)
+            r = await self.coll.update_one({'_id': self.name, 'owner': self.owner},
+                                           {'$set': {'expires_at': now + timedelta(seconds=self.lease)}})
+            if not r.matched_count:
+                logger.warning("Lost lock %s", self.name)
+                return
+
+    @asynccontextmanager
+    async def hold(self, timeout: float = 120):
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while not await self.acquire():
+            if loop.time() > deadline:
+                raise LockTimeout(f"Timed out waiting for lock {self.name}")
+            await asyncio.sleep(self.poll)
+        try:
+            async with self.renewing():
+                yield
+        finally:
+            await self.release()
+
+    @asynccontextmanager
+    async def renewing(self):
+        # Keeps an acquired lease alive while the block runs, without
+        # releasing it afterwards, for a holder that means to keep it.
+        renew = asyncio.create_task(self._renew())
+        try:
+            yield
+        finally:
+            renew.cancel()
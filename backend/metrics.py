@@ -0,0 +1,200 @@
+import bisect
+import logging
+import threading
+import time
+from collections import defaultdict
+from contextvars import ContextVar
+
+from pymongo import monitoring
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 50)
+
+
+# ── REGISTRY ─────────────────────────────────────────────────────────────────
+
+def label_str(labels: tuple) -> str:
+    if not labels:
+        return ''
+    parts = ','.join(f'{k}="{str(v).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+                     for k, v in labels)
+    return '{' + parts + '}'
+
+
+class Counter:
+    def __init__(self, name: str, help: str):
+        self.name, self.help = name, help
+        self.values = defaultdict(float)
+
+    def inc(self, labels: tuple = (), n: float = 1):
+        self.values[labels] += n
+
+    def render(self):
+        yield f'# HELP {self.name} {self.help}'
+        yield f'# TYPE {self.name} counter'
+        for labels, v in sorted(self.values.items()):
+            yield f'{self.name}{label_str(labels)} {v:g}'
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, buckets=LATENCY_BUCKETS):
+        self.name, self.help, self.buckets = name, help, buckets
+        self.values = {}   # labels -> [bucket counts..., sum, count]
+
+    def observe(self, labels: tuple, v: float):
+        h = self.values.get(labels)
+        if h is None:
+            h = self.values[labels] = [0] * (len(self.buckets) + 2)
+        i = bisect.bisect_left(self.buckets, v)
+        if i < len(self.buckets):
+            h[i] += 1
+        h[-2] += v
+        h[-1] += 1
+
+    def render(self):
+        yield f'# HELP {self.name} {self.help}'
+        yield f'# TYPE {self.name} histogram'
+        for labels, h in sorted(self.values.items()):
+            acc = 0
+            for le, n in zip(self.buckets, h):
+                acc += n
+                yield f'{self.name}_bucket{label_str(labels + (("le", f"{le:g}"),))} {acc}'
+            yield f'{self.name}_bucket{label_str(labels + (("le", "+Inf"),))} {h[-1]}'
+            yield f'{self.name}_sum{label_str(labels)} {h[-2]:.6f}'
+            yield f'{self.name}_count{label_str(labels)} {h[-1]}'
+
+
+class Metrics:
+    # Mongo events arrive on Motor's executor threads, so updates go through a lock.
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = Counter('http_requests_total', 'HTTP requests by route, method and status.')
+        self.latency = Histogram('http_request_duration_seconds', 'HTTP request latency by route.')
+        self.req_commands = Histogram('http_request_mongo_commands', 'Mongo commands issued per request.',
+                                      COUNT_BUCKETS)
+        self.req_mongo_time = Histogram('http_request_mongo_seconds', 'Time spent in Mongo per request.')
+        self.commands = Counter('mongo_commands_total', 'Mongo commands by command and collection.')
+        self.command_failures = Counter('mongo_command_failures_total', 'Failed Mongo commands.')
+        self.command_latency = Histogram('mongo_command_duration_seconds', 'Mongo command round-trip time.')
+        self.documents = Counter('mongo_documents_returned_total', 'Documents returned by Mongo commands.')
+
+    def render(self) -> str:
+        with self.lock:
+            lines = []
+            for m in (self.requests, self.latency, self.req_commands, self.req_mongo_time,
+                      self.commands, self.command_failures, self.command_latency, self.documents):
+                lines.extend(m.render())
+        return '\n'.join(lines) + '\n'
+
+
+class RequestStats:
+    __slots__ = ('commands',)
+
+    def __init__(self):
+        self.commands = []   # (command, collection, seconds, documents)
+
+    def breakdown(self) -> str:
+        agg = defaultdict(lambda: [0, 0.0, 0])
+        for cmd, coll, secs, docs in self.commands:
+            a = agg[(cmd, coll)]
+            a[0] += 1
+            a[1] += secs
+            a[2] += docs
+        return ', '.join(f'{cmd} {coll} x{n} {secs * 1e3:.1f}ms {docs}docs'
+                         for (cmd, coll), (n, secs, docs) in sorted(agg.items(), key=lambda kv: -kv[1][1]))
+
+
+current_request: ContextVar = ContextVar('current_request', default=None)
+
+
+# ── MONGO ────────────────────────────────────────────────────────────────────
+
+def returned_docs(reply) -> int:
+    cursor = reply.get('cursor') if isinstance(reply, dict) else None
+    if cursor:
+        return len(cursor.get('firstBatch') or cursor.get('nextBatch') or [])
+    if isinstance(reply, dict) and reply.get('value') is not None:   # findAndModify
+        return 1
+    return 0
+
+
+class MongoListener(monitoring.CommandListener):
+    # Motor copies the caller's context into its executor threads, so the
+    # RequestStats set by MetricsMiddleware is visible here.
+
+    def __init__(self, metrics: Metrics):
+        self.metrics = metrics
+        self._colls = {}
+
+    def started(self, event):
+        coll = event.command.get(event.command_name)
+        if event.command_name == 'getMore':
+            coll = event.command.get('collection')
+        self._colls[(event.connection_id, event.request_id)] = coll if isinstance(coll, str) else ''
+
+    def succeeded(self, event):
+        self._record(event, returned_docs(event.reply))
+
+    def failed(self, event):
+        with self.metrics.lock:
+            self.metrics.command_failures.inc((('command', event.command_name),))
+        self._record(event, 0)
+
+    def _record(self, event, docs: int):
+        coll = self._colls.pop((event.connection_id, event.request_id), '')
+        secs = event.duration_micros / 1e6
+        labels = (('collection', coll), ('command', event.command_name))
+        with self.metrics.lock:
+            self.metrics.commands.inc(labels)
+            self.metrics.command_latency.observe((('command', event.command_name),), secs)
+            if docs:
+                self.metrics.documents.inc(labels, docs)
+        stats = current_request.get()
+        if stats is not None:
+            stats.commands.append((event.command_name, coll, secs, docs))
+
+
+# ── HTTP ─────────────────────────────────────────────────────────────────────
+
+class MetricsMiddleware:
+    # Plain ASGI middleware: unlike BaseHTTPMiddleware it does not buffer
+    # streaming responses. Long-lived routes (SSE) are passed through.
+
+    def __init__(self, app, metrics: Metrics, skip=(), slow_ms: float = 0):
+        self.app = app
+        self.metrics = metrics
+        self.skip = set(skip)
+        self.slow_ms = slow_ms
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or scope['path'] in self.skip:
+            return await self.app(scope, receive, send)
+        stats = RequestStats()
+        token = current_request.set(stats)
+        status = [500]
+
+        async def send_wrapper(message):
+            if message['type'] == 'http.response.start':
+                status[0] = message['status']
+            await send(message)
+
+        t = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - t
+            current_request.reset(token)
+            route = getattr(scope.get('route'), 'path', None) or 'unmatched'
+            method = scope['method']
+            mongo_secs = sum(c[2] for c in stats.commands)
+            with self.metrics.lock:
+                self.metrics.requests.inc((('method', method), ('route', route), ('status', status[0])))
+                self.metrics.latency.observe((('method', method), ('route', route)), elapsed)
+                self.metrics.req_commands.observe((('route', route),), len(stats.commands))
+                self.metrics.req_mongo_time.observe((('route', route),), mongo_secs)
+            if self.slow_ms and elapsed * 1e3 >= self.slow_ms:
+                logger.warning("Slow request %s %s %s %.1fms, %d mongo commands %.1fms: %s", method, route,
+                               status[0], elapsed * 1e3, len(stats.commands), mongo_secs * 1e3, stats.breakdown())
@@ -0,0 +1,59 @@
+import asyncio
+
+from pymongo import ReturnDocument
+
+
+class OrderNumberAllocator:
+    # Each worker reserves a block of `block_size` numbers from one atomic
+    # counter document and hands them out locally, so most orders cost no
+    # extra round trip. Unused numbers in a block are lost on restart, which
+    # leaves gaps but never duplicates.
+
+    def __init__(self, counters, name: str = 'order_number', block_size: int = 20,
+                 start: int = 100000, prefix: str = 'RR'):
+        self.counters = counters
+        self.name = name
+        self.block_size = block_size
+        self.start = start
+        self.prefix = prefix
+        self._next = 0
+        self._end = 0
+        self._lock = asyncio.Lock()
+
+    async def _reserve(self):
+        c = await self.counters.find_one_and_update(
+            {'_id': self.name}, {'$inc': {'seq': self.block_size}},
+            upsert=True, return_document=ReturnDocument.AFTER
+        )
+        self._end = self.start + c['seq']
+        self._next = self._end - self.block_size
+
+    async def next(self) -> str:
+        async with self._lock:
+            if self._next >= self._end:
+                await self._reserve()
+            n = self._next
+            self._next += 1
+        return f"{self.prefix}{n + 1}"
+
+
+async def renumber_duplicates(orders, allocator) -> int:
+    # Orders placed before the allocator were numbered RR<unix seconds>, so
+    # orders from the same second share a number and block the unique index.
+    # The oldest keeps it; the others get a fresh number and keep the old one
+    # as legacy_order_number. Each rename is conditional on the old number,
+    # so workers running this together don't renumber an order twice.
+    dupes = orders.aggregate([
+        {'$match': {'order_number': {'$type': 'string'}}},
+        {'$sort': {'created_at': 1, '_id': 1}},
+        {'$group': {'_id': '$order_number', 'ids': {'$push': '$_id'}, 'n': {'$sum': 1}}},
+        {'$match': {'n': {'$gt': 1}}},
+    ], allowDiskUse=True)
+    renamed = 0
+    async for g in dupes:
+        for oid in g['ids'][1:]:
+            r = await orders.update_one({'_id': oid, 'order_number': g['_id']},
+                                        {'$set': {'order_number': await allocator.next(),
+                                                  'legacy_order_number': g['_id']}})
+            renamed += r.modified_count
+    return renamed
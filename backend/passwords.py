@@ -0,0 +1,46 @@
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import bcrypt
+
+
+class PasswordHasher:
+    # bcrypt releases the GIL, so a small thread pool keeps hashing off the
+    # event loop while `workers` caps how many hashes run at once. The pool
+    # is started on first use and again after close().
+
+    def __init__(self, rounds: int = 12, workers: int = None):
+        self.rounds = rounds
+        self.workers = workers or min(4, os.cpu_count() or 1)
+        self._pool = None
+
+    @property
+    def pool(self):
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='bcrypt')
+        return self._pool
+
+    def hash_sync(self, password: str) -> str:
+        return bcrypt.hashpw(password.encode(), bcrypt.gensalt(self.rounds)).decode()
+
+    async def hash(self, password: str) -> str:
+        return await asyncio.get_running_loop().run_in_executor(self.pool, self.hash_sync, password)
+
+    async def verify(self, password: str, hashed: str) -> bool:
+        if not hashed:
+            return False
+        return await asyncio.get_running_loop().run_in_executor(
+            self.pool, bcrypt.checkpw, password.encode(), hashed.encode())
+
+    def needs_rehash(self, hashed: str) -> bool:
+        # "$2b$12$..." -> cost 12
+        try:
+            return int(hashed.split('$')[2]) != self.rounds
+        except (IndexError, ValueError):
+            return True
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False)
+            self._pool = None
@@ -0,0 +1,67 @@
+"""Local stand-in for the Razorpay Orders API, for offline checkout load tests.
+
+    STUB_LATENCY_MS=80 uvicorn payment_stub:app --port 9100
+    RAZORPAY_KEY_ID=rzp_test_stub RAZORPAY_KEY_SECRET=stub_secret \\
+        RAZORPAY_BASE_URL=http://localhost:9100/v1 uvicorn server:app
+
+POST /v1/stub/pay signs a payment for an order the way Checkout.js would, so
+/api/payment/verify can be exercised end to end.
+"""
+import asyncio
+import hashlib
+import hmac
+import os
+import random
+import time
+import uuid
+
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import JSONResponse
+
+KEY_SECRET = os.environ.get('STUB_KEY_SECRET', os.environ.get('RAZORPAY_KEY_SECRET', 'stub_secret'))
+LATENCY_MS = float(os.environ.get('STUB_LATENCY_MS', '50'))
+FAILURE_RATE = float(os.environ.get('STUB_FAILURE_RATE', '0'))
+
+app = FastAPI(title="Razorpay stub")
+orders = {}
+
+
+def error(status: int, description: str):
+    return JSONResponse({'error': {'code': 'BAD_REQUEST_ERROR', 'description': description}}, status_code=status)
+
+
+async def gateway_delay():
+    await asyncio.sleep(random.uniform(0.5, 1.5) * LATENCY_MS / 1000)
+    if random.random() < FAILURE_RATE:
+        raise HTTPException(503, "Injected failure")
+
+
+@app.post("/v1/orders")
+async def create_order(body: dict):
+    await gateway_delay()
+    if int(body.get('amount', 0)) < 100:
+        return error(400, 'Order amount less than minimum amount allowed')
+    o = {'id': f"order_{uuid.uuid4().hex[:14]}", 'entity': 'order', 'amount': int(body['amount']),
+         'amount_paid': 0, 'amount_due': int(body['amount']), 'currency': body.get('currency', 'INR'),
+         'receipt': body.get('receipt'), 'status': 'created', 'attempts': 0, 'created_at': int(time.time())}
+    orders[o['id']] = o
+    return o
+
+
+@app.get("/v1/orders/{oid}")
+async def get_order(oid: str):
+    await gateway_delay()
+    if oid not in orders:
+        return error(404, 'The id provided does not exist')
+    return orders[oid]
+
+
+@app.post("/v1/stub/pay")
+async def pay(body: dict):
+    oid = body['razorpay_order_id']
+    if oid not in orders:
+        return error(404, 'The id provided does not exist')
+    pid = f"pay_{uuid.uuid4().hex[:14]}"
+    orders[oid].update(status='paid', amount_paid=orders[oid]['amount'], amount_due=0)
+    sig = hmac.new(KEY_SECRET.encode(), f"{oid}|{pid}".encode(), hashlib.sha256).hexdigest()
+    return {'razorpay_order_id': oid, 'razorpay_payment_id': pid, 'razorpay_signature': sig}
@@ -0,0 +1,133 @@
+import asyncio
+import hashlib
+import hmac
+import logging
+import time
+import uuid
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+
+class GatewayError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+class GatewayUnavailable(Exception):
+    pass
+
+
+class CircuitBreaker:
+    # Opens after `threshold` consecutive failures and fails fast for `cooldown`
+    # seconds. Calls are then let through again, but a single further failure
+    # re-opens it until one succeeds.
+
+    def __init__(self, threshold: int = 5, cooldown: float = 30):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = 0.0
+
+    @property
+    def open(self) -> bool:
+        return self.failures >= self.threshold and time.monotonic() - self.opened_at < self.cooldown
+
+    def success(self):
+        self.failures = 0
+
+    def failure(self):
+        self.failures += 1
+        if self.failures >= self.threshold:
+            self.opened_at = time.monotonic()
+
+
+# raised before any byte of the request was sent
+NOT_SENT = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+IDEMPOTENT_METHODS = {'GET', 'HEAD', 'OPTIONS'}
+
+
+class RazorpayGateway:
+    # GETs are retried on any transport error or 5xx. Other calls are only
+    # retried when the request provably never reached Razorpay (or got a
+    # 429): after a read timeout the order may already exist, and a retry
+    # would create a second one.
+    mock = False
+
+    def __init__(self, key_id: str, key_secret: str, base_url: str = 'https://api.razorpay.com/v1',
+                 timeout: float = 10, retries: int = 2, max_connections: int = 20):
+        self.key_id = key_id
+        self.key_secret = key_secret
+        self.retries = retries
+        self.breaker = CircuitBreaker()
+        self.http = httpx.AsyncClient(
+            base_url=base_url, auth=(key_id, key_secret),
+            timeout=httpx.Timeout(timeout, connect=min(timeout, 5)),
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+        )
+
+    async def _request(self, method: str, path: str, **kw) -> dict:
+        if self.breaker.open:
+            raise GatewayUnavailable("Payment gateway unavailable")
+        safe = method.upper() in IDEMPOTENT_METHODS
+        for attempt in range(self.retries + 1):
+            try:
+                r = await self.http.request(method, path, **kw)
+            except httpx.TransportError as e:
+                logger.warning("Gateway %s %s failed: %r", method, path, e)
+                if not safe and not isinstance(e, NOT_SENT):
+                    break
+            else:
+                if r.status_code < 500 and r.status_code != 429:
+                    self.breaker.success()
+                    if r.status_code >= 400:
+                        try:
+                            message = r.json()['error']['description']
+                        except Exception:
+                            message = r.text
+                        raise GatewayError(r.status_code, message)
+                    return r.json()
+                logger.warning("Gateway %s %s returned %s", method, path, r.status_code)
+                if not safe and r.status_code != 429:
+                    break
+            if attempt < self.retries:
+                await asyncio.sleep(0.2 * 2 ** attempt)
+        self.breaker.failure()
+        raise GatewayUnavailable("Payment gateway unavailable")
+
+    async def create_order(self, amount_paise: int, currency: str = 'INR', receipt: str = None) -> dict:
+        body = {'amount': amount_paise, 'currency': currency, 'payment_capture': 1}
+        if receipt:
+            body['receipt'] = receipt
+        return await self._request('POST', '/orders', json=body)
+
+    def verify_signature(self, order_id: str, payment_id: str, signature: str) -> bool:
+        expected = hmac.new(self.key_secret.encode(), f"{order_id}|{payment_id}".encode(), hashlib.sha256).hexdigest()
+        return hmac.compare_digest(expected, signature or '')
+
+    async def close(self):
+        await self.http.aclose()
+
+
+class MockGateway:
+    # Used when no Razorpay keys are configured; the frontend skips the
+    # checkout widget when it sees `mock`.
+    mock = True
+    key_id = ''
+
+    async def create_order(self, amount_paise: int, currency: str = 'INR', receipt: str = None) -> dict:
+        return {'id': f'mock_order_{uuid.uuid4().hex[:12]}', 'amount': amount_paise, 'currency': currency, 'mock': True}
+
+    def verify_signature(self, order_id: str, payment_id: str, signature: str) -> bool:
+        return True
+
+    async def close(self):
+        pass
+
+
+def make_gateway(key_id: str, key_secret: str, base_url: str = None, **kw):
+    if not key_id or not key_secret:
+        return MockGateway()
+    return RazorpayGateway(key_id, key_secret, base_url or 'https://api.razorpay.com/v1', **kw)
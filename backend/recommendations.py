@@ -0,0 +1,191 @@
+"""Co-purchase recommendations.
+
+Orders are mined into a sparse product x product co-occurrence matrix and the
+top neighbours of every product are written to the `recommendations`
+collection, padded from the product's category when there is not enough
+purchase history. The API serves that table from memory.
+
+    python recommendations.py build     # full rebuild from every order
+
+Only one process builds at a time: the CLI and, with RECS_REFRESH_INTERVAL
+set, the one API worker that holds the `recommendations` lock.
+"""
+import logging
+import os
+import sys
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import numpy as np
+from scipy import sparse
+
+from archive import unpack
+from locks import LockTimeout, MongoLock
+
+logger = logging.getLogger(__name__)
+
+OVERLAP = timedelta(minutes=5)
+LOCK_NAME = 'recommendations'
+
+
+class CoPurchaseMatrix:
+    # Counts are accumulated, so refresh() only has to read orders placed
+    # since the last run. Cancelled orders are skipped when mined but not
+    # subtracted if they are cancelled later.
+
+    def __init__(self):
+        self.ids = []                      # column -> product id
+        self.col = {}                      # product id -> column
+        self.counts = sparse.csr_matrix((0, 0), dtype=np.float32)
+        self.support = np.zeros(0, dtype=np.float32)
+        self.watermark = None              # created_at of the newest mined order
+        self._recent = {}                  # order id -> created_at, inside OVERLAP
+        self.archive_mined = False
+
+    def _columns(self, pids):
+        for pid in pids:
+            if pid not in self.col:
+                self.col[pid] = len(self.ids)
+                self.ids.append(pid)
+        n = len(self.ids)
+        if self.counts.shape[0] < n:
+            self.counts.resize((n, n))
+            self.support = np.pad(self.support, (0, n - len(self.support)))
+
+    def ingest(self, baskets: list):
+        baskets = [set(b) for b in baskets if b]
+        if not baskets:
+            return
+        self._columns(pid for b in baskets for pid in b)
+        rows = np.repeat(np.arange(len(baskets)), [len(b) for b in baskets])
+        cols = np.fromiter((self.col[pid] for b in baskets for pid in b), dtype=np.int64, count=len(rows))
+        x = sparse.csr_matrix((np.ones(len(rows), dtype=np.float32), (rows, cols)),
+                              shape=(len(baskets), len(self.ids)))
+        self.counts = (self.counts + x.T @ x).tocsr()
+        self.support += np.asarray(x.sum(axis=0)).ravel()
+
+    def scores(self):
+        # cosine-normalised co-occurrence: c_ij / sqrt(n_i * n_j), diagonal dropped
+        c = self.counts.tolil()
+        c.setdiag(0)
+        c = c.tocsr()
+        c.eliminate_zeros()
+        inv = sparse.diags(1 / np.sqrt(np.maximum(self.support, 1)))
+        return (inv @ c @ inv).tocsr()
+
+    def neighbours(self, n: int) -> dict:
+        s = self.scores()
+        out = {}
+        for i, pid in enumerate(self.ids):
+            lo, hi = s.indptr[i], s.indptr[i + 1]
+            if lo == hi:
+                continue
+            data, idx = s.data[lo:hi], s.indices[lo:hi]
+            top = np.argsort(-data, kind='stable')[:n]
+            out[pid] = [self.ids[j] for j in idx[top]]
+        return out
+
+    def popularity(self) -> dict:
+        return {pid: float(self.support[i]) for i, pid in enumerate(self.ids)}
+
+
+def category_fallback(pid: str, products: dict, n: int, exclude=(), popularity: dict = None) -> list:
+    cat = products.get(pid, {}).get('category_slug')
+    popularity = popularity or {}
+    pool = [q for q, p in products.items()
+            if q != pid and q not in exclude and p.get('category_slug') == cat and p.get('in_stock', True)]
+    pool.sort(key=lambda q: (-popularity.get(q, 0), not products[q].get('featured'), products[q].get('name', '')))
+    return pool[:n]
+
+
+def build_table(matrix: CoPurchaseMatrix, products: dict, n: int = 8) -> dict:
+    # products: id -> product doc. Every product gets a row.
+    co = matrix.neighbours(n)
+    pop = matrix.popularity()
+    table = {}
+    for pid in products:
+        recs = [q for q in co.get(pid, []) if q in products][:n]
+        if len(recs) < n:
+            recs += category_fallback(pid, products, n - len(recs), set(recs), pop)
+        table[pid] = recs
+    return table
+
+
+async def mine(orders, matrix: CoPurchaseMatrix, batch: int = 5000, archive=None) -> int:
+    # Reads orders newer than the watermark (minus an overlap for writes that
+    # committed late) and feeds their baskets to the matrix. A first run also
+    # reads the order archive, which only ever receives old orders.
+    if archive is not None and not matrix.archive_mined:
+        matrix.archive_mined = True
+        baskets = []
+        async for a in archive.find({'status': {'$ne': 'cancelled'}}, {'data': 1}).batch_size(batch):
+            baskets.append({i['product_id'] for i in unpack(a).get('items', []) if i.get('product_id')})
+            if len(baskets) >= batch:
+                matrix.ingest(baskets)
+                baskets = []
+        matrix.ingest(baskets)
+    q = {'status': {'$ne': 'cancelled'}}
+    if matrix.watermark:
+        since = (datetime.fromisoformat(matrix.watermark) - OVERLAP).isoformat()
+        q['created_at'] = {'$gte': since}
+    cursor = orders.find(q, {'items.product_id': 1, 'created_at': 1}).sort('created_at', 1).batch_size(batch)
+    baskets, mined = [], 0
+    async for o in cursor:
+        oid = str(o['_id'])
+        if oid in matrix._recent:
+            continue
+        matrix._recent[oid] = o['created_at']
+        if not matrix.watermark or o['created_at'] > matrix.watermark:
+            matrix.watermark = o['created_at']
+        baskets.append({i['product_id'] for i in o.get('items', []) if i.get('product_id')})
+        mined += 1
+        if len(baskets) >= batch:
+            matrix.ingest(baskets)
+            baskets = []
+    matrix.ingest(baskets)
+    if matrix.watermark:
+        cutoff = (datetime.fromisoformat(matrix.watermark) - OVERLAP).isoformat()
+        matrix._recent = {k: v for k, v in matrix._recent.items() if v >= cutoff}
+    return mined
+
+
+async def save_table(coll, table: dict):
+    from pymongo import ReplaceOne
+    now = datetime.now(timezone.utc).isoformat()
+    ops = [ReplaceOne({'_id': pid}, {'recs': recs, 'updated_at': now}, upsert=True) for pid, recs in table.items()]
+    if ops:
+        await coll.bulk_write(ops, ordered=False)
+    await coll.delete_many({'_id': {'$nin': list(table)}})
+
+
+async def load_table(coll) -> dict:
+    return {d['_id']: d['recs'] async for d in coll.find({})}
+
+
+async def main(cmd):
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+    load_dotenv(Path(__file__).parent / '.env')
+    db = AsyncIOMotorClient(os.environ['MONGO_URL'])[os.environ['DB_NAME']]
+    if cmd != 'build':
+        print(__doc__)
+        return 2
+    matrix = CoPurchaseMatrix()
+    try:
+        async with MongoLock(db.locks, LOCK_NAME).hold(timeout=60):
+            mined = await mine(db.orders, matrix, archive=db.orders_archive)
+            products = {str(p['_id']): p async for p in db.products.find({}, {'category_slug': 1, 'in_stock': 1,
+                                                                              'featured': 1, 'name': 1})}
+            table = build_table(matrix, products)
+            await save_table(db.recommendations, table)
+    except LockTimeout:
+        print("another process is building recommendations (an API worker with RECS_REFRESH_INTERVAL set?)")
+        return 1
+    print(f"mined {mined} orders, {len(matrix.ids)} products with history, wrote {len(table)} rows")
+    return 0
+
+
+if __name__ == '__main__':
+    import asyncio
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(asyncio.run(main(sys.argv[1] if len(sys.argv) > 1 else '')))
@@ -0,0 +1,212 @@
+import re
+import time
+import unicodedata
+import heapq
+from bisect import bisect_left
+from collections import defaultdict
+
+# ── TRANSLITERATION ──────────────────────────────────────────────────────────
+# Devanagari is romanized and both scripts are folded to a loose phonetic key,
+# so "kaju", "kaaju" and "काजू" all land on the same index term.
+
+VOWELS = {'अ': 'a', 'आ': 'aa', 'इ': 'i', 'ई': 'ee', 'उ': 'u', 'ऊ': 'oo', 'ऋ': 'ri',
+          'ए': 'e', 'ऐ': 'ai', 'ओ': 'o', 'औ': 'au', 'ऑ': 'o'}
+MATRAS = {'ा': 'aa', 'ि': 'i', 'ी': 'ee', 'ु': 'u', 'ू': 'oo', 'ृ': 'ri', 'े': 'e',
+          'ै': 'ai', 'ो': 'o', 'ौ': 'au', 'ॉ': 'o', 'ॅ': 'e'}
+CONSONANTS = {'क': 'k', 'ख': 'kh', 'ग': 'g', 'घ': 'gh', 'ङ': 'n', 'च': 'ch', 'छ': 'chh',
+              'ज': 'j', 'झ': 'jh', 'ञ': 'n', 'ट': 't', 'ठ': 'th', 'ड': 'd', 'ढ': 'dh',
+              'ण': 'n', 'त': 't', 'थ': 'th', 'द': 'd', 'ध': 'dh', 'न': 'n', 'प': 'p',
+              'फ': 'ph', 'ब': 'b', 'भ': 'bh', 'म': 'm', 'य': 'y', 'र': 'r', 'ल': 'l',
+              'व': 'v', 'श': 'sh', 'ष': 'sh', 'स': 's', 'ह': 'h'}
+NUKTA = {'ड': 'r', 'ढ': 'rh', 'क': 'q', 'ख': 'kh', 'ग': 'g', 'ज': 'z', 'फ': 'f', 'य': 'y'}
+NASALS = {'ं': 'n', 'ँ': 'n', 'ः': 'h'}
+VIRAMA, NUKTA_SIGN = '्', '़'
+
+TOKEN_RE = re.compile(r'[a-z0-9]+|[ऀ-ॿ]+')
+FOLDS = [('chh', 'c'), ('ee', 'i'), ('oo', 'u'), ('aa', 'a'), ('iy', 'i'), ('ph', 'f'),
+         ('w', 'v'), ('z', 'j'), ('q', 'k'), ('ck', 'k'), ('x', 'ks')]
+ASPIRATE_RE = re.compile(r'([bcdgjkpst])h')
+REPEAT_RE = re.compile(r'(.)\1+')
+
+
+def romanize(word: str) -> str:
+    # out holds (text, kind): C consonant, V vowel, A inherent schwa, N nasal
+    out, last = [], None
+    for ch in unicodedata.normalize('NFD', word):
+        pending = bool(out) and out[-1][1] == 'C'
+        if ch == NUKTA_SIGN:
+            if pending and last in NUKTA:
+                out[-1] = (NUKTA[last], 'C')
+            continue
+        if ch in MATRAS:
+            out.append((MATRAS[ch], 'V'))
+            continue
+        if ch == VIRAMA:
+            out.append(('', 'X'))
+            continue
+        if pending:
+            out.append(('a', 'A'))
+        if ch in CONSONANTS:
+            out.append((CONSONANTS[ch], 'C'))
+            last = ch
+        elif ch in VOWELS:
+            out.append((VOWELS[ch], 'V'))
+        elif ch in NASALS:
+            out.append((NASALS[ch], 'N'))
+    # word-final schwa is silent, and so is a medial one in a VC_CV context
+    kinds = [k for _, k in out]
+    for i, k in enumerate(kinds):
+        if k == 'A' and 1 < i < len(kinds) - 2 and kinds[i - 2] in 'VA' \
+                and kinds[i + 1] == 'C' and kinds[i + 2] in 'VA':
+            kinds[i] = 'X'
+    return ''.join(t for (t, _), k in zip(out, kinds) if k != 'X')
+
+
+def fold(word: str) -> str:
+    for a, b in FOLDS:
+        word = word.replace(a, b)
+    word = ASPIRATE_RE.sub(r'\1', word)
+    return REPEAT_RE.sub(r'\1', word)
+
+
+def terms(text: str) -> list:
+    if not text:
+        return []
+    text = unicodedata.normalize('NFKC', text).lower()
+    out = []
+    for t in TOKEN_RE.findall(text):
+        if 'ऀ' <= t[0] <= 'ॿ':
+            t = romanize(t)
+        t = fold(t)
+        if len(t) >= 2:
+            out.append(t)
+    return out
+
+
+def trigrams(term: str) -> set:
+    t = f'#{term}#'
+    return {t[i:i + 3] for i in range(len(t) - 2)}
+
+
+# ── INDEX ────────────────────────────────────────────────────────────────────
+
+class SearchIndex:
+    FIELDS = {'name': 3.0, 'name_hi': 3.0, 'description': 1.0, 'description_hi': 0.5}
+    PREFIX_SCORE = 0.7
+    FUZZY_SCORE = 0.5
+    MIN_SIMILARITY = 0.35
+
+    def __init__(self):
+        self.docs = {}
+        self.built_at = 0.0
+        self._postings = defaultdict(dict)   # term -> {pid: weight}
+        self._doc_terms = {}                 # pid -> set(term)
+        self._grams = defaultdict(set)       # trigram -> set(term)
+        self._sorted = []
+        self._dirty = False
+        self._pending = None                 # pid -> doc or None, while a replacement is built
+
+    def rebuild(self, products):
+        self.__init__()
+        for p in products:
+            self.upsert(p)
+        self.built_at = time.monotonic()
+
+    @classmethod
+    def build(cls, products) -> "SearchIndex":
+        idx = cls()
+        idx.rebuild(products)
+        return idx
+
+    def begin_replace(self):
+        # Records writes made while a replacement is built from an older read.
+        self._pending = {}
+
+    def replace(self, fresh: "SearchIndex"):
+        pending, self._pending = self._pending or {}, None
+        self.__dict__.update(fresh.__dict__)
+        for pid, p in pending.items():
+            if p is None:
+                self.remove(pid)
+            else:
+                self.upsert(p)
+
+    def age(self) -> float:
+        return time.monotonic() - self.built_at
+
+    def upsert(self, p):
+        pid = p['id']
+        self.remove(pid)
+        if self._pending is not None:
+            self._pending[pid] = p
+        self.docs[pid] = p
+        weights = {}
+        for field, w in self.FIELDS.items():
+            for t in terms(p.get(field)):
+                weights[t] = max(weights.get(t, 0), w)
+        for t, w in weights.items():
+            if t not in self._postings:
+                self._dirty = True
+                for g in trigrams(t):
+                    self._grams[g].add(t)
+            self._postings[t][pid] = w
+        self._doc_terms[pid] = set(weights)
+
+    def remove(self, pid):
+        if self._pending is not None:
+            self._pending[pid] = None
+        self.docs.pop(pid, None)
+        for t in self._doc_terms.pop(pid, ()):
+            posting = self._postings[t]
+            posting.pop(pid, None)
+            if not posting:
+                del self._postings[t]
+                self._dirty = True
+                for g in trigrams(t):
+                    self._grams[g].discard(t)
+
+    def _expand(self, qt) -> dict:
+        if self._dirty:
+            self._sorted = sorted(self._postings)
+            self._dirty = False
+        out = {}
+        if qt in self._postings:
+            out[qt] = 1.0
+        i = bisect_left(self._sorted, qt)
+        while i < len(self._sorted) and self._sorted[i].startswith(qt):
+            out.setdefault(self._sorted[i], self.PREFIX_SCORE)
+            i += 1
+        if not out and len(qt) >= 3:
+            qg = trigrams(qt)
+            shared = defaultdict(int)
+            for g in qg:
+                for t in self._grams.get(g, ()):
+                    shared[t] += 1
+            for t, n in shared.items():
+                sim = n / (len(qg) + len(trigrams(t)) - n)
+                if sim >= self.MIN_SIMILARITY:
+                    out[t] = self.FUZZY_SCORE * sim
+        return out
+
+    def search(self, query: str, category: str = None, featured: bool = None, limit: int = 50) -> list:
+        qts = list(dict.fromkeys(terms(query)))
+        if not qts:
+            return []
+        scores = None
+        for qt in qts:
+            best = defaultdict(float)
+            for t, mult in self._expand(qt).items():
+                for pid, w in self._postings[t].items():
+                    best[pid] = max(best[pid], mult * w)
+            scores = best if scores is None else {pid: s + best[pid] for pid, s in scores.items() if pid in best}
+            if not scores:
+                return []
+        hits = []
+        for pid, s in scores.items():
+            p = self.docs[pid]
+            if category and p.get('category_slug') != category:
+                continue
+            if featured is not None and bool(p.get('featured')) != featured:
+                continue
+            hits.append((-s, not p.get('featured'), p.get('name', ''), pid))
+        return [dict(self.docs[h[3]]) for h in heapq.nsmallest(limit, hits)]
@@ -1,34 +1,118 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, Request, Response, Query, File, UploadFile, Header
+from fastapi.responses import StreamingResponse, FileResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from pydantic import BaseModel
-from typing import Optional, List
+from pydantic import BaseModel, TypeAdapter, ValidationError, NonNegativeInt, NonNegativeFloat, PositiveInt
+from typing import Optional, List, Literal
+from types import MappingProxyType
 from bson import ObjectId
+from pymongo import ReturnDocument, InsertOne, UpdateOne
+from pymongo.errors import DuplicateKeyError, BulkWriteError
 import os
+import asyncio
+import base64
+import csv
+import io
+import json
+import importlib.util
 import jwt
-import bcrypt
 import httpx
-import razorpay
 from datetime import datetime, timezone, timedelta
 from motor.motor_asyncio import AsyncIOMotorClient
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 import logging
+from contextlib import asynccontextmanager
 from pathlib import Path
+from caching import CatalogCache, TTLCache, etag_matches, dumps, pick_encoding, compress, COMPRESS_MIN_SIZE
+from passwords import PasswordHasher
+from search import SearchIndex
+from indexes import ensure_indexes
+from order_numbers import OrderNumberAllocator, renumber_duplicates
+from payments import GatewayError, GatewayUnavailable, make_gateway
+from events import OrderEvents, watch_orders
+from images import ImageStore, ImageError
+from archive import archive_orders, unpack
+from bulk_import import RowError, records, normalize, PRICE_KEYS
+from coupons import Coupon, CouponBook, CouponError, DEFAULT_COUPONS, redeem, release
+from idempotency import IdempotencyError, IdempotencyStore
+from locks import LockTimeout, MongoLock
+from stock import OutOfStock, StockLevels, WEIGHT_KEYS, demand, reserve, unreserve, stock_doc
+from metrics import Metrics, MongoListener, MetricsMiddleware
+from recommendations import LOCK_NAME as RECS_LOCK, CoPurchaseMatrix, build_table, category_fallback, mine, save_table, load_table
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
-client = AsyncIOMotorClient(os.environ['MONGO_URL'])
-db = client[os.environ['DB_NAME']]
+metrics = Metrics()
+client = None   # set by connect() at startup, after any worker fork
+db = None
 
 JWT_SECRET = os.environ.get('JWT_SECRET', 'rasraj_jwt_secret_2024')
 JWT_ALGO = "HS256"
 RAZORPAY_KEY_ID = os.environ.get('RAZORPAY_KEY_ID', '')
 RAZORPAY_KEY_SECRET = os.environ.get('RAZORPAY_KEY_SECRET', '')
+RAZORPAY_BASE_URL = os.environ.get('RAZORPAY_BASE_URL')
+RAZORPAY_TIMEOUT = float(os.environ.get('RAZORPAY_TIMEOUT', '10'))
+GOOGLE_SESSION_URL = os.environ.get('GOOGLE_SESSION_URL', 'https://demobackend.emergentagent.com/auth/v1/env/oauth/session-data')
+GOOGLE_SESSION_TTL = float(os.environ.get('GOOGLE_SESSION_TTL', '60'))
+ORDER_EVENTS_SOURCE = os.environ.get('ORDER_EVENTS_SOURCE', 'local')  # local | changestream
+SSE_QUEUE_SIZE = int(os.environ.get('SSE_QUEUE_SIZE', '100'))
+SSE_HEARTBEAT = float(os.environ.get('SSE_HEARTBEAT', '15'))
+CATALOG_CACHE_TTL = float(os.environ.get('CATALOG_CACHE_TTL', '60'))
+USER_CACHE_TTL = float(os.environ.get('USER_CACHE_TTL', '30'))
+USER_CACHE_SIZE = int(os.environ.get('USER_CACHE_SIZE', '10000'))
+BCRYPT_ROUNDS = int(os.environ.get('BCRYPT_ROUNDS', '12'))
+BCRYPT_WORKERS = int(os.environ.get('BCRYPT_WORKERS', '0')) or None
+SEARCH_INDEX_TTL = float(os.environ.get('SEARCH_INDEX_TTL', '300'))
+ORDER_NUMBER_BLOCK = int(os.environ.get('ORDER_NUMBER_BLOCK', '20'))
+COUPON_CACHE_TTL = float(os.environ.get('COUPON_CACHE_TTL', '60'))
+RECS_REFRESH_INTERVAL = float(os.environ.get('RECS_REFRESH_INTERVAL', '0'))  # 0: only reload the table
+RECS_SIZE = int(os.environ.get('RECS_SIZE', '8'))
+SLOW_REQUEST_MS = float(os.environ.get('SLOW_REQUEST_MS', '0'))  # 0: off
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+MEDIA_ROOT = os.environ.get('MEDIA_ROOT', str(ROOT_DIR / 'media'))
+MEDIA_BASE_URL = os.environ.get('MEDIA_BASE_URL', '/api/media')
+IMAGE_WORKERS = int(os.environ.get('IMAGE_WORKERS', '0')) or None
+ARCHIVE_AFTER_DAYS = float(os.environ.get('ARCHIVE_AFTER_DAYS', '90'))  # 0: never archive
+ARCHIVE_INTERVAL = float(os.environ.get('ARCHIVE_INTERVAL', '3600'))
+MAX_IMAGE_BYTES = int(os.environ.get('MAX_IMAGE_BYTES', str(10 * 1024 * 1024)))
+IDEMPOTENCY_TTL = float(os.environ.get('IDEMPOTENCY_TTL', '86400'))
+STOCK_CACHE_TTL = float(os.environ.get('STOCK_CACHE_TTL', '5'))
+MONGO_MAX_POOL_SIZE = int(os.environ.get('MONGO_MAX_POOL_SIZE', '100'))
+MONGO_MIN_POOL_SIZE = int(os.environ.get('MONGO_MIN_POOL_SIZE', '0'))
+MONGO_MAX_IDLE_MS = int(os.environ.get('MONGO_MAX_IDLE_MS', '0')) or None
+MONGO_CONNECT_TIMEOUT_MS = int(os.environ.get('MONGO_CONNECT_TIMEOUT_MS', '5000'))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.environ.get('MONGO_SERVER_SELECTION_TIMEOUT_MS', '5000'))
+MONGO_SOCKET_TIMEOUT_MS = int(os.environ.get('MONGO_SOCKET_TIMEOUT_MS', '0')) or None
+MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.environ.get('MONGO_WAIT_QUEUE_TIMEOUT_MS', '0')) or None
+MONGO_READ_PREFERENCE = os.environ.get('MONGO_READ_PREFERENCE', 'primary')
+BOOTSTRAP_LOCK_LEASE = float(os.environ.get('BOOTSTRAP_LOCK_LEASE', '60'))
+BOOTSTRAP_LOCK_WAIT = float(os.environ.get('BOOTSTRAP_LOCK_WAIT', '300'))
+READY_TIMEOUT = float(os.environ.get('READY_TIMEOUT', '2'))
 
-app = FastAPI(title="RAS RAJ API")
 api_router = APIRouter(prefix="/api")
 security = HTTPBearer(auto_error=False)
+catalog = CatalogCache(ttl=CATALOG_CACHE_TTL)
+principals = TTLCache(maxsize=USER_CACHE_SIZE, ttl=USER_CACHE_TTL)
+hasher = PasswordHasher(rounds=BCRYPT_ROUNDS, workers=BCRYPT_WORKERS)
+search_index = SearchIndex()
+search_lock = asyncio.Lock()
+search_refresh = None   # background rebuild started by refresh_search()
+order_numbers = OrderNumberAllocator(None, block_size=ORDER_NUMBER_BLOCK)
+gateway = None      # HTTP clients are opened by startup() and closed by shutdown()
+oauth_http = None
+google_sessions = TTLCache(maxsize=1000, ttl=GOOGLE_SESSION_TTL)
+google_inflight = {}
+order_events = OrderEvents(maxsize=SSE_QUEUE_SIZE)
+coupon_book = CouponBook(ttl=COUPON_CACHE_TTL)
+rec_matrix = CoPurchaseMatrix()
+images = ImageStore(MEDIA_ROOT, MEDIA_BASE_URL, workers=IMAGE_WORKERS)
+rec_table = {}
+recs_lock = None    # MongoLock for the one worker that mines orders, see refresh_recommendations()
+idempotency = IdempotencyStore(None, ttl=IDEMPOTENCY_TTL)
+stock_levels = StockLevels(ttl=STOCK_CACHE_TTL, on_change=catalog.invalidate)
+background_tasks = []
+ready = asyncio.Event()
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -49,15 +133,137 @@ def make_token(uid: str, role: str) -> str:
         JWT_SECRET, algorithm=JWT_ALGO
     )
 
+def json_response(request: Request, data=None, body: bytes = None, headers: dict = None, encode=compress):
+    # Serializes with orjson (when installed) and skips FastAPI's
+    # jsonable_encoder; bodies over COMPRESS_MIN_SIZE are brotli/gzip encoded.
+    body = dumps(data) if body is None else body
+    headers = {**(headers or {}), 'Vary': 'Accept-Encoding'}
+    if len(body) >= COMPRESS_MIN_SIZE:
+        enc = pick_encoding(request.headers.get('accept-encoding'))
+        if enc:
+            body = encode(body, enc)
+            headers['Content-Encoding'] = enc
+    return Response(body, media_type='application/json', headers=headers)
+
+async def cached_json(request: Request, key: str, loader):
+    e = await catalog.get(key, loader)
+    if e.body is None:
+        raise HTTPException(404, "Not found")
+    headers = {'ETag': e.etag, 'Cache-Control': 'no-cache'}
+    if etag_matches(request.headers.get('if-none-match'), e.etag):
+        return Response(status_code=304, headers=headers)
+    return json_response(request, body=e.body, headers=headers, encode=lambda _, enc: e.encoded(enc))
+
+# Default list projections keep grids and order lists lean; `fields=a,b`
+# selects top-level fields instead and `fields=*` returns whole documents.
+# They are shared, so they are frozen; find() gets a copy, as drivers may
+# add _id to the projection they are handed.
+PRODUCT_LIST_PROJECTION = MappingProxyType({'description': 0, 'description_hi': 0, 'ingredients': 0,
+                                            'shelf_life': 0, 'created_at': 0, 'stock': 0, 'images': {'$slice': 1}})
+ORDER_LIST_PROJECTION = MappingProxyType({'status_history': 0})
+PRODUCT_FIELDS = {'id', 'name', 'name_hi', 'description', 'description_hi', 'category_slug', 'prices', 'images',
+                  'ingredients', 'shelf_life', 'in_stock', 'featured', 'badge', 'stock', 'created_at'}
+ORDER_FIELDS = {'id', 'order_number', 'user_id', 'user_name', 'user_email', 'user_phone', 'items', 'address',
+                'delivery_type', 'payment_method', 'coupon_code', 'subtotal', 'delivery_charge', 'discount', 'total',
+                'status', 'status_history', 'notes', 'delivery_partner_id', 'razorpay_payment_id',
+                'razorpay_order_id', 'stock_reserved', 'created_at'}
+
+def parse_fields(fields: Optional[str], allowed: set, default: dict):
+    if fields is None:
+        return dict(default)
+    if fields.strip() == '*':
+        return None
+    names = {f.strip() for f in fields.split(',') if f.strip()}
+    if names - allowed:
+        raise HTTPException(400, f"Unknown fields: {', '.join(sorted(names - allowed))}")
+    return {n: 1 for n in names if n != 'id'} or {'_id': 1}
+
+def sized(p: dict, variant: str) -> dict:
+    # Points uploaded images at the variant a view needs: card for lists,
+    # full for product pages. External URLs are left alone.
+    if not p or not p.get('images'):
+        return p
+    return {**p, 'images': [images.variant_url(u, variant) for u in p['images']]}
+
+def with_stock(p: dict) -> dict:
+    # Storefront views get the sold-out weights, not the live counts, so
+    # cached listings only change when a weight sells out or comes back.
+    if not p:
+        return p
+    return {**{k: v for k, v in p.items() if k != 'stock'}, 'sold_out': stock_levels.sold_out(p['id'])}
+
+def inclusive(projection: Optional[dict]) -> bool:
+    # {'_id': 1} on its own (fields=id) is inclusive too; next to exclusions
+    # it only keeps the id
+    if not projection:
+        return False
+    rest = [v for k, v in projection.items() if k != '_id']
+    return any(v == 1 for v in rest) if rest else projection.get('_id') == 1
+
+def project(d: dict, projection: Optional[dict]) -> dict:
+    # Applies a Mongo-style projection to an in-memory document.
+    if not projection:
+        return d
+    if inclusive(projection):
+        return {k: v for k, v in d.items() if k in projection or k in ('id', '_id')}
+    d = {k: v for k, v in d.items() if projection.get(k) != 0}
+    for k, v in projection.items():
+        if isinstance(v, dict) and '$slice' in v and isinstance(d.get(k), list):
+            d[k] = d[k][:v['$slice']]
+    return d
+
+async def load_user(uid: str):
+    u = principals.get(uid)
+    if u is None:
+        u = doc(await db.users.find_one({'_id': ObjectId(uid)}))
+        if u:
+            principals.set(uid, u)
+    return dict(u) if u else None
+
+# Keyset pagination over (created_at, _id), newest first. The continuation
+# token is returned in the X-Next-Cursor header so list bodies stay arrays.
+PAGE_SORT = [('created_at', -1), ('_id', -1)]
+
+def encode_cursor(d) -> str:
+    raw = json.dumps([d.get('created_at', ''), str(d['_id'])]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def decode_cursor(token: str) -> dict:
+    try:
+        created_at, oid = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+        oid = ObjectId(oid)
+    except Exception:
+        raise HTTPException(400, "Invalid cursor")
+    return {'$or': [{'created_at': {'$lt': created_at}}, {'created_at': created_at, '_id': {'$lt': oid}}]}
+
+async def keyset_page(request: Request, coll, q: dict, limit: int, cursor: Optional[str], projection=None,
+                      archive=None):
+    # With `archive`, the same filter and cursor run against the order archive
+    # and both pages are merged, so paging crosses the two transparently.
+    if cursor:
+        q = {'$and': [q, decode_cursor(cursor)]}
+    if inclusive(projection):
+        projection = {**projection, '_id': 1, 'created_at': 1}
+    docs = await coll.find(q, dict(projection) if projection else None).sort(PAGE_SORT).limit(limit + 1).to_list(limit + 1)
+    if archive is not None:
+        old = await archive.find(q, {'data': 1}).sort(PAGE_SORT).limit(limit + 1).to_list(limit + 1)
+        docs += [project(unpack(a), projection) for a in old]
+        docs.sort(key=lambda d: (d['created_at'], d['_id']), reverse=True)
+    headers = {}
+    if len(docs) > limit:
+        docs = docs[:limit]
+        headers['X-Next-Cursor'] = encode_cursor(docs[-1])
+    return json_response(request, [doc(d) for d in docs], headers=headers)
+
 async def cur_user(creds: HTTPAuthorizationCredentials = Depends(security)):
     if not creds:
         raise HTTPException(401, "Not authenticated")
     try:
         p = jwt.decode(creds.credentials, JWT_SECRET, algorithms=[JWT_ALGO])
-        u = await db.users.find_one({'_id': ObjectId(p['sub'])})
+        u = await load_user(p['sub'])
         if not u:
             raise HTTPException(401, "User not found")
-        return doc(u)
+        return u
     except jwt.InvalidTokenError:
         raise HTTPException(401, "Invalid token")
 
@@ -66,8 +272,7 @@ async def opt_user(creds: HTTPAuthorizationCredentials = Depends(security)):
         return None
     try:
         p = jwt.decode(creds.credentials, JWT_SECRET, algorithms=[JWT_ALGO])
-        u = await db.users.find_one({'_id': ObjectId(p['sub'])})
-        return doc(u) if u else None
+        return await load_user(p['sub'])
     except Exception:
         return None
 
@@ -107,6 +312,11 @@ class ProductPrices(BaseModel):
     g500: float = 0
     g1000: float = 0
 
+class ProductStock(BaseModel):
+    g250: Optional[NonNegativeInt] = None
+    g500: Optional[NonNegativeInt] = None
+    g1000: Optional[NonNegativeInt] = None
+
 class ProductReq(BaseModel):
     name: str
     name_hi: str
@@ -120,6 +330,7 @@ class ProductReq(BaseModel):
     in_stock: bool = True
     featured: bool = False
     badge: Optional[str] = None
+    stock: Optional[ProductStock] = None
 
 class CartItemReq(BaseModel):
     product_id: str
@@ -130,7 +341,7 @@ class OrderItemReq(BaseModel):
     product_id: str
     product_name: str
     weight: str
-    quantity: int
+    quantity: PositiveInt
     price: float
     image: Optional[str] = None
 
@@ -148,12 +359,34 @@ class StatusUpdate(BaseModel):
     status: str
     delivery_partner_id: Optional[str] = None
 
+class BulkStatusItem(BaseModel):
+    order_id: str
+    status: str
+    delivery_partner_id: Optional[str] = None
+
+class BulkStatusReq(BaseModel):
+    updates: List[BulkStatusItem]
+
 class GoogleAuthReq(BaseModel):
     session_id: str
 
 class PaymentOrderReq(BaseModel):
     amount: float
 
+class CouponReq(BaseModel):
+    code: str
+    type: Literal['percent', 'flat'] = "percent"
+    value: NonNegativeFloat
+    description: str = ""
+    min_subtotal: NonNegativeFloat = 0
+    max_discount: Optional[NonNegativeFloat] = None
+    starts_at: Optional[datetime] = None
+    ends_at: Optional[datetime] = None
+    categories: List[str] = []
+    usage_limit: Optional[NonNegativeInt] = None
+    per_user_limit: Optional[NonNegativeInt] = None
+    active: bool = True
+
 
 # ── AUTH ─────────────────────────────────────────────────────────────────────
 
@@ -161,45 +394,72 @@ class PaymentOrderReq(BaseModel):
 async def register(data: RegisterReq):
     if await db.users.find_one({'email': data.email}):
         raise HTTPException(400, "Email already registered")
-    pw = bcrypt.hashpw(data.password.encode(), bcrypt.gensalt()).decode()
-    r = await db.users.insert_one({
-        'name': data.name, 'email': data.email, 'phone': data.phone,
-        'password_hash': pw, 'role': data.role, 'addresses': [],
-        'created_at': datetime.now(timezone.utc).isoformat()
-    })
+    pw = await hasher.hash(data.password)
+    try:
+        r = await db.users.insert_one({
+            'name': data.name, 'email': data.email, 'phone': data.phone,
+            'password_hash': pw, 'role': data.role, 'addresses': [],
+            'created_at': datetime.now(timezone.utc).isoformat()
+        })
+    except DuplicateKeyError:
+        raise HTTPException(400, "Email already registered")
     token = make_token(str(r.inserted_id), data.role)
     return {'token': token, 'role': data.role, 'name': data.name, 'email': data.email, 'id': str(r.inserted_id)}
 
 @api_router.post("/auth/login")
 async def login(data: LoginReq):
     u = await db.users.find_one({'email': data.email})
-    if not u or not u.get('password_hash') or not bcrypt.checkpw(data.password.encode(), u['password_hash'].encode()):
+    if not u or not await hasher.verify(data.password, u.get('password_hash')):
         raise HTTPException(401, "Invalid credentials")
+    if hasher.needs_rehash(u['password_hash']):
+        await db.users.update_one({'_id': u['_id']}, {'$set': {'password_hash': await hasher.hash(data.password)}})
     token = make_token(str(u['_id']), u.get('role', 'customer'))
     return {'token': token, 'role': u.get('role', 'customer'), 'name': u.get('name', ''), 'email': u.get('email', ''), 'id': str(u['_id'])}
 
+async def fetch_google_session(session_id: str) -> dict:
+    try:
+        r = await oauth_http.get(GOOGLE_SESSION_URL, headers={'X-Session-ID': session_id})
+    except httpx.HTTPError:
+        raise HTTPException(503, "Google sign-in unavailable")
+    if r.status_code != 200:
+        raise HTTPException(401, "Invalid Google session")
+    gdata = r.json()
+    google_sessions.set(session_id, gdata)
+    return gdata
+
+async def resolve_google_session(session_id: str) -> dict:
+    # A double-submitted session ID is served from the cache, or joins the
+    # lookup already in flight.
+    gdata = google_sessions.get(session_id)
+    if gdata is not None:
+        return gdata
+    fut = google_inflight.get(session_id)
+    if fut is None:
+        fut = asyncio.ensure_future(fetch_google_session(session_id))
+        google_inflight[session_id] = fut
+        fut.add_done_callback(lambda _: google_inflight.pop(session_id, None))
+    return await asyncio.shield(fut)
+
 @api_router.post("/auth/google")
 async def google_auth(data: GoogleAuthReq):
-    async with httpx.AsyncClient() as http:
-        r = await http.get(
-            'https://demobackend.emergentagent.com/auth/v1/env/oauth/session-data',
-            headers={'X-Session-ID': data.session_id}
-        )
-        if r.status_code != 200:
-            raise HTTPException(401, "Invalid Google session")
-        gdata = r.json()
+    gdata = await resolve_google_session(data.session_id)
     email = gdata.get('email')
-    u = await db.users.find_one({'email': email})
-    if not u:
-        res = await db.users.insert_one({
-            'name': gdata.get('name', ''), 'email': email, 'phone': None,
-            'password_hash': None, 'role': 'customer', 'addresses': [],
-            'google_id': gdata.get('id'), 'picture': gdata.get('picture'),
-            'created_at': datetime.now(timezone.utc).isoformat()
-        })
-        u = await db.users.find_one({'_id': res.inserted_id})
-    else:
-        await db.users.update_one({'email': email}, {'$set': {'google_id': gdata.get('id'), 'picture': gdata.get('picture')}})
+    for attempt in range(2):
+        try:
+            u = await db.users.find_one_and_update(
+                {'email': email},
+                {'$set': {'google_id': gdata.get('id'), 'picture': gdata.get('picture')},
+                 '$setOnInsert': {'name': gdata.get('name', ''), 'phone': None, 'password_hash': None,
+                                  'role': 'customer', 'addresses': [],
+                                  'created_at': datetime.now(timezone.utc).isoformat()}},
+                upsert=True, return_document=ReturnDocument.AFTER
+            )
+            break
+        except DuplicateKeyError:
+            # lost an upsert race on the unique email index; the retry matches
+            if attempt:
+                raise
+    principals.pop(str(u['_id']))
     token = make_token(str(u['_id']), u.get('role', 'customer'))
     return {'token': token, 'role': u.get('role', 'customer'), 'name': u.get('name', ''), 'email': email, 'id': str(u['_id']), 'picture': gdata.get('picture')}
 
@@ -211,32 +471,39 @@ async def me(user=Depends(cur_user)):
 async def update_profile(data: dict, user=Depends(cur_user)):
     allowed = {k: v for k, v in data.items() if k in ['name', 'phone']}
     await db.users.update_one({'_id': ObjectId(user['id'])}, {'$set': allowed})
+    principals.pop(user['id'])
     return doc(await db.users.find_one({'_id': ObjectId(user['id'])}))
 
 @api_router.post("/auth/address")
 async def add_address(address: Address, user=Depends(cur_user)):
     addr = {**address.model_dump(), 'id': str(ObjectId())}
     await db.users.update_one({'_id': ObjectId(user['id'])}, {'$push': {'addresses': addr}})
+    principals.pop(user['id'])
     return addr
 
 @api_router.delete("/auth/address/{addr_id}")
 async def delete_address(addr_id: str, user=Depends(cur_user)):
     await db.users.update_one({'_id': ObjectId(user['id'])}, {'$pull': {'addresses': {'id': addr_id}}})
+    principals.pop(user['id'])
     return {'success': True}
 
 
 # ── CATEGORIES ───────────────────────────────────────────────────────────────
 
-@api_router.get("/categories")
-async def get_cats():
+async def load_cats():
     cats = await db.categories.find({}).sort('order', 1).to_list(100)
     return [doc(c) for c in cats]
 
+@api_router.get("/categories")
+async def get_cats(request: Request):
+    return await cached_json(request, 'cats', load_cats)
+
 @api_router.post("/categories")
 async def create_cat(data: CategoryReq, user=Depends(cur_user)):
     if user.get('role') != 'admin':
         raise HTTPException(403, "Admin only")
     r = await db.categories.insert_one(data.model_dump())
+    catalog.invalidate()
     return doc(await db.categories.find_one({'_id': r.inserted_id}))
 
 @api_router.put("/categories/{cid}")
@@ -244,6 +511,7 @@ async def update_cat(cid: str, data: dict, user=Depends(cur_user)):
     if user.get('role') != 'admin':
         raise HTTPException(403, "Admin only")
     await db.categories.update_one({'_id': ObjectId(cid)}, {'$set': data})
+    catalog.invalidate()
     return doc(await db.categories.find_one({'_id': ObjectId(cid)}))
 
 @api_router.delete("/categories/{cid}")
@@ -251,64 +519,335 @@ async def delete_cat(cid: str, user=Depends(cur_user)):
     if user.get('role') != 'admin':
         raise HTTPException(403, "Admin only")
     await db.categories.delete_one({'_id': ObjectId(cid)})
+    catalog.invalidate()
     return {'success': True}
 
 
 # ── PRODUCTS ─────────────────────────────────────────────────────────────────
 
+async def load_featured():
+    prods = await db.products.find({'featured': True, 'in_stock': True}, dict(PRODUCT_LIST_PROJECTION)).limit(8).to_list(8)
+    return [with_stock(sized(doc(p), 'card')) for p in prods]
+
+async def rebuild_search():
+    async with search_lock:
+        search_index.begin_replace()
+        products = [doc(p) async for p in db.products.find({})]
+        search_index.replace(await asyncio.to_thread(SearchIndex.build, products))
+
+async def rebuild_search_quietly():
+    try:
+        await rebuild_search()
+    except Exception as e:
+        logger.warning("Search index rebuild failed: %r", e)
+
+async def refresh_search(force: bool = False):
+    # Writes through this worker update the index in place; the TTL picks up
+    # writes made through other workers. A stale index keeps serving while its
+    # replacement is built off the event loop, so requests never wait on it.
+    global search_refresh
+    if force or not search_index.built_at:
+        await rebuild_search()
+    elif search_index.age() > SEARCH_INDEX_TTL and (search_refresh is None or search_refresh.done()):
+        search_refresh = asyncio.create_task(rebuild_search_quietly())
+
 @api_router.get("/products/featured")
-async def get_featured():
-    prods = await db.products.find({'featured': True, 'in_stock': True}).limit(8).to_list(8)
-    return [doc(p) for p in prods]
+async def get_featured(request: Request):
+    await stock_levels.refresh(db.products)
+    return await cached_json(request, 'featured', load_featured)
 
 @api_router.get("/products")
-async def get_prods(category: Optional[str] = None, search: Optional[str] = None, featured: Optional[bool] = None, limit: int = 50):
+async def get_prods(request: Request, category: Optional[str] = None, search: Optional[str] = None, featured: Optional[bool] = None, limit: int = 50, fields: Optional[str] = None, user=Depends(opt_user)):
+    proj = parse_fields(fields, PRODUCT_FIELDS, PRODUCT_LIST_PROJECTION)
+    # live stock counts are for admins; everyone else gets sold_out via with_stock
+    admin = bool(user) and user.get('role') == 'admin'
+    raw = (lambda p: p) if admin else (lambda p: {k: v for k, v in p.items() if k != 'stock'})
+    await stock_levels.refresh(db.products)
     q = {}
     if category and category != 'all':
         q['category_slug'] = category
     if featured is not None:
         q['featured'] = featured
     if search:
-        q['$or'] = [{'name': {'$regex': search, '$options': 'i'}}, {'name_hi': {'$regex': search, '$options': 'i'}}, {'description': {'$regex': search, '$options': 'i'}}]
-    prods = await db.products.find(q).limit(limit).to_list(limit)
-    return [doc(p) for p in prods]
+        await refresh_search()
+        hits = search_index.search(search, category=q.get('category_slug'), featured=featured, limit=limit)
+        hits = [with_stock(sized(project(p, proj), 'card')) if proj else raw(p) for p in hits]
+        return json_response(request, hits)
+
+    # fields=* returns stored documents unchanged, e.g. for the admin editor
+    async def load():
+        prods = await db.products.find(q, dict(proj) if proj else None).limit(limit).to_list(limit)
+        return [with_stock(sized(doc(p), 'card')) if proj else raw(doc(p)) for p in prods]
+    if admin and proj is None:
+        # live stock counts move without invalidating the catalog cache
+        return json_response(request, await load())
+    return await cached_json(request, f"prods:{category}:{featured}:{limit}:{fields}", load)
+
+async def build_recommendations(matrix: CoPurchaseMatrix) -> dict:
+    await mine(db.orders, matrix, archive=db.orders_archive)
+    table = await asyncio.to_thread(build_table, matrix, dict(search_index.docs), RECS_SIZE)
+    await save_table(db.recommendations, table)
+    return table
+
+async def refresh_recommendations():
+    # The worker holding the recommendations lock mines orders placed since
+    # its last run into rec_matrix, then rebuilds and stores the top-N table;
+    # it keeps the lease for as long as it keeps refreshing. Every other
+    # worker, and every worker with the default RECS_REFRESH_INTERVAL=0, only
+    # reloads the stored table, e.g. from `python recommendations.py build`.
+    # With the default, a database without a table gets one built once: the
+    # first worker to take the lock builds it, the others wait and load it.
+    await refresh_search()
+    if RECS_REFRESH_INTERVAL and await recs_lock.acquire():
+        async with recs_lock.renewing():
+            table = await build_recommendations(rec_matrix)
+    else:
+        table = await load_table(db.recommendations)
+        if not table and not RECS_REFRESH_INTERVAL and search_index.docs:
+            async with recs_lock.hold(timeout=BOOTSTRAP_LOCK_WAIT):
+                table = await load_table(db.recommendations) or await build_recommendations(CoPurchaseMatrix())
+    rec_table.clear()
+    rec_table.update(table)
+
+async def recommendations_loop():
+    while True:
+        try:
+            await refresh_recommendations()
+        except Exception as e:
+            logger.warning("Recommendation refresh failed: %r", e)
+        await asyncio.sleep(RECS_REFRESH_INTERVAL or 300)
+
+async def archive_loop():
+    # Keeps the hot orders collection to recent and still-open orders.
+    while True:
+        try:
+            now = datetime.now(timezone.utc)
+            cutoff = (now - timedelta(days=ARCHIVE_AFTER_DAYS)).isoformat()
+            moved = await archive_orders(db.orders, db.orders_archive, cutoff, now.isoformat())
+            if moved:
+                logger.info("Archived %d orders created before %s", moved, cutoff[:10])
+        except Exception as e:
+            logger.warning("Order archival failed: %r", e)
+        await asyncio.sleep(ARCHIVE_INTERVAL)
 
 @api_router.get("/products/{pid}/recommendations")
-async def get_recs(pid: str):
-    p = await db.products.find_one({'_id': ObjectId(pid)})
-    if not p:
-        raise HTTPException(404, "Not found")
-    recs = await db.products.find({'category_slug': p['category_slug'], '_id': {'$ne': ObjectId(pid)}}).limit(4).to_list(4)
-    return [doc(r) for r in recs]
+async def get_recs(request: Request, pid: str, limit: int = Query(4, ge=1, le=20)):
+    await refresh_search()
+    products = search_index.docs
+    if pid not in products:
+        # created through another worker since this index was built
+        p = doc(await db.products.find_one({'_id': ObjectId(pid)})) if ObjectId.is_valid(pid) else None
+        if not p:
+            raise HTTPException(404, "Not found")
+        search_index.upsert(p)
+    ids = rec_table.get(pid) or category_fallback(pid, products, limit)
+    recs = [products[i] for i in ids if i in products and products[i].get('in_stock', True)][:limit]
+    await stock_levels.refresh(db.products)
+    return json_response(request, [with_stock(sized(project(p, PRODUCT_LIST_PROJECTION), 'card')) for p in recs])
 
 @api_router.get("/products/{pid}")
-async def get_prod(pid: str):
-    p = await db.products.find_one({'_id': ObjectId(pid)})
-    if not p:
-        raise HTTPException(404, "Not found")
-    return doc(p)
+async def get_prod(request: Request, pid: str):
+    oid = ObjectId(pid)
+    await stock_levels.refresh(db.products)
+
+    async def load():
+        return with_stock(sized(doc(await db.products.find_one({'_id': oid})), 'full'))
+    return await cached_json(request, f"prod:{pid}", load)
+
+def product_doc(data: ProductReq) -> dict:
+    d = {**data.model_dump(exclude={'stock'}), 'created_at': datetime.now(timezone.utc).isoformat()}
+    if data.stock is not None:
+        d['stock'] = stock_doc(data.stock)
+    return d
 
 @api_router.post("/products")
 async def create_prod(data: ProductReq, user=Depends(cur_user)):
     if user.get('role') != 'admin':
         raise HTTPException(403, "Admin only")
-    d = {**data.model_dump(), 'created_at': datetime.now(timezone.utc).isoformat()}
-    d['prices'] = d['prices']
-    r = await db.products.insert_one(d)
-    return doc(await db.products.find_one({'_id': r.inserted_id}))
+    r = await db.products.insert_one(product_doc(data))
+    catalog.invalidate()
+    stock_levels.invalidate()
+    p = doc(await db.products.find_one({'_id': r.inserted_id}))
+    search_index.upsert(p)
+    return p
 
 @api_router.put("/products/{pid}")
 async def update_prod(pid: str, data: dict, user=Depends(cur_user)):
     if user.get('role') != 'admin':
         raise HTTPException(403, "Admin only")
+    if 'stock' in data:
+        try:
+            data['stock'] = stock_doc(data['stock'])
+        except (ValueError, TypeError) as e:
+            raise HTTPException(400, str(e))
     await db.products.update_one({'_id': ObjectId(pid)}, {'$set': data})
-    return doc(await db.products.find_one({'_id': ObjectId(pid)}))
+    catalog.invalidate()
+    stock_levels.invalidate()
+    p = doc(await db.products.find_one({'_id': ObjectId(pid)}))
+    if p:
+        search_index.upsert(p)
+    return p
+
+@api_router.put("/admin/products/{pid}/stock")
+async def set_stock(pid: str, data: ProductStock, add: bool = False, user=Depends(cur_user)):
+    # Sets (or with add=true, adds to) the given weights; null stops tracking
+    # a weight. Weights left out of the body are not touched.
+    if user.get('role') != 'admin':
+        raise HTTPException(403, "Admin only")
+    given = data.model_dump(exclude_unset=True)
+    update = {}
+    for w, q in given.items():
+        if q is None:
+            update.setdefault('$unset', {})[f'stock.{w}'] = ''
+        else:
+            update.setdefault('$inc' if add else '$set', {})[f'stock.{w}'] = q
+    if not update:
+        raise HTTPException(400, "No weights given")
+    p = await db.products.find_one_and_update({'_id': ObjectId(pid)}, update, {'stock': 1},
+                                              return_document=ReturnDocument.AFTER)
+    if not p:
+        raise HTTPException(404, "Product not found")
+    catalog.invalidate()
+    stock_levels.invalidate()
+    return {'id': pid, 'stock': p.get('stock', {})}
+
+# Bulk import: rows without an id are validated as a full ProductReq and
+# inserted; rows with an id are partial updates of the fields they carry.
+
+IMPORT_BATCH = 1000
+IMPORT_MAX_ERRORS = 500
+PRODUCT_FIELD_TYPES = {k: TypeAdapter(f.annotation) for k, f in ProductReq.model_fields.items() if k != 'prices'}
+
+def validation_message(e: ValidationError) -> str:
+    err = e.errors()[0]
+    loc = '.'.join(str(x) for x in err['loc'])
+    return f"{loc}: {err['msg']}" if loc else err['msg']
+
+def product_op(d: dict, categories: set):
+    d = normalize(d)
+    if d.get('category_slug') is not None and not isinstance(d['category_slug'], str):
+        raise RowError("category_slug must be a string")
+    if d.get('category_slug') is not None and d['category_slug'] not in categories:
+        raise RowError(f"Unknown category: {d['category_slug']}")
+    pid = d.pop('id', None)
+    if not pid:
+        try:
+            p = ProductReq.model_validate(d)
+        except ValidationError as e:
+            raise RowError(validation_message(e))
+        return None, InsertOne(product_doc(p))
+    if not ObjectId.is_valid(pid):
+        raise RowError(f"Invalid id: {pid}")
+    unknown = set(d) - set(ProductReq.model_fields)
+    if unknown:
+        raise RowError(f"Unknown fields: {', '.join(sorted(unknown))}")
+    patch = {}
+    for k, v in d.items():
+        if k == 'prices':
+            bad = set(v) - set(PRICE_KEYS)
+            if bad:
+                raise RowError(f"Unknown price keys: {', '.join(sorted(bad))}")
+            patch.update({f'prices.{w}': p for w, p in v.items()})
+            continue
+        if k == 'stock':
+            try:
+                patch.update({f'stock.{w}': q for w, q in stock_doc(v).items()})
+            except (ValueError, TypeError) as e:
+                raise RowError(str(e))
+            continue
+        try:
+            patch[k] = PRODUCT_FIELD_TYPES[k].validate_python(v)
+        except ValidationError as e:
+            raise RowError(f"{k}: {e.errors()[0]['msg']}")
+    if not patch:
+        raise RowError("Nothing to update")
+    return ObjectId(pid), UpdateOne({'_id': ObjectId(pid)}, {'$set': patch})
+
+async def apply_batch(batch: list, result: dict):
+    ids = [oid for _, oid, _ in batch if oid]
+    found = {d['_id'] async for d in db.products.find({'_id': {'$in': ids}}, {'_id': 1})} if ids else set()
+    rows, ops = [], []
+    for row, oid, op in batch:
+        if oid and oid not in found:
+            result['errors'].append({'row': row, 'error': f"Product not found: {oid}"})
+            continue
+        rows.append(row)
+        ops.append(op)
+    if not ops:
+        return
+    try:
+        r = (await db.products.bulk_write(ops, ordered=False)).bulk_api_result
+    except BulkWriteError as e:
+        r = e.details
+        for err in r.get('writeErrors', []):
+            result['errors'].append({'row': rows[err['index']], 'error': err.get('errmsg', 'Write failed')})
+    result['inserted'] += r.get('nInserted', 0)
+    result['updated'] += r.get('nMatched', 0)
+
+@api_router.post("/admin/products/import")
+async def import_products(request: Request, format: str = 'csv', user=Depends(cur_user)):
+    if user.get('role') != 'admin':
+        raise HTTPException(403, "Admin only")
+    if format not in ('csv', 'ndjson'):
+        raise HTTPException(400, "Unsupported format")
+    categories = {c['slug'] async for c in db.categories.find({}, {'slug': 1})}
+    result = {'processed': 0, 'inserted': 0, 'updated': 0, 'errors': []}
+    batch = []
+    async for row, rec in records(request.stream(), format):
+        result['processed'] += 1
+        try:
+            if isinstance(rec, RowError):
+                raise rec
+            oid, op = product_op(rec, categories)
+        except RowError as e:
+            result['errors'].append({'row': row, 'error': str(e)})
+            continue
+        batch.append((row, oid, op))
+        if len(batch) >= IMPORT_BATCH:
+            await apply_batch(batch, result)
+            batch = []
+    if batch:
+        await apply_batch(batch, result)
+    if result['inserted'] or result['updated']:
+        catalog.invalidate()
+        stock_levels.invalidate()
+        await refresh_search(force=True)
+    result['failed'] = len(result['errors'])
+    result['errors'] = sorted(result['errors'], key=lambda e: e['row'])[:IMPORT_MAX_ERRORS]
+    return result
+
+@api_router.post("/admin/images")
+async def upload_image(file: UploadFile = File(...), user=Depends(cur_user)):
+    if user.get('role') != 'admin':
+        raise HTTPException(403, "Admin only")
+    data = await file.read(MAX_IMAGE_BYTES + 1)
+    if len(data) > MAX_IMAGE_BYTES:
+        raise HTTPException(413, "Image too large")
+    try:
+        return await images.save(data)
+    except ImageError as e:
+        raise HTTPException(400, str(e))
+
+@api_router.get("/media/{name}")
+async def get_media(request: Request, name: str):
+    found = images.resolve(name, request.headers.get('accept'))
+    if not found:
+        raise HTTPException(404, "Not found")
+    path, media_type = found
+    etag = f'"{path.name}"'
+    headers = {'ETag': etag, 'Cache-Control': 'public, max-age=31536000, immutable', 'Vary': 'Accept'}
+    if etag_matches(request.headers.get('if-none-match'), etag):
+        return Response(status_code=304, headers=headers)
+    return FileResponse(path, media_type=media_type, headers=headers)
 
 @api_router.delete("/products/{pid}")
 async def delete_prod(pid: str, user=Depends(cur_user)):
     if user.get('role') != 'admin':
         raise HTTPException(403, "Admin only")
     await db.products.delete_one({'_id': ObjectId(pid)})
+    catalog.invalidate()
+    stock_levels.invalidate()
+    search_index.remove(pid)
     return {'success': True}
 
 
@@ -321,31 +860,46 @@ async def get_cart(user=Depends(cur_user)):
 
 @api_router.post("/cart/add")
 async def add_cart(item: CartItemReq, user=Depends(cur_user)):
-    cart = await db.carts.find_one({'user_id': user['id']})
-    items = cart.get('items', []) if cart else []
-    idx = next((i for i, x in enumerate(items) if x['product_id'] == item.product_id and x['weight'] == item.weight), None)
-    if idx is not None:
-        items[idx]['quantity'] += item.quantity
+    # Bump the matching line in place; otherwise push it onto a cart that still
+    # lacks it. A concurrent push of the same line makes the second filter miss
+    # and the upsert collide on the unique user_id index, so we retry the $inc.
+    line = {'product_id': item.product_id, 'weight': item.weight}
+    for _ in range(3):
+        cart = await db.carts.find_one_and_update(
+            {'user_id': user['id'], 'items': {'$elemMatch': line}},
+            {'$inc': {'items.$.quantity': item.quantity}},
+            projection={'items': 1}, return_document=ReturnDocument.AFTER
+        )
+        if cart:
+            break
+        try:
+            cart = await db.carts.find_one_and_update(
+                {'user_id': user['id'], 'items': {'$not': {'$elemMatch': line}}},
+                {'$push': {'items': item.model_dump()}},
+                projection={'items': 1}, upsert=True, return_document=ReturnDocument.AFTER
+            )
+            break
+        except DuplicateKeyError:
+            continue
     else:
-        items.append(item.model_dump())
-    await db.carts.update_one({'user_id': user['id']}, {'$set': {'items': items}}, upsert=True)
-    return {'success': True, 'items': items}
+        raise HTTPException(409, "Cart is busy, please retry")
+    return {'success': True, 'items': cart['items']}
 
 @api_router.put("/cart/update")
 async def update_cart(item: CartItemReq, user=Depends(cur_user)):
-    cart = await db.carts.find_one({'user_id': user['id']})
-    if not cart:
-        return {'success': True, 'items': []}
-    items = cart.get('items', [])
-    for i, x in enumerate(items):
-        if x['product_id'] == item.product_id and x['weight'] == item.weight:
-            if item.quantity <= 0:
-                items.pop(i)
-            else:
-                items[i]['quantity'] = item.quantity
-            break
-    await db.carts.update_one({'user_id': user['id']}, {'$set': {'items': items}})
-    return {'success': True, 'items': items}
+    line = {'product_id': item.product_id, 'weight': item.weight}
+    if item.quantity <= 0:
+        cart = await db.carts.find_one_and_update(
+            {'user_id': user['id']}, {'$pull': {'items': line}},
+            projection={'items': 1}, return_document=ReturnDocument.AFTER
+        )
+    else:
+        cart = await db.carts.find_one_and_update(
+            {'user_id': user['id']}, {'$set': {'items.$[it].quantity': item.quantity}},
+            array_filters=[{'it.product_id': item.product_id, 'it.weight': item.weight}],
+            projection={'items': 1}, return_document=ReturnDocument.AFTER
+        )
+    return {'success': True, 'items': cart.get('items', []) if cart else []}
 
 @api_router.delete("/cart/clear")
 async def clear_cart(user=Depends(cur_user)):
@@ -355,103 +909,335 @@ async def clear_cart(user=Depends(cur_user)):
 
 # ── ORDERS ───────────────────────────────────────────────────────────────────
 
+def publish_order(kind: str, o: dict):
+    # With the change-stream source every worker publishes from the stream
+    # instead, so handlers stay quiet to avoid duplicate events.
+    if ORDER_EVENTS_SOURCE == 'local':
+        order_events.publish({'type': kind, 'order': o})
+
 VALID_STATUSES = ["placed", "accepted", "preparing", "packed", "out_for_delivery", "delivered", "cancelled"]
 
+# Allowed moves; delivered and cancelled are final. An order that is not yet
+# final may also "move" to its current status when that call (re)assigns a
+# delivery partner.
+ORDER_TRANSITIONS = {
+    'placed': ['accepted', 'preparing', 'packed', 'cancelled'],
+    'accepted': ['preparing', 'packed', 'out_for_delivery', 'cancelled'],
+    'preparing': ['packed', 'out_for_delivery', 'cancelled'],
+    'packed': ['out_for_delivery', 'delivered', 'cancelled'],
+    'out_for_delivery': ['delivered', 'cancelled'],
+    'delivered': [],
+    'cancelled': [],
+}
+ORDER_SOURCES = {t: [s for s, targets in ORDER_TRANSITIONS.items() if t in targets] for t in VALID_STATUSES}
+PARTNER_STATUSES = {'out_for_delivery', 'delivered'}
+
+# daily_sales holds one document per UTC day of order creation:
+#   {_id: 'YYYY-MM-DD', orders, cancelled, revenue}
+# where revenue only counts orders that are not currently cancelled.
+
+async def bump_daily_sales(created_at: str, orders: int = 0, cancelled: int = 0, revenue: float = 0):
+    await db.daily_sales.update_one(
+        {'_id': created_at[:10]},
+        {'$inc': {'orders': orders, 'cancelled': cancelled, 'revenue': revenue}},
+        upsert=True
+    )
+
+async def rebuild_daily_sales():
+    is_cancelled = {'$eq': ['$status', 'cancelled']}
+    await db.orders.aggregate([
+        {'$project': {'created_at': 1, 'status': 1, 'total': 1}},
+        {'$unionWith': {'coll': 'orders_archive', 'pipeline': [{'$project': {'created_at': 1, 'status': 1, 'total': 1}}]}},
+        {'$group': {
+            '_id': {'$substrBytes': ['$created_at', 0, 10]},
+            'orders': {'$sum': 1},
+            'cancelled': {'$sum': {'$cond': [is_cancelled, 1, 0]}},
+            'revenue': {'$sum': {'$cond': [is_cancelled, 0, '$total']}},
+        }},
+        {'$merge': {'into': 'daily_sales', 'whenMatched': 'replace'}},
+    ]).to_list(None)
+
+async def idempotent(response: Response, scope: str, user: dict, key: Optional[str], data: BaseModel, fn):
+    # Runs fn once per Idempotency-Key; retries get the first response back.
+    if key is None:
+        return await fn()
+    try:
+        result, replayed = await idempotency.run(scope, user['id'], key, data.model_dump(), fn)
+    except IdempotencyError as e:
+        raise HTTPException(e.status, str(e))
+    if replayed:
+        response.headers['Idempotent-Replayed'] = 'true'
+    return result
+
 @api_router.post("/orders")
-async def create_order(data: OrderReq, user=Depends(cur_user)):
+async def create_order(data: OrderReq, response: Response, user=Depends(cur_user),
+                       idempotency_key: Optional[str] = Header(None)):
+    return await idempotent(response, 'orders', user, idempotency_key, data, lambda: place_order(data, user))
+
+async def place_order(data: OrderReq, user: dict):
     subtotal = sum(i.price * i.quantity for i in data.items)
     delivery_charge = 0 if data.delivery_type == 'pickup' or subtotal >= 500 else 40
-    discount = 0
+    discount, coupon = 0, None
     if data.coupon_code:
-        code = data.coupon_code.upper()
-        if code == 'RASRAJ10':
-            discount = round(subtotal * 0.10, 2)
-        elif code == 'FIRST50':
-            discount = min(50.0, subtotal)
-        elif code == 'WELCOME20' and subtotal >= 500:
-            discount = round(subtotal * 0.20, 2)
-    total = subtotal + delivery_charge - discount
-    order_doc = {
-        'user_id': user['id'], 'user_name': user.get('name', ''), 'user_email': user.get('email', ''),
-        'user_phone': user.get('phone', ''),
-        'items': [i.model_dump() for i in data.items],
-        'address': data.address.model_dump(),
-        'delivery_type': data.delivery_type, 'payment_method': data.payment_method,
-        'coupon_code': data.coupon_code, 'subtotal': subtotal, 'delivery_charge': delivery_charge,
-        'discount': discount, 'total': total, 'status': 'placed',
-        'status_history': [{'status': 'placed', 'timestamp': datetime.now(timezone.utc).isoformat()}],
-        'notes': data.notes, 'delivery_partner_id': None,
-        'razorpay_payment_id': data.razorpay_payment_id,
-        'razorpay_order_id': data.razorpay_order_id,
-        'created_at': datetime.now(timezone.utc).isoformat(),
-        'order_number': f"RR{int(datetime.now(timezone.utc).timestamp())}"
-    }
-    r = await db.orders.insert_one(order_doc)
+        await coupon_book.refresh(db.coupons)
+        await refresh_search()
+        try:
+            coupon = coupon_book.get(data.coupon_code)
+            discount = coupon.discount(cart_lines(data.items))
+        except CouponError as e:
+            raise HTTPException(400, str(e))
+    try:
+        reserved = await reserve(db.products, demand(data.items))
+    except OutOfStock as e:
+        stock_levels.invalidate()
+        labels = {(i.product_id, WEIGHT_KEYS.get(i.weight)): f"{i.product_name} ({i.weight})" for i in data.items}
+        raise HTTPException(409, "Out of stock: " + ', '.join(labels.get(k, k[0]) for k in e.lines))
+    # Until the order is stored, any failure (or cancellation) hands back the
+    # stock and coupon use this request took.
+    redeemed = False
+    try:
+        if coupon:
+            try:
+                await redeem(db.coupons, db.coupon_redemptions, coupon, user['id'])
+            except CouponError as e:
+                raise HTTPException(400, str(e))
+            redeemed = True
+        total = subtotal + delivery_charge - discount
+        order_doc = {
+            'user_id': user['id'], 'user_name': user.get('name', ''), 'user_email': user.get('email', ''),
+            'user_phone': user.get('phone', ''),
+            'items': [i.model_dump() for i in data.items],
+            'address': data.address.model_dump(),
+            'delivery_type': data.delivery_type, 'payment_method': data.payment_method,
+            'coupon_code': coupon.code if coupon else None, 'subtotal': subtotal, 'delivery_charge': delivery_charge,
+            'discount': discount, 'total': total, 'status': 'placed',
+            'status_history': [{'status': 'placed', 'timestamp': datetime.now(timezone.utc).isoformat()}],
+            'notes': data.notes, 'delivery_partner_id': None,
+            'razorpay_payment_id': data.razorpay_payment_id,
+            'razorpay_order_id': data.razorpay_order_id,
+            'stock_reserved': reserved,
+            'created_at': datetime.now(timezone.utc).isoformat(),
+        }
+        for attempt in range(3):
+            order_doc['order_number'] = await order_numbers.next()
+            try:
+                r = await db.orders.insert_one(order_doc)
+                break
+            except DuplicateKeyError:
+                order_doc.pop('_id', None)
+                if attempt == 2:
+                    raise
+    except BaseException:
+        if redeemed:
+            await release(db.coupons, db.coupon_redemptions, coupon.code, user['id'])
+        await unreserve(db.products, reserved)
+        raise
+    stock_levels.adjust(reserved, -1)
+    await bump_daily_sales(order_doc['created_at'], orders=1, revenue=total)
     await db.carts.update_one({'user_id': user['id']}, {'$set': {'items': []}})
-    return doc(await db.orders.find_one({'_id': r.inserted_id}))
+    o = doc(await db.orders.find_one({'_id': r.inserted_id}))
+    publish_order('order.created', o)
+    return o
 
 @api_router.get("/orders")
-async def get_orders(user=Depends(cur_user)):
+async def get_orders(request: Request, limit: Optional[int] = Query(None, ge=1, le=500), cursor: Optional[str] = None, fields: Optional[str] = None, archived: bool = False, user=Depends(cur_user)):
+    proj = parse_fields(fields, ORDER_FIELDS, ORDER_LIST_PROJECTION)
     if user.get('role') == 'admin':
-        orders = await db.orders.find({}).sort('created_at', -1).to_list(200)
-    else:
-        orders = await db.orders.find({'user_id': user['id']}).sort('created_at', -1).to_list(50)
-    return [doc(o) for o in orders]
+        return await keyset_page(request, db.orders, {}, limit or 200, cursor, proj,
+                                 db.orders_archive if archived else None)
+    return await keyset_page(request, db.orders, {'user_id': user['id']}, limit or 50, cursor, proj, db.orders_archive)
 
 @api_router.get("/orders/{oid}")
 async def get_order(oid: str, user=Depends(cur_user)):
-    q = {'_id': ObjectId(oid)}
+    # oid may be an order id or an order number; archived orders are found too
+    q = {'_id': ObjectId(oid)} if ObjectId.is_valid(oid) else {'order_number': oid.upper()}
     if user.get('role') not in ['admin', 'delivery_partner']:
         q['user_id'] = user['id']
     o = await db.orders.find_one(q)
+    if not o:
+        a = await db.orders_archive.find_one(q, {'data': 1})
+        o = unpack(a) if a else None
     if not o:
         raise HTTPException(404, "Order not found")
     return doc(o)
 
+def transition(user: dict, oid: str, status: str, partner_id: Optional[str], now: str):
+    # -> (filter, update, history entry) for one status change, or raises
+    # ValueError. The filter only matches orders whose current status may
+    # move to `status`, so concurrent changes cannot be overwritten.
+    if status not in VALID_STATUSES:
+        raise ValueError("Invalid status")
+    if not ObjectId.is_valid(oid):
+        raise ValueError("Invalid order id")
+    again = [status] if partner_id and ORDER_TRANSITIONS[status] else []
+    q = {'_id': ObjectId(oid), 'status': {'$in': ORDER_SOURCES[status] + again}}
+    if user.get('role') == 'delivery_partner':
+        if status not in PARTNER_STATUSES or (partner_id and partner_id != user['id']):
+            raise ValueError("Not allowed for delivery partners")
+        q['delivery_partner_id'] = user['id']
+    update = {'status': status}
+    if partner_id:
+        update['delivery_partner_id'] = partner_id
+    entry = {'status': status, 'timestamp': now, 'by': user['id']}
+    return q, {'$set': update, '$push': {'status_history': entry}}, entry
+
+def transition_failure(current: Optional[dict], status: str) -> str:
+    if not current:
+        return "Order not found"
+    return f"Cannot move order from {current['status']} to {status}"
+
+async def after_cancel(orders: list):
+    days = {}
+    for o in orders:
+        d = days.setdefault(o['created_at'][:10], [0, 0])
+        d[0] += 1
+        d[1] += o.get('total', 0)
+    for day, (n, revenue) in days.items():
+        await bump_daily_sales(day, cancelled=n, revenue=-revenue)
+    for o in orders:
+        if o.get('coupon_code'):
+            await release(db.coupons, db.coupon_redemptions, o['coupon_code'], o['user_id'])
+    reserved = [l for o in orders for l in o.get('stock_reserved') or []]
+    if reserved:
+        await unreserve(db.products, reserved)
+        stock_levels.adjust(reserved, 1)
+
+async def valid_partners(ids) -> set:
+    oids = [ObjectId(i) for i in set(ids) if i and ObjectId.is_valid(i)]
+    if not oids:
+        return set()
+    return {str(u['_id']) async for u in db.users.find({'_id': {'$in': oids}, 'role': 'delivery_partner'}, {'_id': 1})}
+
 @api_router.put("/orders/{oid}/status")
 async def update_status(oid: str, data: StatusUpdate, user=Depends(cur_user)):
     if user.get('role') not in ['admin', 'delivery_partner']:
         raise HTTPException(403, "Access denied")
-    if data.status not in VALID_STATUSES:
-        raise HTTPException(400, "Invalid status")
-    update = {'status': data.status}
-    if data.delivery_partner_id:
-        update['delivery_partner_id'] = data.delivery_partner_id
-    entry = {'status': data.status, 'timestamp': datetime.now(timezone.utc).isoformat()}
-    await db.orders.update_one({'_id': ObjectId(oid)}, {'$set': update, '$push': {'status_history': entry}})
-    return doc(await db.orders.find_one({'_id': ObjectId(oid)}))
+    if user.get('role') == 'admin' and data.delivery_partner_id and not await valid_partners([data.delivery_partner_id]):
+        raise HTTPException(400, "Unknown delivery partner")
+    try:
+        q, update, entry = transition(user, oid, data.status, data.delivery_partner_id,
+                                      datetime.now(timezone.utc).isoformat())
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+    prev = await db.orders.find_one_and_update(q, update, return_document=ReturnDocument.BEFORE)
+    if not prev:
+        current = await db.orders.find_one({k: v for k, v in q.items() if k != 'status'}, {'status': 1})
+        raise HTTPException(404 if not current else 409, transition_failure(current, data.status))
+    o = {**prev, **update['$set'], 'status_history': (prev.get('status_history') or []) + [entry]}
+    if data.status == 'cancelled' and prev['status'] != 'cancelled':
+        await after_cancel([o])
+    o = doc(o)
+    publish_order('order.status', o)
+    return o
+
+@api_router.post("/orders/status/bulk")
+async def bulk_update_status(data: BulkStatusReq, user=Depends(cur_user)):
+    # One unordered bulk_write of conditional updates, then one read to find
+    # out which of them applied.
+    if user.get('role') not in ['admin', 'delivery_partner']:
+        raise HTTPException(403, "Access denied")
+    if not data.updates or len(data.updates) > 500:
+        raise HTTPException(400, "Send between 1 and 500 updates")
+    now = datetime.now(timezone.utc).isoformat()
+    partners = await valid_partners(u.delivery_partner_id for u in data.updates) if user.get('role') == 'admin' else None
+    results, ops, issued = [None] * len(data.updates), [], {}
+    for n, u in enumerate(data.updates):
+        try:
+            if partners is not None and u.delivery_partner_id and u.delivery_partner_id not in partners:
+                raise ValueError("Unknown delivery partner")
+            q, update, entry = transition(user, u.order_id, u.status, u.delivery_partner_id, now)
+            # compared as ObjectIds, so the same id in another hex case is caught too
+            if q['_id'] in issued:
+                raise ValueError("Duplicate order in request")
+        except ValueError as e:
+            results[n] = {'id': u.order_id, 'ok': False, 'error': str(e)}
+            continue
+        ops.append(UpdateOne(q, update))
+        issued[q['_id']] = (n, u, q['status']['$in'], entry)
+    if ops:
+        await db.orders.bulk_write(ops, ordered=False)
+        found = {o['_id']: o async for o in db.orders.find({'_id': {'$in': list(issued)}})}
+        cancelled = []
+        for oid, (n, u, sources, entry) in issued.items():
+            o = found.get(oid)
+            # a later change may already sit on top of ours, so look anywhere in the history
+            if o and entry in (o.get('status_history') or []):
+                results[n] = {'id': u.order_id, 'ok': True, 'status': u.status}
+                if u.status == 'cancelled' and 'cancelled' not in sources:
+                    cancelled.append(o)
+                publish_order('order.status', doc(o))
+            else:
+                results[n] = {'id': u.order_id, 'ok': False, 'error': transition_failure(o, u.status)}
+        if cancelled:
+            await after_cancel(cancelled)
+    updated = sum(r['ok'] for r in results)
+    return {'updated': updated, 'failed': len(results) - updated, 'results': results}
+
+
+@api_router.get("/events/orders")
+async def stream_order_events(request: Request, token: Optional[str] = None, creds: HTTPAuthorizationCredentials = Depends(security)):
+    # EventSource cannot set headers, so the token may also come as ?token=
+    if not creds and token:
+        creds = HTTPAuthorizationCredentials(scheme='Bearer', credentials=token)
+    user = await cur_user(creds)
+    uid, role = user['id'], user.get('role')
+    if role == 'admin':
+        match = lambda e: True
+    elif role == 'delivery_partner':
+        match = lambda e: e['order'].get('delivery_partner_id') == uid
+    else:
+        match = lambda e: e['order'].get('user_id') == uid
+
+    async def stream():
+        sub = order_events.subscribe(match)
+        try:
+            yield 'retry: 3000\n\n'
+            while True:
+                try:
+                    e = await asyncio.wait_for(sub.queue.get(), SSE_HEARTBEAT)
+                except asyncio.TimeoutError:
+                    yield ': ping\n\n'
+                    continue
+                yield f"event: {e['type']}\ndata: {dumps(e).decode()}\n\n"
+        finally:
+            order_events.unsubscribe(sub)
+
+    return StreamingResponse(stream(), media_type='text/event-stream',
+                             headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 
 # ── PAYMENT (RAZORPAY) ────────────────────────────────────────────────────────
 
 @api_router.post("/payment/create-order")
-async def create_payment_order(data: PaymentOrderReq, user=Depends(cur_user)):
-    amount_paise = int(data.amount * 100)
-    if not RAZORPAY_KEY_ID or not RAZORPAY_KEY_SECRET:
-        # Mock mode — Razorpay-ready structure, switch to live by adding keys
-        return {'id': f'mock_order_{user["id"][:8]}', 'amount': amount_paise, 'currency': 'INR', 'mock': True}
-    rzp = razorpay.Client(auth=(RAZORPAY_KEY_ID, RAZORPAY_KEY_SECRET))
-    order = rzp.order.create({'amount': amount_paise, 'currency': 'INR', 'payment_capture': 1})
-    return order
+async def create_payment_order(data: PaymentOrderReq, response: Response, user=Depends(cur_user),
+                               idempotency_key: Optional[str] = Header(None)):
+    return await idempotent(response, 'payment', user, idempotency_key, data,
+                            lambda: create_gateway_order(data, user))
+
+async def create_gateway_order(data: PaymentOrderReq, user: dict):
+    amount_paise = int(round(data.amount * 100))
+    try:
+        return await gateway.create_order(amount_paise, receipt=f"u{user['id'][-12:]}")
+    except GatewayError as e:
+        raise HTTPException(400, f"Payment gateway rejected the order: {e}")
+    except GatewayUnavailable as e:
+        raise HTTPException(503, str(e))
 
 @api_router.post("/payment/verify")
 async def verify_payment(body: dict, user=Depends(cur_user)):
-    if not RAZORPAY_KEY_ID or not RAZORPAY_KEY_SECRET:
+    if gateway.mock:
         return {'success': True, 'mock': True}
-    rzp = razorpay.Client(auth=(RAZORPAY_KEY_ID, RAZORPAY_KEY_SECRET))
     try:
-        rzp.utility.verify_payment_signature({
-            'razorpay_order_id': body['razorpay_order_id'],
-            'razorpay_payment_id': body['razorpay_payment_id'],
-            'razorpay_signature': body['razorpay_signature']
-        })
-        return {'success': True}
-    except Exception:
+        ok = gateway.verify_signature(body['razorpay_order_id'], body['razorpay_payment_id'], body['razorpay_signature'])
+    except KeyError:
+        ok = False
+    if not ok:
         raise HTTPException(400, "Payment verification failed")
+    return {'success': True}
 
 @api_router.get("/payment/key")
 async def get_razorpay_key():
-    return {'key_id': RAZORPAY_KEY_ID or '', 'mock': not bool(RAZORPAY_KEY_ID)}
+    return {'key_id': gateway.key_id, 'mock': gateway.mock}
 
 
 # ── ADMIN ────────────────────────────────────────────────────────────────────
@@ -461,65 +1247,211 @@ async def dashboard(user=Depends(cur_user)):
     if user.get('role') != 'admin':
         raise HTTPException(403, "Admin only")
     today = datetime.now(timezone.utc).date().isoformat()
-    all_orders = await db.orders.find({'status': {'$ne': 'cancelled'}}).to_list(1000)
-    today_orders = [o for o in all_orders if o.get('created_at', '').startswith(today)]
+    is_today = {'$eq': ['$_id', today]}
+    sales, recent, products, customers, low_stock = await asyncio.gather(
+        db.daily_sales.aggregate([{'$group': {
+            '_id': None,
+            'orders': {'$sum': '$orders'},
+            'revenue': {'$sum': '$revenue'},
+            'today_orders': {'$sum': {'$cond': [is_today, {'$subtract': ['$orders', '$cancelled']}, 0]}},
+            'today_revenue': {'$sum': {'$cond': [is_today, '$revenue', 0]}},
+        }}]).to_list(1),
+        db.orders.find({'status': {'$ne': 'cancelled'}}).sort(PAGE_SORT).limit(5).to_list(5),
+        db.products.count_documents({}),
+        db.users.count_documents({'role': 'customer'}),
+        db.products.find({'in_stock': False}).limit(5).to_list(5),
+    )
+    s = sales[0] if sales else {}
     return {
-        'total_orders': await db.orders.count_documents({}),
-        'today_orders': len(today_orders),
-        'today_revenue': sum(o.get('total', 0) for o in today_orders),
-        'total_revenue': sum(o.get('total', 0) for o in all_orders),
-        'total_products': await db.products.count_documents({}),
-        'total_users': await db.users.count_documents({'role': 'customer'}),
-        'recent_orders': [doc(o) for o in sorted(all_orders, key=lambda x: x.get('created_at', ''), reverse=True)[:5]],
-        'low_stock': [doc(p) for p in await db.products.find({'in_stock': False}).limit(5).to_list(5)]
+        'total_orders': s.get('orders', 0),
+        'today_orders': s.get('today_orders', 0),
+        'today_revenue': round(s.get('today_revenue', 0), 2),
+        'total_revenue': round(s.get('revenue', 0), 2),
+        'total_products': products,
+        'total_users': customers,
+        'recent_orders': [doc(o) for o in recent],
+        'low_stock': [doc(p) for p in low_stock]
     }
 
 @api_router.get("/admin/users")
-async def get_users(user=Depends(cur_user)):
+async def get_users(request: Request, limit: int = Query(200, ge=1, le=500), cursor: Optional[str] = None, user=Depends(cur_user)):
     if user.get('role') != 'admin':
         raise HTTPException(403, "Admin only")
-    users = await db.users.find({}, {'password_hash': 0}).to_list(200)
-    return [doc(u) for u in users]
+    return await keyset_page(request, db.users, {}, limit, cursor, {'password_hash': 0})
 
 @api_router.get("/admin/delivery-partners")
-async def get_delivery_partners(user=Depends(cur_user)):
+async def get_delivery_partners(request: Request, limit: int = Query(50, ge=1, le=500), cursor: Optional[str] = None, user=Depends(cur_user)):
+    if user.get('role') != 'admin':
+        raise HTTPException(403, "Admin only")
+    return await keyset_page(request, db.users, {'role': 'delivery_partner'}, limit, cursor, {'password_hash': 0})
+
+EXPORT_COLUMNS = {
+    'orders': ['order_number', 'created_at', 'status', 'user_name', 'user_email', 'user_phone', 'delivery_type',
+               'payment_method', 'coupon_code', 'subtotal', 'delivery_charge', 'discount', 'total', 'items',
+               'city', 'pincode', 'delivery_partner_id', 'id'],
+    'users': ['name', 'email', 'phone', 'role', 'created_at', 'id'],
+}
+
+def export_row(kind: str, d: dict) -> list:
+    if kind == 'orders':
+        d = {**d, 'city': d.get('address', {}).get('city'), 'pincode': d.get('address', {}).get('pincode'),
+             'items': '; '.join(f"{i.get('product_name')} {i.get('weight')} x{i.get('quantity')}" for i in d.get('items', []))}
+    return [d.get(c) for c in EXPORT_COLUMNS[kind]]
+
+@api_router.get("/admin/export/{kind}")
+async def export(kind: str, format: str = 'ndjson', since: Optional[str] = None, until: Optional[str] = None, user=Depends(cur_user)):
+    if user.get('role') != 'admin':
+        raise HTTPException(403, "Admin only")
+    if kind not in EXPORT_COLUMNS or format not in ('ndjson', 'csv'):
+        raise HTTPException(400, "Unsupported export")
+    q = {}
+    if since or until:
+        q['created_at'] = {k: v for k, v in (('$gte', since), ('$lt', until)) if v}
+    cur = db[kind].find(q, {'password_hash': 0}).sort(PAGE_SORT).batch_size(500)
+
+    async def source():
+        async for d in cur:
+            yield d
+        if kind == 'orders':
+            async for a in db.orders_archive.find(q, {'data': 1}).sort(PAGE_SORT).batch_size(500):
+                yield unpack(a)
+
+    async def rows():
+        if format == 'csv':
+            buf = io.StringIO()
+            w = csv.writer(buf)
+            w.writerow(EXPORT_COLUMNS[kind])
+            async for d in source():
+                w.writerow(export_row(kind, doc(d)))
+                if buf.tell() > 64 * 1024:
+                    yield buf.getvalue()
+                    buf.seek(0)
+                    buf.truncate()
+            yield buf.getvalue()
+        else:
+            async for d in source():
+                yield dumps(doc(d)) + b'\n'
+
+    media = 'text/csv' if format == 'csv' else 'application/x-ndjson'
+    filename = f"{kind}-{datetime.now(timezone.utc).date().isoformat()}.{format}"
+    return StreamingResponse(rows(), media_type=media, headers={'Content-Disposition': f'attachment; filename="{filename}"'})
+
+@api_router.get("/admin/cache-stats")
+async def cache_stats(user=Depends(cur_user)):
     if user.get('role') != 'admin':
         raise HTTPException(403, "Admin only")
-    partners = await db.users.find({'role': 'delivery_partner'}, {'password_hash': 0}).to_list(50)
-    return [doc(p) for p in partners]
+    return {'catalog': catalog.stats(), 'principals': principals.stats(), 'order_events': order_events.stats(),
+            'idempotency': idempotency.stats()}
 
 
 # ── DELIVERY ─────────────────────────────────────────────────────────────────
 
 @api_router.get("/delivery/orders")
-async def delivery_orders(user=Depends(cur_user)):
+async def delivery_orders(request: Request, limit: Optional[int] = Query(None, ge=1, le=500), cursor: Optional[str] = None, fields: Optional[str] = None, user=Depends(cur_user)):
     if user.get('role') not in ['admin', 'delivery_partner']:
         raise HTTPException(403, "Access denied")
+    proj = parse_fields(fields, ORDER_FIELDS, ORDER_LIST_PROJECTION)
     if user.get('role') == 'delivery_partner':
-        orders = await db.orders.find({'delivery_partner_id': user['id']}).sort('created_at', -1).to_list(50)
-    else:
-        orders = await db.orders.find({'status': {'$in': ['accepted', 'preparing', 'packed', 'out_for_delivery']}}).sort('created_at', -1).to_list(100)
-    return [doc(o) for o in orders]
+        return await keyset_page(request, db.orders, {'delivery_partner_id': user['id']}, limit or 50, cursor, proj)
+    q = {'status': {'$in': ['accepted', 'preparing', 'packed', 'out_for_delivery']}}
+    return await keyset_page(request, db.orders, q, limit or 100, cursor, proj)
 
 
 # ── COUPONS ──────────────────────────────────────────────────────────────────
 
+# Coupons live in the coupons collection and are compiled into coupon_book,
+# so validation and order pricing share one set of rules. Usage counters are
+# only touched when an order is placed or cancelled.
+
+def cart_lines(items) -> list:
+    lines = []
+    for i in items:
+        i = i if isinstance(i, dict) else i.model_dump()
+        p = search_index.docs.get(i.get('product_id'), {})
+        lines.append((p.get('category_slug'), float(i.get('price', 0)) * int(i.get('quantity', 1))))
+    return lines
+
+async def seed_coupons():
+    for c in DEFAULT_COUPONS:
+        await db.coupons.update_one({'code': c['code']}, {'$setOnInsert': {**c, 'active': True, 'used': 0}}, upsert=True)
+    coupon_book.invalidate()
+
 @api_router.post("/coupons/validate")
 async def validate_coupon(body: dict):
-    code = body.get('code', '').upper()
-    subtotal = float(body.get('subtotal', 0))
-    coupons = {
-        'RASRAJ10': {'value': 10, 'type': 'percent', 'min': 200, 'desc': '10% off your order'},
-        'FIRST50': {'value': 50, 'type': 'flat', 'min': 100, 'desc': '₹50 flat off'},
-        'WELCOME20': {'value': 20, 'type': 'percent', 'min': 500, 'desc': '20% off on orders above ₹500'},
-    }
-    if code not in coupons:
-        raise HTTPException(400, "Invalid coupon code")
-    c = coupons[code]
-    if subtotal < c['min']:
-        raise HTTPException(400, f"Minimum order ₹{c['min']} required")
-    discount = round(subtotal * c['value'] / 100, 2) if c['type'] == 'percent' else float(c['value'])
-    return {'valid': True, 'discount': discount, 'description': c['desc']}
+    await coupon_book.refresh(db.coupons)
+    if body.get('items'):
+        await refresh_search()
+        lines = cart_lines(body['items'])
+    else:
+        lines = [(None, float(body.get('subtotal', 0)))]
+    try:
+        c = coupon_book.get(body.get('code', ''))
+        discount = c.discount(lines)
+    except CouponError as e:
+        raise HTTPException(400, str(e))
+    return {'valid': True, 'code': c.code, 'discount': discount, 'description': c.description}
+
+@api_router.get("/admin/coupons")
+async def list_coupons(user=Depends(cur_user)):
+    if user.get('role') != 'admin':
+        raise HTTPException(403, "Admin only")
+    return [doc(c) for c in await db.coupons.find({}).sort('code', 1).to_list(500)]
+
+def coupon_doc(data: CouponReq) -> dict:
+    # Compiled before it is stored, so a rule the coupon book can't load is
+    # refused here rather than failing every checkout later.
+    d = {**data.model_dump(mode='json'), 'code': data.code.strip().upper()}
+    if not d['code']:
+        raise HTTPException(400, "Coupon code is required")
+    try:
+        Coupon(d)
+    except CouponError as e:
+        raise HTTPException(400, str(e))
+    return d
+
+@api_router.post("/admin/coupons")
+async def create_coupon(data: CouponReq, user=Depends(cur_user)):
+    if user.get('role') != 'admin':
+        raise HTTPException(403, "Admin only")
+    d = {**coupon_doc(data), 'used': 0, 'created_at': datetime.now(timezone.utc).isoformat()}
+    try:
+        r = await db.coupons.insert_one(d)
+    except DuplicateKeyError:
+        raise HTTPException(400, "Coupon code already exists")
+    coupon_book.invalidate()
+    d['id'] = str(r.inserted_id)
+    d.pop('_id', None)
+    return d
+
+@api_router.put("/admin/coupons/{code}")
+async def update_coupon(code: str, data: dict, user=Depends(cur_user)):
+    if user.get('role') != 'admin':
+        raise HTTPException(403, "Admin only")
+    data = {k: v for k, v in data.items() if k in CouponReq.model_fields and k != 'code'}
+    if not data:
+        raise HTTPException(400, "Nothing to update")
+    old = await db.coupons.find_one({'code': code.upper()})
+    if not old:
+        raise HTTPException(404, "Coupon not found")
+    try:
+        merged = CouponReq.model_validate({**{k: old[k] for k in CouponReq.model_fields if k in old}, **data})
+    except ValidationError as e:
+        raise HTTPException(400, validation_message(e))
+    d = coupon_doc(merged)
+    c = await db.coupons.find_one_and_update({'code': code.upper()}, {'$set': {k: d[k] for k in data}},
+                                             return_document=ReturnDocument.AFTER)
+    if not c:
+        raise HTTPException(404, "Coupon not found")
+    coupon_book.invalidate()
+    return doc(c)
+
+@api_router.delete("/admin/coupons/{code}")
+async def delete_coupon(code: str, user=Depends(cur_user)):
+    if user.get('role') != 'admin':
+        raise HTTPException(403, "Admin only")
+    await db.coupons.delete_one({'code': code.upper()})
+    coupon_book.invalidate()
+    return {'success': True}
 
 
 # ── SEED DATA ────────────────────────────────────────────────────────────────
@@ -528,14 +1460,16 @@ async def do_seed():
     await db.categories.delete_many({})
     await db.products.delete_many({})
     await db.users.delete_many({'email': {'$in': ['admin@rasraj.com', 'delivery@rasraj.com']}})
+    principals.clear()
+    admin_pw, delivery_pw = await asyncio.gather(hasher.hash('admin123'), hasher.hash('delivery123'))
     await db.users.insert_one({
         'name': 'Admin', 'email': 'admin@rasraj.com', 'phone': '9876543210',
-        'password_hash': bcrypt.hashpw(b'admin123', bcrypt.gensalt()).decode(),
+        'password_hash': admin_pw,
         'role': 'admin', 'addresses': [], 'created_at': datetime.now(timezone.utc).isoformat()
     })
     await db.users.insert_one({
         'name': 'Raju Kumar', 'email': 'delivery@rasraj.com', 'phone': '9876543211',
-        'password_hash': bcrypt.hashpw(b'delivery123', bcrypt.gensalt()).decode(),
+        'password_hash': delivery_pw,
         'role': 'delivery_partner', 'addresses': [], 'created_at': datetime.now(timezone.utc).isoformat()
     })
     categories = [
@@ -584,36 +1518,167 @@ async def do_seed():
         {'name': 'Kachori (Pack of 4)', 'name_hi': 'कचौरी (4 का पैक)', 'description': 'Flaky deep-fried pastry with spiced lentil filling. Served fresh with chutney.', 'description_hi': 'मसालेदार दाल भरी करारी कचौरी।', 'category_slug': 'snacks', 'prices': {'g250': 80, 'g500': 150, 'g1000': 280}, 'images': [IMG['snack']], 'ingredients': 'Maida, Lentils, Spices, Oil', 'shelf_life': 'Same day', 'in_stock': True, 'featured': False, 'badge': None, 'created_at': now},
     ]
     await db.products.insert_many(products)
+    catalog.invalidate()
+    stock_levels.invalidate()
+    await seed_coupons()
+    await refresh_search(force=True)
+    await mark_seeded()
     return len(categories), len(products)
 
+async def mark_seeded():
+    # Written last, so a worker never mistakes a half-written seed for a done one.
+    await db.meta.update_one({'_id': 'seeded'}, {'$set': {'at': datetime.now(timezone.utc).isoformat()}}, upsert=True)
+
+def bootstrap_lock() -> MongoLock:
+    return MongoLock(db.locks, 'bootstrap', lease=BOOTSTRAP_LOCK_LEASE)
+
 @api_router.post("/seed")
 async def seed():
-    cats, prods = await do_seed()
+    try:
+        async with bootstrap_lock().hold(timeout=30):
+            cats, prods = await do_seed()
+    except LockTimeout:
+        raise HTTPException(409, "Seeding already in progress")
     return {'success': True, 'categories': cats, 'products': prods}
 
 
 # ── STARTUP ──────────────────────────────────────────────────────────────────
 
-@app.on_event("startup")
+def connect():
+    global client, db
+    client = AsyncIOMotorClient(
+        os.environ['MONGO_URL'], appname='rasraj-api', event_listeners=[MongoListener(metrics)],
+        maxPoolSize=MONGO_MAX_POOL_SIZE, minPoolSize=MONGO_MIN_POOL_SIZE, maxIdleTimeMS=MONGO_MAX_IDLE_MS,
+        connectTimeoutMS=MONGO_CONNECT_TIMEOUT_MS, serverSelectionTimeoutMS=MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        socketTimeoutMS=MONGO_SOCKET_TIMEOUT_MS, waitQueueTimeoutMS=MONGO_WAIT_QUEUE_TIMEOUT_MS,
+        readPreference=MONGO_READ_PREFERENCE,
+    )
+    db = client[os.environ['DB_NAME']]
+
+async def needs_bootstrap() -> bool:
+    # An empty coupons collection is not a reason: admins may delete every
+    # coupon, and the defaults only come with a fresh seed.
+    return (not await db.meta.find_one({'_id': 'seeded'})
+            or (not await db.daily_sales.find_one({}, {'_id': 1}) and bool(await db.orders.find_one({}, {'_id': 1}))))
+
+async def bootstrap():
+    # Shared data is only written under the bootstrap lock, so workers that
+    # start together cannot seed over each other. Once seeded, no lock is taken.
+    if not await needs_bootstrap():
+        return
+    async with bootstrap_lock().hold(timeout=BOOTSTRAP_LOCK_WAIT):
+        if not await db.daily_sales.find_one({}) and await db.orders.find_one({}):
+            logger.info("Backfilling daily_sales rollups...")
+            await rebuild_daily_sales()
+        if not await db.meta.find_one({'_id': 'seeded'}):
+            if await db.categories.find_one({}) and await db.products.find_one({}):
+                await mark_seeded()   # seeded before the marker existed
+            else:
+                logger.info("Seeding demo data...")
+                await do_seed()
+                logger.info("Seed complete.")
+
+def open_http():
+    global gateway, oauth_http
+    gateway = make_gateway(RAZORPAY_KEY_ID, RAZORPAY_KEY_SECRET, RAZORPAY_BASE_URL, timeout=RAZORPAY_TIMEOUT)
+    oauth_http = httpx.AsyncClient(
+        http2=importlib.util.find_spec('h2') is not None,
+        timeout=httpx.Timeout(10, connect=5),
+        limits=httpx.Limits(max_connections=50, max_keepalive_connections=20, keepalive_expiry=60),
+    )
+
+async def close_http():
+    global gateway, oauth_http
+    if gateway is not None:
+        await gateway.close()
+    if oauth_http is not None:
+        await oauth_http.aclose()
+    gateway = oauth_http = None
+
 async def startup():
-    count = await db.categories.count_documents({})
-    if count == 0:
-        logger.info("Seeding demo data...")
-        await do_seed()
-        logger.info("Seed complete.")
+    global recs_lock
+    if client is None:
+        connect()
+    open_http()
+    order_numbers.counters = db.counters
+    idempotency.coll = db.idempotency_keys
+    if 'order_number_unique' not in await db.orders.index_information():
+        renamed = await renumber_duplicates(db.orders, order_numbers)
+        if renamed:
+            logger.info("Renumbered %d orders with duplicate legacy order numbers", renamed)
+    await ensure_indexes(db)
+    await bootstrap()
+    await refresh_search(force=True)
+    await coupon_book.refresh(db.coupons, force=True)
+    rec_table.update(await load_table(db.recommendations))
+    recs_lock = MongoLock(db.locks, RECS_LOCK, lease=2 * RECS_REFRESH_INTERVAL or 60)
+    background_tasks.append(asyncio.create_task(recommendations_loop()))
+    if ARCHIVE_AFTER_DAYS:
+        background_tasks.append(asyncio.create_task(archive_loop()))
+    if ORDER_EVENTS_SOURCE == 'changestream':
+        background_tasks.append(asyncio.create_task(watch_orders(db.orders, order_events, doc)))
+    ready.set()
+
+async def shutdown():
+    global client
+    ready.clear()
+    for t in background_tasks + [search_refresh]:
+        if t is not None:
+            t.cancel()
+    background_tasks.clear()
+    if client is not None:
+        client.close()
+        client = None
+    await close_http()
+    hasher.close()
+    images.close()
+
+@asynccontextmanager
+async def lifespan(app):
+    await startup()
+    try:
+        yield
+    finally:
+        await shutdown()
 
 
 # ── SETUP ────────────────────────────────────────────────────────────────────
 
-app.include_router(api_router)
-app.add_middleware(
-    CORSMiddleware,
-    allow_credentials=True,
-    allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+async def get_metrics(request: Request):
+    if METRICS_TOKEN and request.headers.get('authorization') != f'Bearer {METRICS_TOKEN}':
+        raise HTTPException(401, "Unauthorized")
+    return Response(metrics.render(), media_type='text/plain; version=0.0.4')
 
-@app.on_event("shutdown")
-async def shutdown():
-    client.close()
+async def liveness():
+    return {'status': 'ok'}
+
+async def readiness():
+    # ready once startup has finished, and only while Mongo answers
+    if not ready.is_set():
+        raise HTTPException(503, "Starting up")
+    try:
+        await asyncio.wait_for(db.command('ping'), READY_TIMEOUT)
+    except Exception:
+        raise HTTPException(503, "Database unavailable")
+    return {'status': 'ready'}
+
+def create_app() -> FastAPI:
+    # uvicorn server:app, or server:create_app --factory
+    app = FastAPI(title="RAS RAJ API", lifespan=lifespan)
+    app.add_api_route("/metrics", get_metrics, methods=["GET"])
+    app.add_api_route("/health/live", liveness, methods=["GET"])
+    app.add_api_route("/health/ready", readiness, methods=["GET"])
+    app.include_router(api_router)
+    app.add_middleware(MetricsMiddleware, metrics=metrics, slow_ms=SLOW_REQUEST_MS,
+                       skip={'/metrics', '/health/live', '/health/ready', '/api/events/orders'})
+    app.add_middleware(
+        CORSMiddleware,
+        allow_credentials=True,
+        allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
+        allow_methods=["*"],
+        allow_headers=["*"],
+        expose_headers=["ETag", "X-Next-Cursor", "Idempotent-Replayed"],
+    )
+    return app
+
+app = create_app()
@@ -0,0 +1,150 @@
+import asyncio
+import time
+
+from bson import ObjectId
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+WEIGHTS = ('g250', 'g500', 'g1000')
+# order lines carry the storefront labels
+WEIGHT_KEYS = {'250g': 'g250', '500g': 'g500', '1kg': 'g1000', **{w: w for w in WEIGHTS}}
+
+
+class OutOfStock(Exception):
+    def __init__(self, lines: list):
+        super().__init__("Out of stock")
+        self.lines = lines   # [(product_id, weight)]
+
+
+def stock_doc(stock) -> dict:
+    # Stock as stored: only tracked weights, as ints. A weight without a
+    # count is not tracked and never runs out.
+    stock = stock if isinstance(stock, dict) else (stock.model_dump() if stock is not None else {})
+    out = {}
+    for w, q in stock.items():
+        if w not in WEIGHTS:
+            raise ValueError(f"Unknown weight: {w}")
+        if q is None or q == '':
+            continue
+        q = int(q)
+        if q < 0:
+            raise ValueError(f"Stock for {w} cannot be negative")
+        out[w] = q
+    return out
+
+
+def demand(items) -> dict:
+    # -> {(product_id, weight key): quantity} for the order's lines
+    out = {}
+    for i in items:
+        i = i if isinstance(i, dict) else i.model_dump()
+        w = WEIGHT_KEYS.get(i.get('weight'))
+        n = int(i.get('quantity', 1))
+        if n < 1:
+            # a negative line would pass the $gte guard and add stock
+            raise ValueError(f"Quantity must be at least 1, got {n}")
+        if w and ObjectId.is_valid(i.get('product_id') or ''):
+            key = (i['product_id'], w)
+            out[key] = out.get(key, 0) + n
+    return out
+
+
+async def reserve(products, wanted: dict) -> list:
+    # Takes stock for every tracked line in one unordered bulk_write, or for
+    # none of them. Each update is an upsert guarded by `$gte`, so a line
+    # without enough stock surfaces as a duplicate key error at its index
+    # (as in coupons.redeem); lines that did apply are then given back.
+    pids = list({ObjectId(pid) for pid, _ in wanted})
+    tracked = set()
+    async for p in products.find({'_id': {'$in': pids}, 'stock': {'$exists': True}}, {'stock': 1}):
+        tracked |= {(str(p['_id']), w) for w, q in (p.get('stock') or {}).items() if isinstance(q, int)}
+    lines = [{'product_id': pid, 'weight': w, 'quantity': n} for (pid, w), n in wanted.items() if (pid, w) in tracked]
+    if not lines:
+        return []
+    ops = [UpdateOne({'_id': ObjectId(l['product_id']), f"stock.{l['weight']}": {'$gte': l['quantity']}},
+                     {'$inc': {f"stock.{l['weight']}": -l['quantity']}}, upsert=True) for l in lines]
+    failed, upserted = set(), {}
+    try:
+        r = await products.bulk_write(ops, ordered=False)
+        upserted = r.upserted_ids or {}
+    except BulkWriteError as e:
+        errors = e.details.get('writeErrors', [])
+        failed = {err['index'] for err in errors}
+        upserted = {u['index']: u['_id'] for u in e.details.get('upserted', [])}
+        if any(err.get('code') != 11000 for err in errors):
+            await unreserve(products, [l for i, l in enumerate(lines) if i not in failed and i not in upserted])
+            raise
+    if upserted:
+        # the product was deleted after it was read; drop the stub the upsert made
+        await products.delete_many({'_id': {'$in': list(upserted.values())}, 'name': {'$exists': False}})
+        failed |= set(upserted)
+    if failed:
+        await unreserve(products, [l for i, l in enumerate(lines) if i not in failed])
+        raise OutOfStock([(lines[i]['product_id'], lines[i]['weight']) for i in sorted(failed)])
+    return lines
+
+
+async def unreserve(products, lines: list):
+    # Gives reserved stock back, e.g. when an order is cancelled. Weights
+    # that stopped being tracked meanwhile are left alone.
+    if lines:
+        await products.bulk_write([
+            UpdateOne({'_id': ObjectId(l['product_id']), f"stock.{l['weight']}": {'$exists': True}},
+                      {'$inc': {f"stock.{l['weight']}": l['quantity']}}) for l in lines
+        ], ordered=False)
+
+
+class StockLevels:
+    # In-memory copy of tracked stock for product listings. Reservations on
+    # this worker adjust it directly; the TTL picks up other workers' orders.
+    # on_change fires only when a weight sells out or comes back, so cached
+    # listings are rebuilt then rather than on every order.
+
+    def __init__(self, ttl: float = 5, on_change=None):
+        self.ttl = ttl
+        self.on_change = on_change
+        self.levels = {}   # product id -> {weight: quantity}
+        self.loaded_at = 0.0
+        self._lock = asyncio.Lock()
+
+    def invalidate(self):
+        self.loaded_at = 0.0
+
+    def _sold_out_set(self) -> set:
+        return {(pid, w) for pid, s in self.levels.items() for w, q in s.items() if q <= 0}
+
+    def _replace(self, levels: dict):
+        before = self._sold_out_set()
+        self.levels = levels
+        if self.on_change and self._sold_out_set() != before:
+            self.on_change()
+
+    async def refresh(self, coll, force: bool = False):
+        if not force and time.monotonic() - self.loaded_at < self.ttl:
+            return
+        async with self._lock:
+            if not force and time.monotonic() - self.loaded_at < self.ttl:
+                return
+            levels = {}
+            async for p in coll.find({'stock': {'$exists': True}}, {'stock': 1}):
+                s = {w: q for w, q in (p.get('stock') or {}).items() if isinstance(q, int)}
+                if s:
+                    levels[str(p['_id'])] = s
+            self._replace(levels)
+            self.loaded_at = time.monotonic()
+
+    def adjust(self, lines: list, sign: int):
+        # sign -1 for a reservation, +1 for a release
+        flipped = False
+        for l in lines:
+            s = self.levels.get(l['product_id'])
+            if s is None or l['weight'] not in s:
+                continue
+            was_out = s[l['weight']] <= 0
+            s[l['weight']] += sign * l['quantity']
+            flipped |= (s[l['weight']] <= 0) != was_out
+        if flipped and self.on_change:
+            self.on_change()
+
+    def sold_out(self, pid: str) -> list:
+        return [w for w, q in self.levels.get(pid, {}).items() if q <= 0]
@@ -0,0 +1,40 @@
+import os
+import sys
+from contextlib import asynccontextmanager
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+os.environ.setdefault('MONGO_URL', 'mongodb://localhost:27017')
+os.environ.setdefault('DB_NAME', 'rasraj_test')
+os.environ.setdefault('BCRYPT_ROUNDS', '4')
+os.environ.setdefault('ARCHIVE_AFTER_DAYS', '0')
+
+
+@asynccontextmanager
+async def running_app():
+    # The app in-process on a fresh in-memory database, seeded by startup();
+    # yields an httpx client for /api.
+    import httpx
+    from mongomock_motor import AsyncMongoMockClient
+
+    import server
+    server.client = AsyncMongoMockClient()
+    server.db = server.client[os.environ['DB_NAME']]
+    for cache in (server.catalog, server.stock_levels, server.coupon_book):
+        cache.invalidate()
+    server.principals.clear()
+    server.rec_table.clear()
+    await server.startup()
+    try:
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=server.app), base_url='http://app/api') as http:
+            yield http
+    finally:
+        await server.shutdown()
+
+
+async def login(http, email, password) -> dict:
+    r = await http.post('/auth/login', json={'email': email, 'password': password})
+    r.raise_for_status()
+    return {'Authorization': f"Bearer {r.json()['token']}"}
@@ -0,0 +1,139 @@
+import asyncio
+import json
+
+from conftest import login, running_app
+
+ADDRESS = {'line1': '12 Sadar Bazar', 'city': 'Agra', 'pincode': '282001', 'phone': '9876500000'}
+
+
+async def customer(http, n=1) -> dict:
+    r = await http.post('/auth/register', json={'name': f'Customer {n}', 'email': f'c{n}@example.com',
+                                                'password': 'secret123'})
+    r.raise_for_status()
+    return {'Authorization': f"Bearer {r.json()['token']}"}
+
+
+async def tracked_product(http, admin, stock: int) -> dict:
+    p = (await http.get('/products', params={'limit': 1})).json()[0]
+    r = await http.put(f"/admin/products/{p['id']}/stock", json={'g250': stock}, headers=admin)
+    r.raise_for_status()
+    return p
+
+
+async def stock_of(http, admin, pid) -> int:
+    r = await http.get('/products', params={'fields': '*', 'limit': 100}, headers=admin)
+    return next(p for p in r.json() if p['id'] == pid)['stock'].get('g250')
+
+
+def order_body(p, quantity=1, **extra) -> dict:
+    item = {'product_id': p['id'], 'product_name': p['name'], 'weight': '250g',
+            'quantity': quantity, 'price': p['prices']['g250']}
+    return {'items': [item], 'address': ADDRESS, **extra}
+
+
+def test_checkout_reserves_stock_and_cancel_returns_it_once():
+    async def run():
+        async with running_app() as http:
+            admin = await login(http, 'admin@rasraj.com', 'admin123')
+            auth = await customer(http)
+            p = await tracked_product(http, admin, 3)
+
+            r = await http.post('/orders', json=order_body(p, 2), headers=auth)
+            assert r.status_code == 200, r.text
+            order = r.json()
+            assert order['status'] == 'placed' and order['order_number']
+            assert await stock_of(http, admin, p['id']) == 1
+
+            r = await http.post('/orders', json=order_body(p, 2), headers=auth)
+            assert r.status_code == 409 and 'Out of stock' in r.json()['detail']
+            assert await stock_of(http, admin, p['id']) == 1
+
+            r = await http.put(f"/orders/{order['id']}/status", json={'status': 'cancelled'}, headers=admin)
+            assert r.status_code == 200 and r.json()['status'] == 'cancelled'
+            assert await stock_of(http, admin, p['id']) == 3
+
+            # repeating the cancel, with or without a partner, must not hand the stock back again
+            partner = (await http.post('/auth/login', json={'email': 'delivery@rasraj.com',
+                                                            'password': 'delivery123'})).json()['id']
+            for body in ({'status': 'cancelled'}, {'status': 'cancelled', 'delivery_partner_id': partner}):
+                r = await http.put(f"/orders/{order['id']}/status", json=body, headers=admin)
+                assert r.status_code == 409
+            assert await stock_of(http, admin, p['id']) == 3
+    asyncio.run(run())
+
+
+def test_status_transitions_follow_the_state_machine():
+    async def run():
+        async with running_app() as http:
+            admin = await login(http, 'admin@rasraj.com', 'admin123')
+            auth = await customer(http)
+            p = (await http.get('/products', params={'limit': 1})).json()[0]
+            ids = [(await http.post('/orders', json=order_body(p), headers=auth)).json()['id'] for _ in range(2)]
+
+            r = await http.put(f"/orders/{ids[0]}/status", json={'status': 'delivered'}, headers=admin)
+            assert r.status_code == 409 and 'placed to delivered' in r.json()['detail']
+            r = await http.put(f"/orders/{ids[0]}/status", json={'status': 'accepted'}, headers=admin)
+            assert r.status_code == 200
+
+            r = await http.put(f"/orders/{ids[0]}/status", json={'status': 'accepted'}, headers=auth)
+            assert r.status_code == 403
+
+            r = await http.post('/orders/status/bulk', headers=admin, json={'updates': [
+                {'order_id': ids[0], 'status': 'preparing'},
+                {'order_id': ids[0].upper(), 'status': 'packed'},
+                {'order_id': ids[1], 'status': 'out_for_delivery'},
+                {'order_id': 'nope', 'status': 'accepted'},
+            ]})
+            body = r.json()
+            assert r.status_code == 200 and (body['updated'], body['failed']) == (1, 3)
+            assert [x['ok'] for x in body['results']] == [True, False, False, False]
+            assert body['results'][1]['error'] == 'Duplicate order in request'
+            assert 'placed to out_for_delivery' in body['results'][2]['error']
+            assert (await http.get(f"/orders/{ids[0]}", headers=admin)).json()['status'] == 'preparing'
+    asyncio.run(run())
+
+
+def test_order_placement_replays_for_a_repeated_idempotency_key():
+    async def run():
+        async with running_app() as http:
+            admin = await login(http, 'admin@rasraj.com', 'admin123')
+            auth = await customer(http)
+            p = await tracked_product(http, admin, 5)
+            headers = {**auth, 'Idempotency-Key': 'checkout-1'}
+
+            first = await http.post('/orders', json=order_body(p, 2), headers=headers)
+            again = await http.post('/orders', json=order_body(p, 2), headers=headers)
+            assert first.status_code == again.status_code == 200
+            assert again.json()['id'] == first.json()['id']
+            assert again.headers.get('idempotent-replayed') == 'true'
+            assert 'idempotent-replayed' not in first.headers
+            assert len((await http.get('/orders', headers=auth)).json()) == 1
+            assert await stock_of(http, admin, p['id']) == 3
+
+            r = await http.post('/orders', json=order_body(p, 1), headers=headers)
+            assert r.status_code == 422
+    asyncio.run(run())
+
+
+def test_import_reports_malformed_rows_and_keeps_going():
+    async def run():
+        async with running_app() as http:
+            admin = await login(http, 'admin@rasraj.com', 'admin123')
+            rows = [
+                {'name': 'Peda', 'prices': {'g250': 150, 'g500': 290, 'g1000': 560}},
+                {'name': 'Bad prices', 'prices': 5},
+                {'name': 'Bad stock', 'stock': 'x'},
+                {'name': 'Bad category', 'category_slug': ['milk-sweets']},
+                {'name': 'Barfi', 'prices': {'g250': 200, 'g500': 390, 'g1000': 760}},
+            ]
+            base = {'name_hi': 'मिठाई', 'description': 'Fresh today', 'category_slug': 'milk-sweets'}
+            body = '\n'.join(json.dumps({**base, **r}) for r in rows)
+            r = await http.post('/admin/products/import', params={'format': 'ndjson'}, content=body, headers=admin)
+            assert r.status_code == 200, r.text
+            result = r.json()
+            assert (result['processed'], result['inserted'], result['failed']) == (5, 2, 3)
+            assert [e['row'] for e in result['errors']] == [2, 3, 4]
+            for name in ('Peda', 'Barfi'):
+                hits = (await http.get('/products', params={'search': name})).json()
+                assert name in {p['name'] for p in hits}
+    asyncio.run(run())
@@ -0,0 +1,57 @@
+import asyncio
+
+import pytest
+
+from bulk_import import RowError, normalize, records
+
+
+async def chunks(*parts):
+    for p in parts:
+        yield p.encode()
+
+
+def collect(fmt, *parts):
+    async def run():
+        return [r async for r in records(chunks(*parts), fmt)]
+    return asyncio.run(run())
+
+
+def test_normalize_flattens_csv_fields():
+    d = normalize({'name': 'Peda', 'g250': '120', 'stock_g500': '4', 'stock_g1000': '',
+                   'featured': 'Yes', 'images': 'a.jpg | b.jpg'})
+    assert d == {'name': 'Peda', 'prices': {'g250': 120.0}, 'stock': {'g500': 4, 'g1000': None},
+                 'featured': True, 'images': ['a.jpg', 'b.jpg']}
+
+
+@pytest.mark.parametrize('row', [
+    {'prices': 5},
+    {'prices': [1]},
+    {'prices': 'cheap'},
+    {'stock': [1, 2]},
+    {'stock': 'x'},
+    {'prices': {'g250': [1]}},
+    {'stock': {'g250': 'lots'}},
+    {'in_stock': 'maybe'},
+])
+def test_normalize_rejects_malformed_rows(row):
+    with pytest.raises(RowError):
+        normalize(row)
+
+
+def test_product_op_rejects_non_string_category():
+    import server
+    with pytest.raises(RowError, match='category_slug'):
+        server.product_op({'name': 'Peda', 'category_slug': ['namkeen']}, {'namkeen'})
+
+
+def test_records_reports_bad_ndjson_lines():
+    rows = collect('ndjson', '{"name": "a"}\n[1]\nnot json\n\n{"name"', ': "b"}\n')
+    assert [n for n, _ in rows] == [1, 2, 3, 5]
+    assert rows[0][1] == {'name': 'a'} and rows[3][1] == {'name': 'b'}
+    assert all(isinstance(r, RowError) for _, r in rows[1:3])
+
+
+def test_records_joins_quoted_csv_newlines():
+    rows = collect('csv', 'name,description\n', 'Peda,"soft\nand sweet"\n', ',\n', 'Barfi,"open\n')
+    assert rows[0] == (2, {'name': 'Peda', 'description': 'soft\nand sweet'})
+    assert rows[1][0] == 5 and isinstance(rows[1][1], RowError)
@@ -0,0 +1,109 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+import server
+from indexes import ensure_indexes
+from server import CartItemReq, add_cart, update_cart
+
+
+class Interleaved:
+    # Yields to the event loop before every call, so concurrent requests
+    # interleave between round trips as they do against a real server, and
+    # counts the upserts that collided on the unique user_id index.
+
+    def __init__(self, coll):
+        self.coll = coll
+        self.duplicates = 0
+
+    def __getattr__(self, name):
+        attr = getattr(self.coll, name)
+        if not callable(attr):
+            return attr
+
+        async def call(*args, **kwargs):
+            await asyncio.sleep(0)
+            return await attr(*args, **kwargs)
+        return call
+
+    async def find_one_and_update(self, filter, update, projection=None, upsert=False,
+                                  return_document=ReturnDocument.BEFORE, **kwargs):
+        # mongomock's find_one_and_update applies `items.$` to the first array
+        # element; update_one matches it properly. Nothing yields between the
+        # calls below, so together they stay one atomic step.
+        assert return_document == ReturnDocument.AFTER
+        await asyncio.sleep(0)
+        found = await self.coll.find_one(filter, {'_id': 1})
+        if not found and not upsert:
+            return None
+        try:
+            r = await self.coll.update_one({**filter, '_id': found['_id']} if found else filter, update,
+                                           upsert=upsert, **kwargs)
+        except DuplicateKeyError:
+            self.duplicates += 1
+            raise
+        return await self.coll.find_one({'_id': found['_id'] if found else r.upserted_id}, projection)
+
+
+@pytest.fixture
+def carts(monkeypatch):
+    db = AsyncMongoMockClient()['rasraj_test']
+    asyncio.run(ensure_indexes(db))
+    carts = Interleaved(db.carts)
+    monkeypatch.setattr(server, 'db', SimpleNamespace(carts=carts))
+    return carts
+
+
+def quantities(cart) -> dict:
+    return {(i['product_id'], i['weight']): i['quantity'] for i in cart['items']}
+
+
+def test_parallel_adds_to_a_missing_cart_lose_no_increments(carts):
+    user = {'id': 'u1'}
+
+    async def run():
+        await asyncio.gather(*(add_cart(CartItemReq(product_id='p1', weight='g250'), user) for _ in range(50)))
+        return await carts.find_one({'user_id': 'u1'})
+
+    cart = asyncio.run(run())
+    assert quantities(cart) == {('p1', 'g250'): 50}
+    # every add but the first raced the upsert that created the cart and retried as an $inc
+    assert carts.duplicates == 49
+
+
+def test_parallel_adds_of_new_lines_keep_one_line_each(carts):
+    user = {'id': 'u2'}
+    lines = [('p1', 'g250'), ('p1', 'g500'), ('p2', 'g250'), ('p3', 'g1000')]
+
+    async def run():
+        await add_cart(CartItemReq(product_id='p0', weight='g250', quantity=2), user)
+        await asyncio.gather(*(add_cart(CartItemReq(product_id=p, weight=w), user)
+                               for _ in range(25) for p, w in lines))
+        return await carts.find_one({'user_id': 'u2'})
+
+    cart = asyncio.run(run())
+    assert len(cart['items']) == len(lines) + 1
+    assert quantities(cart) == {('p0', 'g250'): 2, **{line: 25 for line in lines}}
+
+
+def test_update_cart_sets_and_removes_lines(carts):
+    user = {'id': 'u3'}
+
+    async def run():
+        await add_cart(CartItemReq(product_id='p1', weight='g250', quantity=3), user)
+        await add_cart(CartItemReq(product_id='p2', weight='g500'), user)
+        try:
+            set_to = await update_cart(CartItemReq(product_id='p1', weight='g250', quantity=7), user)
+        except NotImplementedError:
+            set_to = None   # mongomock has no arrayFilters
+        removed = await update_cart(CartItemReq(product_id='p2', weight='g500', quantity=0), user)
+        return set_to, removed
+
+    set_to, removed = asyncio.run(run())
+    if set_to is not None:
+        assert quantities(set_to) == {('p1', 'g250'): 7, ('p2', 'g500'): 1}
+    assert ('p2', 'g500') not in quantities(removed)
@@ -20,6 +20,8 @@ export default function ProductCard({ product }) {
 
   const name = lang === 'hi' && product.name_hi ? product.name_hi : product.name;
   const price = product.prices?.g250 || 0;
+  const soldOut = product.sold_out || [];
+  const available = product.in_stock && soldOut.length < 3;
   const image = product.images?.[0] || 'https://images.pexels.com/photos/14610769/pexels-photo-14610769.jpeg?auto=compress&cs=tinysrgb&w=400';
 
   const handleAddToCart = (e) => {
@@ -51,7 +53,7 @@ export default function ProductCard({ product }) {
             {t(product.badge)}
           </span>
         )}
-        {!product.in_stock && (
+        {!available && (
           <div className="absolute inset-0 bg-black/50 flex items-center justify-center">
             <span className="text-white text-xs font-bold bg-black/60 px-3 py-1 rounded-full">{t('outOfStock')}</span>
           </div>
@@ -69,7 +71,7 @@ export default function ProductCard({ product }) {
             <span className="text-[#9B111E] font-bold text-sm">₹{price}</span>
             <span className="text-[10px] text-gray-400"> /250g</span>
           </div>
-          {product.in_stock && (
+          {available && !soldOut.includes('g250') && (
             <button
               onClick={handleAddToCart}
               className="p-1.5 bg-[#9B111E] text-white rounded-full hover:bg-[#7A0C16] transition-colors active:scale-95"
@@ -0,0 +1,28 @@
+import { useEffect, useRef } from "react";
+import { useAuth } from "@/contexts/AuthContext";
+
+const API = `${process.env.REACT_APP_BACKEND_URL}/api`;
+
+// Subscribes to server-sent order events. `onOrder` receives the full order
+// for `order.created` / `order.status`; `onResync` is called when the server
+// dropped events for this client and the list should be refetched.
+export function useOrderEvents(onOrder, onResync) {
+  const { token } = useAuth();
+  const handlers = useRef({ onOrder, onResync });
+  handlers.current = { onOrder, onResync };
+
+  useEffect(() => {
+    if (!token || typeof EventSource === "undefined") return;
+    const es = new EventSource(`${API}/events/orders?token=${encodeURIComponent(token)}`);
+    const handle = (e) => handlers.current.onOrder?.(JSON.parse(e.data).order, e.type);
+    es.addEventListener("order.created", handle);
+    es.addEventListener("order.status", handle);
+    es.addEventListener("resync", () => handlers.current.onResync?.());
+    return () => es.close();
+  }, [token]);
+}
+
+export const upsertOrder = (orders, order) =>
+  orders.some(o => o.id === order.id)
+    ? orders.map(o => (o.id === order.id ? order : o))
+    : [order, ...orders];
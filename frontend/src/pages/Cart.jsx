@@ -28,7 +28,7 @@ export default function Cart() {
     if (!coupon.trim()) return;
     setCouponLoading(true);
     try {
-      const r = await axios.post(`${API}/coupons/validate`, { code: coupon, subtotal });
+      const r = await axios.post(`${API}/coupons/validate`, { code: coupon, subtotal, items });
       setDiscount(r.data.discount);
       setCouponDesc(r.data.description);
       toast.success(`Coupon applied! ${r.data.description}`);
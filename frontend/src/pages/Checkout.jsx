@@ -1,4 +1,4 @@
-import { useState, useEffect } from "react";
+import { useState, useEffect, useRef } from "react";
 import { useNavigate, useLocation } from "react-router-dom";
 import axios from "axios";
 import { MapPin, CreditCard, Truck, Home, CheckCircle, Loader2, ArrowLeft } from "lucide-react";
@@ -10,6 +10,7 @@ import { useLanguage } from "@/contexts/LanguageContext";
 import { toast } from "sonner";
 
 const API = `${process.env.REACT_APP_BACKEND_URL}/api`;
+const newKey = () => window.crypto?.randomUUID?.() || `${Date.now()}-${Math.random().toString(36).slice(2)}`;
 
 export default function Checkout() {
   const { items, subtotal, clearCart } = useCart();
@@ -21,6 +22,9 @@ export default function Checkout() {
 
   const [step, setStep] = useState(1);
   const [placing, setPlacing] = useState(false);
+  // Reused while a checkout attempt is retried after a network failure, so
+  // the server can replay the first result instead of placing a second order.
+  const attemptKey = useRef(newKey());
   const [paymentMethod, setPaymentMethod] = useState('cod');
   const [deliveryType, setDeliveryType] = useState('delivery');
   const [address, setAddress] = useState({
@@ -60,7 +64,8 @@ export default function Checkout() {
     if (!ok) { toast.error("Payment gateway unavailable. Switching to COD."); return null; }
     try {
       const keyRes = await axios.get(`${API}/payment/key`, { headers: authHeaders() });
-      const orderRes = await axios.post(`${API}/payment/create-order`, { amount: finalTotal }, { headers: authHeaders() });
+      const orderRes = await axios.post(`${API}/payment/create-order`, { amount: finalTotal },
+        { headers: { ...authHeaders(), 'Idempotency-Key': attemptKey.current } });
       if (orderRes.data.mock) {
         // Mock payment mode
         toast.info("Using mock payment (Razorpay keys not configured)");
@@ -99,6 +104,7 @@ export default function Checkout() {
           paymentData = { razorpay_payment_id: rzpData.razorpay_payment_id, razorpay_order_id: rzpData.razorpay_order_id };
         } catch (e) {
           toast.error("Payment cancelled or failed");
+          if (e.response || !e.request) attemptKey.current = newKey();
           setPlacing(false);
           return;
         }
@@ -121,12 +127,13 @@ export default function Checkout() {
         ...paymentData,
       };
 
-      const r = await axios.post(`${API}/orders`, orderData, { headers: authHeaders() });
+      const r = await axios.post(`${API}/orders`, orderData, { headers: { ...authHeaders(), 'Idempotency-Key': attemptKey.current } });
       clearCart();
       toast.success(t('orderPlaced'));
       navigate('/orders', { state: { newOrder: r.data } });
     } catch (e) {
       toast.error(e.response?.data?.detail || "Failed to place order");
+      if (e.response) attemptKey.current = newKey();
     } finally { setPlacing(false); }
   };
 
@@ -68,6 +68,7 @@ export default function ProductDetail() {
   const description = lang === 'hi' && product.description_hi ? product.description_hi : product.description;
   const weightKey = WEIGHT_OPTIONS.find(w => w.label === selectedWeight)?.key;
   const price = product.prices?.[weightKey] || 0;
+  const soldOut = product.sold_out || [];
   const images = product.images?.length > 0 ? product.images : ['https://images.pexels.com/photos/14610769/pexels-photo-14610769.jpeg?auto=compress&cs=tinysrgb&w=400'];
 
   const handleAddToCart = () => {
@@ -138,11 +139,11 @@ export default function ProductDetail() {
                   <button
                     key={w.label}
                     onClick={() => setSelectedWeight(w.label)}
-                    className={`flex-1 py-2.5 rounded-xl border-2 text-sm font-semibold transition-all ${selectedWeight === w.label ? 'bg-[#9B111E] text-white border-[#9B111E]' : 'bg-white text-[#2A2A2A] border-[#E6D5BC] hover:border-[#D4AF37]'}`}
+                    className={`flex-1 py-2.5 rounded-xl border-2 text-sm font-semibold transition-all ${selectedWeight === w.label ? 'bg-[#9B111E] text-white border-[#9B111E]' : 'bg-white text-[#2A2A2A] border-[#E6D5BC] hover:border-[#D4AF37]'} ${soldOut.includes(w.key) ? 'opacity-50' : ''}`}
                     data-testid={`weight-${w.label}`}
                   >
                     <div>{w.label}</div>
-                    <div className={`text-xs ${selectedWeight === w.label ? 'text-white/80' : 'text-[#9B111E]'}`}>₹{product.prices?.[w.key] || 0}</div>
+                    <div className={`text-xs ${selectedWeight === w.label ? 'text-white/80' : 'text-[#9B111E]'}`}>{soldOut.includes(w.key) ? t('outOfStock') : `₹${product.prices?.[w.key] || 0}`}</div>
                   </button>
                 ))}
               </div>
@@ -155,7 +156,7 @@ export default function ProductDetail() {
             </div>
 
             {/* Quantity + Add to Cart */}
-            {product.in_stock ? (
+            {product.in_stock && !soldOut.includes(weightKey) ? (
               <div className="flex gap-3 mb-6">
                 <div className="flex items-center gap-2 bg-white rounded-full border-2 border-[#E6D5BC] px-3">
                   <button onClick={() => setQty(q => Math.max(1, q - 1))} className="text-[#9B111E] p-1" data-testid="qty-decrease"><Minus className="h-4 w-4" /></button>
@@ -4,10 +4,20 @@ import axios from "axios";
 import { LayoutDashboard, Package, Grid3X3, ClipboardList, LogOut, Menu, X, RefreshCw } from "lucide-react";
 import { useAuth } from "@/contexts/AuthContext";
 import { useLanguage } from "@/contexts/LanguageContext";
+import { useOrderEvents, upsertOrder } from "@/hooks/use-order-events";
 import { toast } from "sonner";
 
 const API = `${process.env.REACT_APP_BACKEND_URL}/api`;
 const STATUSES = ['placed', 'accepted', 'preparing', 'packed', 'out_for_delivery', 'delivered', 'cancelled'];
+// mirrors ORDER_TRANSITIONS in backend/server.py
+const TRANSITIONS = {
+  placed: ['accepted', 'preparing', 'packed', 'cancelled'],
+  accepted: ['preparing', 'packed', 'out_for_delivery', 'cancelled'],
+  preparing: ['packed', 'out_for_delivery', 'cancelled'],
+  packed: ['out_for_delivery', 'delivered', 'cancelled'],
+  out_for_delivery: ['delivered', 'cancelled'],
+  delivered: [], cancelled: [],
+};
 const STATUS_COLORS = {
   placed: 'bg-blue-100 text-blue-700', accepted: 'bg-green-100 text-green-700',
   preparing: 'bg-yellow-100 text-yellow-700', packed: 'bg-purple-100 text-purple-700',
@@ -20,6 +30,8 @@ export default function AdminOrders() {
   const [partners, setPartners] = useState([]);
   const [loading, setLoading] = useState(true);
   const [filter, setFilter] = useState('all');
+  const [selected, setSelected] = useState([]);
+  const [bulkStatus, setBulkStatus] = useState('');
   const [sidebarOpen, setSidebarOpen] = useState(false);
   const { authHeaders, logout } = useAuth();
   const { t } = useLanguage();
@@ -35,6 +47,8 @@ export default function AdminOrders() {
 
   useEffect(() => { fetchData(); }, []);
 
+  useOrderEvents(order => setOrders(prev => upsertOrder(prev, order)), () => fetchData());
+
   const fetchData = async () => {
     try {
       const [ordRes, partRes] = await Promise.all([
@@ -52,7 +66,23 @@ export default function AdminOrders() {
       await axios.put(`${API}/orders/${ordId}/status`, { status, delivery_partner_id: deliveryPartnerId }, { headers: authHeaders() });
       toast.success(`Status updated to ${status}`);
       fetchData();
-    } catch (e) { toast.error("Failed to update status"); }
+    } catch (e) { toast.error(e.response?.data?.detail || "Failed to update status"); }
+  };
+
+  const toggleSelected = (ordId) => setSelected(prev => prev.includes(ordId) ? prev.filter(i => i !== ordId) : [...prev, ordId]);
+
+  const bulkUpdate = async () => {
+    if (!bulkStatus || selected.length === 0) return;
+    try {
+      const res = await axios.post(`${API}/orders/status/bulk`, {
+        updates: selected.map(order_id => ({ order_id, status: bulkStatus })),
+      }, { headers: authHeaders() });
+      const { updated, failed, results } = res.data;
+      if (updated) toast.success(`${updated} orders moved to ${bulkStatus.replace('_', ' ')}`);
+      if (failed) toast.error(`${failed} not updated: ${results.find(r => !r.ok).error}`);
+      setSelected(results.filter(r => !r.ok).map(r => r.id));
+      fetchData();
+    } catch (e) { toast.error(e.response?.data?.detail || "Failed to update orders"); }
   };
 
   const filtered = filter === 'all' ? orders : orders.filter(o => o.status === filter);
@@ -105,6 +135,19 @@ export default function AdminOrders() {
             ))}
           </div>
 
+          {/* Bulk Update */}
+          {selected.length > 0 && (
+            <div className="sticky top-14 z-10 mb-3 flex flex-wrap items-center gap-2 bg-white border border-[#D4AF37] rounded-xl px-3 py-2" data-testid="bulk-status-bar">
+              <span className="text-xs font-semibold text-[#2A2A2A]">{selected.length} selected</span>
+              <select value={bulkStatus} onChange={e => setBulkStatus(e.target.value)} className="text-xs border border-[#E6D5BC] rounded px-2 py-1">
+                <option value="">Move to…</option>
+                {STATUSES.filter(s => s !== 'placed').map(s => <option key={s} value={s}>{s.replace('_', ' ')}</option>)}
+              </select>
+              <button onClick={bulkUpdate} disabled={!bulkStatus} className="text-xs px-3 py-1 rounded-full bg-[#9B111E] text-white font-semibold disabled:opacity-50" data-testid="bulk-status-apply">Apply</button>
+              <button onClick={() => setSelected([])} className="text-xs text-gray-500 hover:text-[#9B111E]">Clear</button>
+            </div>
+          )}
+
           {loading ? (
             <div className="flex justify-center py-20"><div className="animate-spin h-10 w-10 rounded-full border-4 border-[#D4AF37] border-t-transparent" /></div>
           ) : (
@@ -112,10 +155,16 @@ export default function AdminOrders() {
               {filtered.map(order => (
                 <div key={order.id} className="bg-white rounded-xl border border-[#E6D5BC] p-4" data-testid={`admin-order-${order.id}`}>
                   <div className="flex flex-wrap items-start justify-between gap-3 mb-3">
-                    <div>
-                      <p className="font-bold text-[#9B111E] font-mono text-sm">#{order.order_number}</p>
-                      <p className="text-xs text-gray-500">{new Date(order.created_at).toLocaleString('en-IN')}</p>
-                      <p className="text-sm font-medium text-[#2A2A2A]">{order.user_name} · {order.user_phone}</p>
+                    <div className="flex items-start gap-3">
+                      {TRANSITIONS[order.status]?.length > 0 && (
+                        <input type="checkbox" checked={selected.includes(order.id)} onChange={() => toggleSelected(order.id)}
+                          className="mt-1 accent-[#9B111E]" data-testid={`select-order-${order.id}`} />
+                      )}
+                      <div>
+                        <p className="font-bold text-[#9B111E] font-mono text-sm">#{order.order_number}</p>
+                        <p className="text-xs text-gray-500">{new Date(order.created_at).toLocaleString('en-IN')}</p>
+                        <p className="text-sm font-medium text-[#2A2A2A]">{order.user_name} · {order.user_phone}</p>
+                      </div>
                     </div>
                     <div className="flex items-center gap-2">
                       <span className={`text-xs px-2 py-1 rounded-full font-bold ${STATUS_COLORS[order.status]}`}>{order.status}</span>
@@ -127,16 +176,18 @@ export default function AdminOrders() {
                   <p className="text-xs text-gray-500 mb-3">{order.items?.length} items · {order.payment_method?.toUpperCase()} · {order.delivery_type}</p>
 
                   {/* Status Update */}
-                  <div className="flex flex-wrap gap-2 items-center">
-                    <span className="text-xs font-semibold text-gray-500">Update:</span>
-                    {STATUSES.filter(s => s !== order.status && s !== 'placed').map(s => (
-                      <button key={s} onClick={() => updateStatus(order.id, s)}
-                        className={`text-xs px-2 py-1 rounded-full border font-medium transition-all hover:scale-105 ${STATUS_COLORS[s]?.replace('bg-', 'border-').replace('-100', '-300') || ''} ${STATUS_COLORS[s]}`}
-                        data-testid={`update-status-${order.id}-${s}`}>
-                        {s.replace('_', ' ')}
-                      </button>
-                    ))}
-                  </div>
+                  {TRANSITIONS[order.status]?.length > 0 && (
+                    <div className="flex flex-wrap gap-2 items-center">
+                      <span className="text-xs font-semibold text-gray-500">Update:</span>
+                      {TRANSITIONS[order.status].map(s => (
+                        <button key={s} onClick={() => updateStatus(order.id, s)}
+                          className={`text-xs px-2 py-1 rounded-full border font-medium transition-all hover:scale-105 ${STATUS_COLORS[s]?.replace('bg-', 'border-').replace('-100', '-300') || ''} ${STATUS_COLORS[s]}`}
+                          data-testid={`update-status-${order.id}-${s}`}>
+                          {s.replace('_', ' ')}
+                        </button>
+                      ))}
+                    </div>
+                  )}
 
                   {/* Assign Delivery Partner */}
                   {['packed', 'out_for_delivery'].includes(order.status) && partners.length > 0 && (
@@ -8,7 +8,10 @@ import { toast } from "sonner";
 
 const API = `${process.env.REACT_APP_BACKEND_URL}/api`;
 
-const EMPTY_FORM = { name: '', name_hi: '', description: '', description_hi: '', category_slug: '', prices: { g250: '', g500: '', g1000: '' }, images: [''], ingredients: '', shelf_life: '', in_stock: true, featured: false, badge: '' };
+const EMPTY_FORM = { name: '', name_hi: '', description: '', description_hi: '', category_slug: '', prices: { g250: '', g500: '', g1000: '' }, images: [''], ingredients: '', shelf_life: '', in_stock: true, featured: false, badge: '', stock: { g250: '', g500: '', g1000: '' } };
+const WEIGHT_KEYS = ['g250', 'g500', 'g1000'];
+// empty stock field = weight not tracked
+const parseStock = (stock) => Object.fromEntries(WEIGHT_KEYS.map(k => [k, stock[k] === '' ? null : parseInt(stock[k], 10)]));
 
 export default function AdminProducts() {
   const [products, setProducts] = useState([]);
@@ -38,7 +41,7 @@ export default function AdminProducts() {
   const fetchData = async () => {
     try {
       const [prodRes, catRes] = await Promise.all([
-        axios.get(`${API}/products`, { headers: authHeaders() }),
+        axios.get(`${API}/products`, { params: { fields: '*' }, headers: authHeaders() }),
         axios.get(`${API}/categories`),
       ]);
       setProducts(prodRes.data);
@@ -54,15 +57,17 @@ export default function AdminProducts() {
       name: p.name, name_hi: p.name_hi, description: p.description, description_hi: p.description_hi || '',
       category_slug: p.category_slug, prices: p.prices || { g250: '', g500: '', g1000: '' },
       images: p.images?.length ? p.images : [''], ingredients: p.ingredients || '',
-      shelf_life: p.shelf_life || '', in_stock: p.in_stock, featured: p.featured, badge: p.badge || ''
+      shelf_life: p.shelf_life || '', in_stock: p.in_stock, featured: p.featured, badge: p.badge || '',
+      stock: Object.fromEntries(WEIGHT_KEYS.map(k => [k, p.stock?.[k] ?? ''])),
     });
     setShowModal(true);
   };
 
   const handleSave = async () => {
     if (!form.name || !form.category_slug) { toast.error("Name and category required"); return; }
+    const { stock, ...rest } = form;
     const data = {
-      ...form,
+      ...rest,
       prices: { g250: parseFloat(form.prices.g250) || 0, g500: parseFloat(form.prices.g500) || 0, g1000: parseFloat(form.prices.g1000) || 0 },
       images: form.images.filter(Boolean),
       badge: form.badge || null,
@@ -70,9 +75,15 @@ export default function AdminProducts() {
     try {
       if (editProduct) {
         await axios.put(`${API}/products/${editProduct.id}`, data, { headers: authHeaders() });
+        // only touched weights are sent, so a save never overwrites sales made meanwhile
+        const changed = Object.fromEntries(Object.entries(parseStock(stock))
+          .filter(([k, v]) => v !== (editProduct.stock?.[k] ?? null)));
+        if (Object.keys(changed).length) {
+          await axios.put(`${API}/admin/products/${editProduct.id}/stock`, changed, { headers: authHeaders() });
+        }
         toast.success("Product updated!");
       } else {
-        await axios.post(`${API}/products`, data, { headers: authHeaders() });
+        await axios.post(`${API}/products`, { ...data, stock: parseStock(stock) }, { headers: authHeaders() });
         toast.success("Product added!");
       }
       setShowModal(false);
@@ -80,6 +91,19 @@ export default function AdminProducts() {
     } catch (e) { toast.error(e.response?.data?.detail || "Error saving product"); }
   };
 
+  const uploadImage = async (e) => {
+    const file = e.target.files?.[0];
+    if (!file) return;
+    const body = new FormData();
+    body.append('file', file);
+    try {
+      const r = await axios.post(`${API}/admin/images`, body, { headers: authHeaders() });
+      f('images', [r.data.url]);
+      toast.success("Image uploaded");
+    } catch (err) { toast.error(err.response?.data?.detail || "Upload failed"); }
+    e.target.value = '';
+  };
+
   const handleDelete = async (id, name) => {
     if (!window.confirm(`Delete "${name}"?`)) return;
     try {
@@ -113,6 +137,7 @@ export default function AdminProducts() {
 
   const f = (key, value) => setForm(p => ({ ...p, [key]: value }));
   const fp = (key, value) => setForm(p => ({ ...p, prices: { ...p.prices, [key]: value } }));
+  const fs = (key, value) => setForm(p => ({ ...p, stock: { ...p.stock, [key]: value } }));
 
   return (
     <div className="flex h-screen bg-[#FFF6E5]">
@@ -232,9 +257,18 @@ export default function AdminProducts() {
                   </div>
                 ))}
               </div>
+              <div className="grid grid-cols-3 gap-3">
+                {[['g250', '250g stock'], ['g500', '500g stock'], ['g1000', '1kg stock']].map(([key, label]) => (
+                  <div key={key}>
+                    <label className="text-xs font-semibold text-gray-500 block mb-1">{label}</label>
+                    <input type="number" min="0" placeholder="Untracked" className="w-full border-2 border-[#E6D5BC] rounded-lg px-3 py-2 text-sm" value={form.stock[key]} onChange={e => fs(key, e.target.value)} data-testid={`stock-${key}`} />
+                  </div>
+                ))}
+              </div>
               <div>
                 <label className="text-xs font-semibold text-gray-500 block mb-1">Image URL</label>
                 <input className="w-full border-2 border-[#E6D5BC] rounded-lg px-3 py-2 text-sm" value={form.images[0]} onChange={e => f('images', [e.target.value])} />
+                <input type="file" accept="image/jpeg,image/png,image/webp,image/gif" className="mt-2 text-xs" onChange={uploadImage} data-testid="product-image-upload" />
               </div>
               <div className="grid grid-cols-2 gap-3">
                 <div>
@@ -6,6 +6,7 @@ import Navbar from "@/components/Navbar";
 import MobileNav from "@/components/MobileNav";
 import { useAuth } from "@/contexts/AuthContext";
 import { useLanguage } from "@/contexts/LanguageContext";
+import { useOrderEvents, upsertOrder } from "@/hooks/use-order-events";
 import { toast } from "sonner";
 
 const API = `${process.env.REACT_APP_BACKEND_URL}/api`;
@@ -28,6 +29,8 @@ export default function DeliveryPanel() {
     fetchOrders();
   }, [user]);
 
+  useOrderEvents(order => setOrders(prev => upsertOrder(prev, order)), () => fetchOrders());
+
   const fetchOrders = async () => {
     setLoading(true);
     try {